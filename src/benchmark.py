@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+import gurobipy as gb
+from gurobipy import GRB
+from src.classes import Cluster, Satellite
+from src.models import ModelDeterministic
+from src.utils import LoadingData, ConfigDeterministic
+from src.synthetic import SyntheticInstance
+from src.costs import CostDeterministic
+from src.instrumentation import max_rss_mb
+
+
+def benchmark_formulations(satellites: list[Satellite], clusters: list[Cluster], vehicles_required: dict[str, dict],
+                           costs: dict[str, dict], periods: int, formulations: tuple = ModelDeterministic.FORMULATIONS,
+                           builder: str = 'build_matrix', mip_gap: float = 0.01, time_limit: float = None,
+                           params: dict = None, candidates=None) -> list[dict]:
+    """
+    Builds and solves ModelDeterministic once per formulation and returns one row per formulation with the model
+    size (rows, columns, nonzeros), the build time and Python peak memory of the build, Gurobi's peak memory, and
+    the time to reach mip_gap (None when the time limit stops it first). builder is 'build' or 'build_matrix'.
+    """
+    rows = []
+    for formulation in formulations:
+        model = ModelDeterministic(periods=periods, formulation=formulation)
+        model.setParams(dict({'OutputFlag': 0, 'MIPGap': mip_gap}, **(params or {})))
+        if time_limit is not None:
+            model.setParams({'TimeLimit': time_limit})
+
+        tracemalloc.start()
+        start = time.time()
+        getattr(model, builder)(satellites, clusters, vehicles_required, costs, candidates=candidates)
+        time_building = time.time() - start
+        _, memory_building = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        status = model.optimizeModel()
+        solved = model.model.SolCount > 0
+        reached = solved and (status == GRB.OPTIMAL or model.model.MIPGap <= mip_gap)
+        rows.append({
+            'formulation': formulation,
+            'builder': builder,
+            'constraints': model.model.NumConstrs,
+            'variables': model.model.NumVars,
+            'nonzeros': model.model.NumNZs,
+            'time_building': time_building,
+            'memory_building_mb': memory_building / 2 ** 20,
+            'memory_solver_gb': model.model.MaxMemUsed,
+            'status': status,
+            'runtime': model.model.Runtime,
+            'time_to_gap': model.model.Runtime if reached else None,
+            'objective': model.model.ObjVal if solved else None,
+            'gap': model.model.MIPGap if solved else None,
+            'lazy_constraints': model.metrics.get('lazy_constraints')
+        })
+        model.model.dispose()
+    return rows
+
+
+def version() -> dict[str, str]:
+    """Commit of the working tree (when it is a git checkout) and versions of the main dependencies."""
+    info = {'numpy': np.__version__, 'pandas': pd.__version__, 'gurobi': '.'.join(map(str, gb.gurobi.version()))}
+    try:
+        info['commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                        cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        info['commit'] = None
+    return info
+
+
+def benchmark_scaling(ladder: list[tuple[int, int, int]], directory: str = None, output: str = 'benchmark.jsonl',
+                      seed: int = 0, builder: str = 'build_matrix', formulation: str = 'disaggregated',
+                      params: dict = None, track_memory: bool = True, costs: CostDeterministic = None) -> list[dict]:
+    """
+    Runs the pipeline on synthetic instances of every (S, K, T) of the ladder and times each stage on its own:
+    loading (LoadingData from the generated CSVs), fleet sizing (ConfigDeterministic tensors), costs, build,
+    optimize and get_results. Each stage reports seconds and, with track_memory, its Python peak memory; the
+    rows also carry model size, throughput and the code/dependency versions, and are appended to output so that
+    runs of different versions can be compared. The CSVs go to directory (a temporary one by default).
+    costs builds the serving costs, by default a CostDeterministic with the WALDO thresholds of
+    SyntheticInstance.MIN_ITEMS and the fixed cost of the generated vehicles.
+    """
+    rows, info = [], version()
+    costs = costs or CostDeterministic(min_items_satellite=SyntheticInstance.MIN_ITEMS['satellite'],
+                                       min_items_dc=SyntheticInstance.MIN_ITEMS['dc'])
+    params = dict({'OutputFlag': 0, 'TimeLimit': 60, 'MIPGap': 0.01}, **(params or {}))
+    started_tracing = track_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        for S, K, T in ladder:
+            with tempfile.TemporaryDirectory() as temporary:
+                instance = SyntheticInstance(S, K, T, seed=seed)
+                paths = instance.write(os.path.join(directory or temporary, f'S{S}_K{K}_T{T}'))
+                vehicles = instance.vehicles()
+                stages = {}
+
+                def stage(name: str, function):
+                    if track_memory:
+                        tracemalloc.reset_peak()
+                    start = time.perf_counter()
+                    value = function()
+                    stages[name] = {'seconds': time.perf_counter() - start}
+                    if track_memory:
+                        stages[name]['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                    return value
+
+                satellites, _ = stage('loading_satellites', lambda: LoadingData.load_satellites(
+                    path=paths['satellites']))
+                clusters, _ = stage('loading_clusters', lambda: LoadingData.load_customer_clusters(
+                    path=paths['clusters']))
+                matrix_satellites = stage('loading_matrix_satellites', lambda: LoadingData.
+                                          load_distance_matrix_from_satellite(paths['matrix_satellites']))
+                matrix_dc = stage('loading_matrix_dc', lambda: LoadingData.load_distance_matrix_from_dc(
+                    paths['matrix_dc']))
+                satellites, clusters = list(satellites.values()), list(clusters.values())
+
+                config = ConfigDeterministic()
+                vehicles_required = {
+                    'small': stage('fleet_size_satellites', lambda: config.calculate_fleet_size_tensor_from_satellites(
+                        satellites, clusters, vehicles['small'], T, matrix_satellites)),
+                    'large': stage('fleet_size_dc', lambda: config.calculate_fleet_size_tensor_from_dc(
+                        clusters, vehicles['large'], T, matrix_dc))
+                }
+                cost = stage('costs', lambda: costs.build(satellites, clusters, vehicles_required, T, matrix_satellites,
+                                                          matrix_dc, vehicles=vehicles))
+
+                model = ModelDeterministic(periods=T, formulation=formulation)
+                model.setParams(params)
+                stage('build', lambda: getattr(model, builder)(satellites, clusters, vehicles_required, cost))
+                status = stage('optimize', model.optimizeModel)
+                solved = model.model.SolCount > 0
+                if solved:
+                    stage('get_results', lambda: model.get_results(satellites, clusters))
+
+                row = {'S': S, 'K': K, 'T': T, 'seed': seed, 'builder': builder, 'formulation': formulation,
+                       'variables': model.model.NumVars, 'constraints': model.model.NumConstrs,
+                       'nonzeros': model.model.NumNZs, 'status': status,
+                       'objective': model.model.ObjVal if solved else None,
+                       'gap': model.model.MIPGap if solved else None, 'stages': stages,
+                       'variables_per_second_build': model.model.NumVars / max(stages['build']['seconds'], 1e-9),
+                       'max_rss_mb': max_rss_mb(), 'time': time.time(), **info}
+                model.model.dispose()
+                rows.append(row)
+                if output is not None:
+                    with open(output, 'a') as file:
+                        file.write(json.dumps(row, default=str) + '\n')
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    return rows
+
+
+def _memory_run(paths: dict, periods: int, vehicles: dict, costs: CostDeterministic, lean: bool, builder: str,
+                params: dict, solve: bool) -> dict:
+    """One mode of benchmark_memory, run in a fresh process so that its peak RSS is its own."""
+    row = {'rss_start_mb': max_rss_mb()}
+    start = time.perf_counter()
+    if lean:
+        satellites, _ = LoadingData.load_satellite_arrays(path=paths['satellites'])
+        clusters, _ = LoadingData.load_cluster_arrays(path=paths['clusters'])
+    else:
+        satellites, clusters = [list(LoadingData.load_satellites(path=paths['satellites'])[0].values()),
+                                list(LoadingData.load_customer_clusters(path=paths['clusters'])[0].values())]
+    matrix_satellites = LoadingData.load_distance_matrix_from_satellite(paths['matrix_satellites'])
+    matrix_dc = LoadingData.load_distance_matrix_from_dc(paths['matrix_dc'])
+    config = ConfigDeterministic()
+    vehicles_required = {
+        'small': config.calculate_fleet_size_tensor_from_satellites(satellites, clusters, vehicles['small'], periods,
+                                                                    matrix_satellites),
+        'large': config.calculate_fleet_size_tensor_from_dc(clusters, vehicles['large'], periods, matrix_dc)
+    }
+    cost = costs.build(satellites, clusters, vehicles_required, periods, matrix_satellites, matrix_dc,
+                       vehicles=vehicles)
+    if builder == 'build':
+        satellite_ids, cluster_ids = [s.id for s in satellites], [k.id for k in clusters]
+        cost = costs.as_dict(cost, satellite_ids, cluster_ids)
+        vehicles_required = {
+            'small': ConfigDeterministic.tensor_to_dict(vehicles_required['small'], satellite_ids, cluster_ids),
+            'large': ConfigDeterministic.tensor_to_dict(vehicles_required['large'], cluster_ids)
+        }
+    row['seconds_inputs'] = time.perf_counter() - start
+
+    model = ModelDeterministic(periods=periods, lean=lean)
+    model.setParams(params)
+    start = time.perf_counter()
+    getattr(model, builder)(satellites, clusters, vehicles_required, cost)
+    row['seconds_build'] = time.perf_counter() - start
+    row['rss_build_mb'] = max_rss_mb()
+    if solve:
+        row['status'] = model.optimizeModel()
+        row['objective'] = model.model.ObjVal if model.model.SolCount > 0 else None
+    row.update(variables=model.model.NumVars, constraints=model.model.NumConstrs, nonzeros=model.model.NumNZs,
+               max_rss_mb=max_rss_mb())
+    model.model.dispose()
+    return row
+
+
+def benchmark_memory(S: int, K: int, T: int, directory: str = None, seed: int = 0, builder: str = 'build',
+                     solve: bool = False, params: dict = None, costs: CostDeterministic = None) -> dict[str, dict]:
+    """
+    Peak resident memory of the pipeline on one synthetic instance, in the default mode (Satellite/Cluster
+    objects, the given builder, named variables and constraints keyed by id tuples) and in lean mode (array
+    containers, build_matrix with lean=True). Each mode runs in its own spawned process; rss_start_mb is the peak
+    after the imports, rss_build_mb after the build and max_rss_mb at the end (after the solve when solve=True).
+    Returns one row per mode plus their ratio under 'saving'.
+    """
+    import multiprocessing
+    costs = costs or CostDeterministic(min_items_satellite=SyntheticInstance.MIN_ITEMS['satellite'],
+                                       min_items_dc=SyntheticInstance.MIN_ITEMS['dc'])
+    params = dict({'OutputFlag': 0, 'TimeLimit': 60, 'MIPGap': 0.01}, **(params or {}))
+    rows = {}
+    with tempfile.TemporaryDirectory() as temporary:
+        instance = SyntheticInstance(S, K, T, seed=seed)
+        paths = instance.write(os.path.join(directory or temporary, f'S{S}_K{K}_T{T}'))
+        context = multiprocessing.get_context('spawn')
+        for mode, lean, mode_builder in (('default', False, builder), ('lean', True, 'build_matrix')):
+            with context.Pool(1) as pool:
+                rows[mode] = pool.apply(_memory_run, (paths, T, instance.vehicles(), costs, lean, mode_builder,
+                                                      params, solve))
+            rows[mode].update(S=S, K=K, T=T, seed=seed, builder=mode_builder)
+    rows['saving'] = {'max_rss': 1 - rows['lean']['max_rss_mb'] / rows['default']['max_rss_mb'],
+                      'build_rss': 1 - (rows['lean']['rss_build_mb'] - rows['lean']['rss_start_mb']) /
+                      max(rows['default']['rss_build_mb'] - rows['default']['rss_start_mb'], 1e-9)}
+    return rows
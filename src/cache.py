@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+CACHE_VERSION = 1
+
+
+class InputCache:
+    """
+    On-disk cache of preprocessed inputs. Each entry is a directory holding one .npy file per array, opened
+    memory-mapped on load, and a meta.json with the non-array data (ids, keys). Entries are keyed on the
+    content of the source files plus the loader options, so editing a CSV produces a new key and the old entry
+    ages out through evict().
+    """
+
+    def __init__(self, directory: str = '../others/cache', max_bytes: int = 2 * 1024 ** 3,
+                 max_age_days: float = 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def hash_file(path: str, block_size: int = 1 << 20) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(block_size), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def key(self, name: str, paths: list[str], options: dict = None) -> str:
+        digest = hashlib.sha256()
+        digest.update(json.dumps([CACHE_VERSION, name, options or {}], sort_keys=True, default=str).encode())
+        for path in paths:
+            digest.update(self.hash_file(path).encode())
+        return f'{name}-{digest.hexdigest()[:32]}'
+
+    def __entry(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def load(self, key: str) -> tuple[dict[str, np.ndarray], dict]:
+        entry = self.__entry(key)
+        path_meta = os.path.join(entry, 'meta.json')
+        if not os.path.exists(path_meta):
+            return None
+        with open(path_meta) as file:
+            content = json.load(file)
+        arrays = dict([
+            (name, np.load(os.path.join(entry, f'{i}.npy'), mmap_mode='r')) for i, name in enumerate(content['arrays'])
+        ])
+        # mark as recently used for the size-based eviction
+        os.utime(path_meta)
+        return arrays, content['meta']
+
+    def store(self, key: str, arrays: dict[str, np.ndarray], meta: dict) -> None:
+        entry = self.__entry(key)
+        staging = tempfile.mkdtemp(prefix=f'.{key}-', dir=self.directory)
+        names = list(arrays.keys())
+        for i, name in enumerate(names):
+            np.save(os.path.join(staging, f'{i}.npy'), np.ascontiguousarray(arrays[name]))
+        with open(os.path.join(staging, 'meta.json'), 'w') as file:
+            json.dump({'arrays': names, 'meta': meta}, file)
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # another process stored the same key first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def get_or_build(self, name: str, paths: list[str], build, restore, options: dict = None):
+        """
+        Returns restore(arrays, meta) from the cached entry when there is one. Otherwise calls build(), whose
+        result must provide to_arrays(), stores it and evicts stale entries.
+        """
+        key = self.key(name, paths, options)
+        cached = self.load(key)
+        if cached is not None:
+            return restore(*cached)
+        obj = build()
+        self.store(key, *obj.to_arrays())
+        self.evict()
+        return obj
+
+    def entries(self) -> list[dict]:
+        entries = []
+        for key in os.listdir(self.directory):
+            entry = self.__entry(key)
+            path_meta = os.path.join(entry, 'meta.json')
+            if key.startswith('.') or not os.path.exists(path_meta):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry))
+            entries.append({'key': key, 'size': size, 'last_used': os.path.getmtime(path_meta)})
+        return entries
+
+    def evict(self, max_bytes: int = None, max_age_days: float = None) -> list[str]:
+        """Removes entries unused for max_age_days, then the least recently used ones until under max_bytes."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age_days = self.max_age_days if max_age_days is None else max_age_days
+        entries = sorted(self.entries(), key=lambda item: item['last_used'])
+        total = sum(item['size'] for item in entries)
+        now = time.time()
+        removed = []
+        for item in entries:
+            if now - item['last_used'] > max_age_days * 86400 or total > max_bytes:
+                shutil.rmtree(self.__entry(item['key']), ignore_errors=True)
+                total -= item['size']
+                removed.append(item['key'])
+        return removed
+
+    def remove(self, key: str) -> bool:
+        """Evicts one entry; False when there was none."""
+        entry = self.__entry(key)
+        if not os.path.exists(entry):
+            return False
+        shutil.rmtree(entry, ignore_errors=True)
+        return True
+
+    def clear(self) -> None:
+        for item in self.entries():
+            shutil.rmtree(self.__entry(item['key']), ignore_errors=True)
+
+
+def digest(*objects) -> str:
+    """
+    Content hash of nested dicts, lists, tuples, numpy arrays, scalars and plain objects (through their
+    __slots__ and __dict__). Dicts are hashed in insertion order, since that order decides the order of the model
+    variables.
+    """
+    hasher = hashlib.sha256()
+
+    def update(obj) -> None:
+        if isinstance(obj, np.ndarray):
+            array = np.ascontiguousarray(obj)
+            hasher.update(f'array{array.dtype.str}{array.shape}'.encode())
+            hasher.update(array.tobytes())
+        elif isinstance(obj, dict):
+            hasher.update(f'dict{len(obj)}'.encode())
+            for key, value in obj.items():
+                update(key)
+                update(value)
+        elif isinstance(obj, (list, tuple)):
+            hasher.update(f'{type(obj).__name__}{len(obj)}'.encode())
+            for value in obj:
+                update(value)
+        elif obj is None or isinstance(obj, (str, bool, int, float, np.generic)):
+            hasher.update(f'{type(obj).__name__}:{obj!r};'.encode())
+        elif hasattr(obj, '__dict__') or hasattr(obj, '__slots__'):
+            hasher.update(type(obj).__name__.encode())
+            names = [name for cls in type(obj).__mro__ for name in getattr(cls, '__slots__', ())]
+            update(dict([(name, getattr(obj, name)) for name in names if hasattr(obj, name)]))
+            update(getattr(obj, '__dict__', {}))
+        else:
+            hasher.update(repr(obj).encode())
+
+    for obj in objects:
+        update(obj)
+    return hasher.hexdigest()
+
+
+class ModelCache(InputCache):
+    """
+    On-disk cache of built models, keyed on the content of the build inputs (digest). Each entry holds the
+    model as a compressed MPS (REW) file and a meta.json with the variable and constraint index maps, so that a model
+    can be read back without running the Python-side build. meta.json also records the checksum of the model
+    file, checked by verify. Eviction (evict, remove, clear) works as in InputCache.
+    """
+    # MPS with generic row and column names, so that ids with spaces or symbols survive the round trip
+    MODEL_FILE = 'model.rew.gz'
+
+    def __init__(self, directory: str = '../others/cache/models', max_bytes: int = 2 * 1024 ** 3,
+                 max_age_days: float = 30):
+        super().__init__(directory, max_bytes, max_age_days)
+
+    def key_inputs(self, name: str, *inputs, options: dict = None) -> str:
+        return f'{name}-{digest(CACHE_VERSION, name, options or {}, *inputs)[:32]}'
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key, self.MODEL_FILE)
+
+    def lookup(self, key: str) -> tuple[str, dict]:
+        """Path of the model file and the stored meta, or None on a miss."""
+        path_meta = os.path.join(self.directory, key, 'meta.json')
+        if not os.path.exists(path_meta) or not os.path.exists(self.path(key)):
+            return None
+        with open(path_meta) as file:
+            content = json.load(file)
+        os.utime(path_meta)
+        return self.path(key), content['meta']
+
+    def save(self, key: str, write, meta: dict) -> None:
+        """Stores an entry: write(path) writes the model file, meta goes to meta.json with its checksum."""
+        entry = os.path.join(self.directory, key)
+        staging = tempfile.mkdtemp(prefix=f'.{key}-', dir=self.directory)
+        write(os.path.join(staging, self.MODEL_FILE))
+        with open(os.path.join(staging, 'meta.json'), 'w') as file:
+            json.dump({'arrays': [], 'meta': meta, 'version': CACHE_VERSION,
+                       'checksum': self.hash_file(os.path.join(staging, self.MODEL_FILE))}, file)
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+
+    def verify(self, key: str = None, remove: bool = False) -> dict[str, bool]:
+        """
+        Checks that the entries (all of them, or key) are complete, of the current CACHE_VERSION and that the
+        model file matches its checksum. With remove=True the invalid ones are evicted.
+        """
+        keys = [key] if key is not None else [item['key'] for item in self.entries()]
+        valid = {}
+        for item in keys:
+            path_meta = os.path.join(self.directory, item, 'meta.json')
+            try:
+                with open(path_meta) as file:
+                    content = json.load(file)
+                valid[item] = content.get('version') == CACHE_VERSION and \
+                    self.hash_file(self.path(item)) == content.get('checksum')
+            except (OSError, ValueError):
+                valid[item] = False
+            if remove and not valid[item]:
+                self.remove(item)
+        return valid
@@ -1,4 +1,16 @@
+import numpy as np
+
+
+def attributes(obj) -> dict:
+    """Attributes of a slotted domain object as a dict (what __dict__ gave before the classes had __slots__)."""
+    names = [name for cls in type(obj).__mro__ for name in getattr(cls, '__slots__', ())]
+    return dict([(name, getattr(obj, name)) for name in names if hasattr(obj, name)])
+
+
+# the domain classes use __slots__: at millions of objects the per-instance __dict__ dominates their memory
 class Locatable:
+    __slots__ = ('lon', 'lat')
+
     def __init__(self
                  , lon: float
                  , lat: float):
@@ -7,6 +19,9 @@ class Locatable:
 
 
 class Cluster(Locatable):
+    __slots__ = ('id', 'areaKm', 'customersByPeriod', 'demandByPeriod', 'avgDrop', 'avgStopDensity', 'speed_intra',
+                 'k')
+
     def __init__(self,
                  id_c: str,
                  lon: float, lat: float,
@@ -30,6 +45,9 @@ class Cluster(Locatable):
 
 
 class Satellite(Locatable):
+    __slots__ = ('id', 'distanceFromDC', 'durationFromDC', 'durationInTrafficFromDC', 'costFixed', 'costOperation',
+                 'costSourcing', 'capacity')
+
     def __init__(self,
                  id_s: str,
                  lon: float, lat: float,
@@ -54,6 +72,9 @@ class Satellite(Locatable):
 
 
 class Vehicle:
+    __slots__ = ('id', 'type', 'capacity', 'costFixed', 'time_fixed', 'time_service', 'time_dispatch', 'time_load',
+                 'speed_line', 'Tmax', 'k')
+
     def __init__(self
                  , id: str
                  , type: str
@@ -77,3 +98,294 @@ class Vehicle:
         self.speed_line = speed_line
         self.Tmax = Tmax
         self.k = k
+
+
+class ClusterArrays:
+    """
+    Column store of customer clusters: one entry per cluster in the 1-D arrays and one row per cluster in the
+    (clusters x periods) matrices. Cluster objects are served as views over these rows. Edits made through
+    update are tracked in .changed until pop_changed.
+    """
+    TRACKED = ('demandByPeriod', 'avgDrop', 'avgStopDensity')
+
+    def __init__(self,
+                 ids: list[str],
+                 lon: np.ndarray, lat: np.ndarray,
+                 areaKm: np.ndarray,
+                 customersByPeriod: np.ndarray,
+                 demandByPeriod: np.ndarray,
+                 avgDrop: np.ndarray,
+                 avgStopDensity: np.ndarray,
+                 speed_intra: dict[str, np.ndarray],
+                 k: np.ndarray
+                 ):
+        self.ids = [str(id_c) for id_c in ids]
+        self.index = dict([(id_c, i) for i, id_c in enumerate(self.ids)])
+        self.lon = np.ascontiguousarray(lon, dtype=float)
+        self.lat = np.ascontiguousarray(lat, dtype=float)
+        self.areaKm = np.ascontiguousarray(areaKm, dtype=float)
+        self.customersByPeriod = np.ascontiguousarray(customersByPeriod, dtype=float)
+        self.demandByPeriod = np.ascontiguousarray(demandByPeriod, dtype=float)
+        self.avgDrop = np.ascontiguousarray(avgDrop, dtype=float)
+        self.avgStopDensity = np.ascontiguousarray(avgStopDensity, dtype=float)
+        self.speed_intra = dict([(key, np.ascontiguousarray(value, dtype=float)) for key, value in speed_intra.items()])
+        self.k = np.ascontiguousarray(k, dtype=float)
+        self.changed = set()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self):
+        return (self.view(i) for i in range(len(self.ids)))
+
+    def update(self, key, **fields) -> None:
+        """
+        Sets per-period values of one cluster, e.g. update('88...ff', demandByPeriod=[...]), and marks it changed.
+        A read-only field (memory-mapped from an InputCache) is copied on its first update; views taken before that
+        keep the cached values.
+        """
+        i = self.index[key] if isinstance(key, str) else int(key)
+        for field, values in fields.items():
+            if field not in self.TRACKED:
+                raise ValueError(f'{field} is not one of {self.TRACKED}')
+            array = getattr(self, field)
+            if not array.flags.writeable:
+                array = np.array(array)
+                setattr(self, field, array)
+            array[i] = values
+        self.changed.add(i)
+
+    def pop_changed(self) -> np.ndarray:
+        """Sorted indices of the clusters updated since the last call."""
+        changed, self.changed = np.array(sorted(self.changed), dtype=np.intp), set()
+        return changed
+
+    @property
+    def periods(self) -> int:
+        return self.demandByPeriod.shape[1]
+
+    def view(self, key) -> Cluster:
+        i = self.index[key] if isinstance(key, str) else int(key)
+        return Cluster(id_c=self.ids[i]
+                       , lon=self.lon[i]
+                       , lat=self.lat[i]
+                       , areaKm=self.areaKm[i]
+                       , customersByPeriod=self.customersByPeriod[i]
+                       , demandByPeriod=self.demandByPeriod[i]
+                       , avgDrop=self.avgDrop[i]
+                       , speed_intra=dict([(key, value[i]) for key, value in self.speed_intra.items()])
+                       , avgStopDensity=self.avgStopDensity[i]
+                       , k=self.k[i]
+                       )
+
+    def views(self) -> dict[str, Cluster]:
+        return dict([(id_c, self.view(i)) for i, id_c in enumerate(self.ids)])
+
+    def to_arrays(self) -> tuple[dict[str, np.ndarray], dict]:
+        arrays = {'lon': self.lon, 'lat': self.lat, 'areaKm': self.areaKm, 'customersByPeriod': self.customersByPeriod,
+                  'demandByPeriod': self.demandByPeriod, 'avgDrop': self.avgDrop,
+                  'avgStopDensity': self.avgStopDensity, 'k': self.k}
+        arrays.update([(f'speed_intra.{key}', value) for key, value in self.speed_intra.items()])
+        return arrays, {'ids': self.ids, 'speed_intra': list(self.speed_intra.keys())}
+
+    @staticmethod
+    def from_arrays(arrays: dict[str, np.ndarray], meta: dict) -> 'ClusterArrays':
+        return ClusterArrays(ids=meta['ids']
+                             , lon=arrays['lon']
+                             , lat=arrays['lat']
+                             , areaKm=arrays['areaKm']
+                             , customersByPeriod=arrays['customersByPeriod']
+                             , demandByPeriod=arrays['demandByPeriod']
+                             , avgDrop=arrays['avgDrop']
+                             , avgStopDensity=arrays['avgStopDensity']
+                             , speed_intra=dict([(key, arrays[f'speed_intra.{key}']) for key in meta['speed_intra']])
+                             , k=arrays['k']
+                             )
+
+    def subset(self, indices) -> 'ClusterArrays':
+        indices = np.asarray(indices)
+        return ClusterArrays(ids=[self.ids[i] for i in indices]
+                             , lon=self.lon[indices]
+                             , lat=self.lat[indices]
+                             , areaKm=self.areaKm[indices]
+                             , customersByPeriod=self.customersByPeriod[indices]
+                             , demandByPeriod=self.demandByPeriod[indices]
+                             , avgDrop=self.avgDrop[indices]
+                             , avgStopDensity=self.avgStopDensity[indices]
+                             , speed_intra=dict([(key, value[indices]) for key, value in self.speed_intra.items()])
+                             , k=self.k[indices]
+                             )
+
+
+class SatelliteArrays:
+    """
+    Column store of candidate satellites. Capacity options are aligned on capacity_ids, the union of the
+    options of every satellite; an option a satellite does not offer is NaN in capacity and costFixed.
+    """
+
+    def __init__(self,
+                 ids: list[str],
+                 lon: np.ndarray, lat: np.ndarray,
+                 distanceFromDC: np.ndarray,
+                 durationFromDC: np.ndarray,
+                 durationInTrafficFromDC: np.ndarray,
+                 costFixed: np.ndarray,
+                 costOperation: np.ndarray,
+                 costSourcing: np.ndarray,
+                 capacity: np.ndarray,
+                 capacity_ids: list[str]
+                 ):
+        self.ids = [str(id_s) for id_s in ids]
+        self.index = dict([(id_s, i) for i, id_s in enumerate(self.ids)])
+        self.lon = np.ascontiguousarray(lon, dtype=float)
+        self.lat = np.ascontiguousarray(lat, dtype=float)
+        self.distanceFromDC = np.ascontiguousarray(distanceFromDC, dtype=float)
+        self.durationFromDC = np.ascontiguousarray(durationFromDC, dtype=float)
+        self.durationInTrafficFromDC = np.ascontiguousarray(durationInTrafficFromDC, dtype=float)
+        self.costFixed = np.ascontiguousarray(costFixed, dtype=float)
+        self.costOperation = np.ascontiguousarray(costOperation, dtype=float)
+        self.costSourcing = np.ascontiguousarray(costSourcing, dtype=float)
+        self.capacity = np.ascontiguousarray(capacity, dtype=float)
+        self.capacity_ids = [str(q_id) for q_id in capacity_ids]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self):
+        return (self.view(i) for i in range(len(self.ids)))
+
+    def view(self, key) -> Satellite:
+        i = self.index[key] if isinstance(key, str) else int(key)
+        available = [q for q in range(len(self.capacity_ids)) if not np.isnan(self.capacity[i, q])]
+        return Satellite(id_s=self.ids[i]
+                         , lon=self.lon[i]
+                         , lat=self.lat[i]
+                         , distanceFromDC=self.distanceFromDC[i]
+                         , durationFromDC=self.durationFromDC[i]
+                         , durationInTrafficFromDC=self.durationInTrafficFromDC[i]
+                         , costFixed=dict([(self.capacity_ids[q], self.costFixed[i, q]) for q in available])
+                         , costOperation=self.costOperation[i]
+                         , costSourcing=self.costSourcing[i]
+                         , capacity=dict([(self.capacity_ids[q], self.capacity[i, q]) for q in available])
+                         )
+
+    def views(self) -> dict[str, Satellite]:
+        return dict([(id_s, self.view(i)) for i, id_s in enumerate(self.ids)])
+
+    def to_arrays(self) -> tuple[dict[str, np.ndarray], dict]:
+        arrays = {'lon': self.lon, 'lat': self.lat, 'distanceFromDC': self.distanceFromDC,
+                  'durationFromDC': self.durationFromDC, 'durationInTrafficFromDC': self.durationInTrafficFromDC,
+                  'costFixed': self.costFixed, 'costOperation': self.costOperation, 'costSourcing': self.costSourcing,
+                  'capacity': self.capacity}
+        return arrays, {'ids': self.ids, 'capacity_ids': self.capacity_ids}
+
+    @staticmethod
+    def from_arrays(arrays: dict[str, np.ndarray], meta: dict) -> 'SatelliteArrays':
+        return SatelliteArrays(ids=meta['ids']
+                               , lon=arrays['lon']
+                               , lat=arrays['lat']
+                               , distanceFromDC=arrays['distanceFromDC']
+                               , durationFromDC=arrays['durationFromDC']
+                               , durationInTrafficFromDC=arrays['durationInTrafficFromDC']
+                               , costFixed=arrays['costFixed']
+                               , costOperation=arrays['costOperation']
+                               , costSourcing=arrays['costSourcing']
+                               , capacity=arrays['capacity']
+                               , capacity_ids=meta['capacity_ids']
+                               )
+
+
+class DistanceMatrix:
+    """
+    Distances (km) and durations (h) between origins (satellites, or the DC) and cluster H3 addresses, stored
+    as aligned (origins x destinations) arrays. Pairs missing from the source are NaN.
+    """
+    FIELDS = ('distance', 'duration', 'duration_in_traffic')
+
+    def __init__(self,
+                 origin_ids: list[str],
+                 destination_ids: list[str],
+                 distance: np.ndarray,
+                 duration: np.ndarray,
+                 duration_in_traffic: np.ndarray
+                 ):
+        self.origin_ids = [str(id_o) for id_o in origin_ids]
+        self.destination_ids = [str(id_d) for id_d in destination_ids]
+        self.origin_index = dict([(id_o, i) for i, id_o in enumerate(self.origin_ids)])
+        self.destination_index = dict([(id_d, j) for j, id_d in enumerate(self.destination_ids)])
+        self.distance = np.ascontiguousarray(distance, dtype=float)
+        self.duration = np.ascontiguousarray(duration, dtype=float)
+        self.duration_in_traffic = np.ascontiguousarray(duration_in_traffic, dtype=float)
+
+    @property
+    def mask(self) -> np.ndarray:
+        return ~np.isnan(self.distance)
+
+    def __getitem__(self, key: tuple[str, str] | str) -> float:
+        """
+        Distance of an (origin, destination) pair, or of a destination alone on a single-origin (DC) matrix. As the
+        legacy dict, ids outside the axes and missing pairs raise KeyError; take(..., strict=False) keeps NaN.
+        """
+        id_o, id_d = (self.origin_ids[0], key) if isinstance(key, str) and len(self.origin_ids) == 1 else key
+        if id_o not in self.origin_index or id_d not in self.destination_index:
+            raise KeyError(key)
+        value = self.distance[self.origin_index[id_o], self.destination_index[id_d]]
+        if np.isnan(value):
+            raise KeyError(key)
+        return value
+
+    def origins(self, ids: list[str]) -> np.ndarray:
+        return np.array([self.origin_index[id_o] for id_o in ids], dtype=np.intp)
+
+    def destinations(self, ids: list[str]) -> np.ndarray:
+        return np.array([self.destination_index[id_d] for id_d in ids], dtype=np.intp)
+
+    def lookup(self, origins: np.ndarray, destinations: np.ndarray, field: str = 'distance') -> np.ndarray:
+        """Element-wise lookup of (origin, destination) index pairs; the index arrays are broadcast."""
+        return getattr(self, field)[origins, destinations]
+
+    def take(self, origin_ids: list[str], destination_ids: list[str], field: str = 'distance',
+             strict: bool = True) -> np.ndarray:
+        """(len(origin_ids) x len(destination_ids)) block of a field. With strict, missing pairs raise KeyError."""
+        block = getattr(self, field)[np.ix_(self.origins(origin_ids), self.destinations(destination_ids))]
+        if strict and np.isnan(block).any():
+            i, j = np.argwhere(np.isnan(block))[0]
+            raise KeyError((origin_ids[i], destination_ids[j]))
+        return block
+
+    def as_dict(self, field: str = 'distance') -> dict[tuple[str, str], float]:
+        values = getattr(self, field)
+        return dict([
+            ((self.origin_ids[i], self.destination_ids[j]), values[i, j]) for i, j in np.argwhere(self.mask)
+        ])
+
+    def to_arrays(self) -> tuple[dict[str, np.ndarray], dict]:
+        arrays = dict([(field, getattr(self, field)) for field in self.FIELDS])
+        return arrays, {'origin_ids': self.origin_ids, 'destination_ids': self.destination_ids}
+
+    @staticmethod
+    def from_arrays(arrays: dict[str, np.ndarray], meta: dict) -> 'DistanceMatrix':
+        return DistanceMatrix(origin_ids=meta['origin_ids'], destination_ids=meta['destination_ids'], **arrays)
+
+
+class Instance:
+    def __init__(self
+                 , satellites: SatelliteArrays
+                 , clusters: ClusterArrays):
+        self.satellites = satellites
+        self.clusters = clusters
+
+    def to_arrays(self) -> tuple[dict[str, np.ndarray], dict]:
+        arrays, meta = {}, {}
+        for name, container in [('satellites', self.satellites), ('clusters', self.clusters)]:
+            arrays_container, meta[name] = container.to_arrays()
+            arrays.update([(f'{name}.{key}', value) for key, value in arrays_container.items()])
+        return arrays, meta
+
+    @staticmethod
+    def from_arrays(arrays: dict[str, np.ndarray], meta: dict) -> 'Instance':
+        def select(prefix: str) -> dict[str, np.ndarray]:
+            return dict([(key[len(prefix):], value) for key, value in arrays.items() if key.startswith(prefix)])
+
+        return Instance(satellites=SatelliteArrays.from_arrays(select('satellites.'), meta['satellites'])
+                        , clusters=ClusterArrays.from_arrays(select('clusters.'), meta['clusters']))
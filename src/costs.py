@@ -0,0 +1,112 @@
+import numpy as np
+from src.classes import Satellite, Cluster, Vehicle, SatelliteArrays, ClusterArrays
+from src.utils import ConfigDeterministic, object_ids, satellite_distances, dc_distances
+from src.instrumentation import timed
+from src.models import values_to_array
+
+
+def shipping_rates(distance: np.ndarray, rate_min: float, rate_max: float) -> np.ndarray:
+    """
+    Per-item shipping rate growing linearly with the linehaul distance along the last axis, from rate_min at the
+    nearest cluster to rate_max at the farthest one (application.ipynb).
+    """
+    low, high = distance.min(axis=-1, keepdims=True), distance.max(axis=-1, keepdims=True)
+    interval = np.maximum(high - low, 1e-9)
+    return (rate_max - rate_min) / interval * (distance - low) + rate_min
+
+
+class CostDeterministic:
+    """
+    Serving costs of the README, c_sk^t for satellite s serving cluster k and g_k^t for the DC serving cluster k:
+
+        c_sk^t = c^first_s d_k^t + c^shipping_sk d_k^t + c^fixed nu_sk^t
+        g_k^t  = c^shipping_k d_k^t + c^fixed nu_k^t
+
+    computed for every (s, k, t) and (k, t) at once. Shipping rates follow application.ipynb; the fixed vehicle
+    cost is the costFixed of the vehicles passed to build, and 0 without them as in the notebook. build returns
+    one (S, K, T) array per component under 'satellite' and one (K, T) array under 'dc', which ModelDeterministic
+    reads directly; as_dict converts them to the legacy dicts keyed by (s, k, t) and (k, t).
+    """
+
+    def __init__(self,
+                 shipping_satellite: tuple[float, float] = (0.335, 0.421),
+                 shipping_dc: tuple[float, float] = (0.264, 0.389),
+                 min_items_satellite: float = 115,
+                 min_items_dc: float = 290) -> None:
+        self.shipping_satellite = shipping_satellite
+        self.shipping_dc = shipping_dc
+        self.min_items_satellite = min_items_satellite
+        self.min_items_dc = min_items_dc
+
+    @timed('costs')
+    def build(self, satellites: list[Satellite]
+              , clusters: list[Cluster]
+              , vehicles_required: dict[str, dict]
+              , periods: int
+              , distances_satellites
+              , distances_dc
+              , vehicles: dict[str, Vehicle] = None
+              , as_dict: bool = False) -> dict:
+        """
+        vehicles_required holds the fleet sizes under 'small' (from satellites) and 'large' (from the DC), as
+        tensors or legacy dicts; the distances are anything satellite_distances and dc_distances accept.
+        """
+        satellite_ids, cluster_ids = object_ids(satellites), object_ids(clusters)
+        if isinstance(satellites, SatelliteArrays):
+            sourcing = satellites.costSourcing
+        else:
+            sourcing = np.array([s.costSourcing for s in satellites], dtype=float)
+        rate_satellite, rate_dc = self.rates(satellite_ids, cluster_ids, distances_satellites, distances_dc)
+        costs = self.combine(sourcing=sourcing
+                             , demand=self.__demand(clusters, periods)
+                             , rate_satellite=rate_satellite
+                             , rate_dc=rate_dc
+                             , fleet_small=values_to_array(vehicles_required['small'],
+                                                           [satellite_ids, cluster_ids, range(periods)], 'fleet_size')
+                             , fleet_large=values_to_array(vehicles_required['large'], [cluster_ids, range(periods)],
+                                                           'fleet_size')
+                             , vehicles=vehicles)
+        return self.as_dict(costs, satellite_ids, cluster_ids) if as_dict else costs
+
+    def rates(self, satellite_ids: list[str], cluster_ids: list[str], distances_satellites,
+              distances_dc) -> tuple[np.ndarray, np.ndarray]:
+        """(S, K) and (K,) per-item shipping rates; they depend on the distances only."""
+        return (shipping_rates(satellite_distances(distances_satellites, satellite_ids, cluster_ids),
+                               *self.shipping_satellite),
+                shipping_rates(dc_distances(distances_dc, cluster_ids), *self.shipping_dc))
+
+    def combine(self, sourcing: np.ndarray, demand: np.ndarray, rate_satellite: np.ndarray, rate_dc: np.ndarray,
+                fleet_small: np.ndarray, fleet_large: np.ndarray, vehicles: dict[str, Vehicle] = None) -> dict:
+        """
+        Cost components from (S,) sourcing fees, (K, T) demand, the rates and the (S, K, T) / (K, T) fleet sizes.
+        Any subset of clusters can be passed, which is how IncrementalModel refreshes only the edited ones.
+        """
+        cost_vehicle_small = vehicles['small'].costFixed if vehicles is not None else 0.0
+        cost_vehicle_large = vehicles['large'].costFixed if vehicles is not None else 0.0
+
+        first_level = sourcing[:, None, None] * demand[None, :, :]
+        shipping = rate_satellite[:, :, None] * demand[None, :, :]
+        vehicles_satellite = cost_vehicle_small * fleet_small
+        shipping_dc = rate_dc[:, None] * demand
+        vehicles_dc = cost_vehicle_large * fleet_large
+        return {
+            'satellite': {'total': first_level + shipping + vehicles_satellite, 'first_level': first_level,
+                          'shipping': shipping, 'vehicles': vehicles_satellite},
+            'dc': {'total': shipping_dc + vehicles_dc, 'shipping': shipping_dc, 'vehicles': vehicles_dc},
+            'min_items_satellite': self.min_items_satellite,
+            'min_items_dc': self.min_items_dc
+        }
+
+    @staticmethod
+    def __demand(clusters: list[Cluster], periods: int) -> np.ndarray:
+        if isinstance(clusters, ClusterArrays):
+            return np.asarray(clusters.demandByPeriod, dtype=float)[:, :periods]
+        clusters = list(clusters)
+        return np.array([k.demandByPeriod[:periods] for k in clusters], dtype=float).reshape(-1, periods)
+
+    @staticmethod
+    def as_dict(costs: dict, satellite_ids: list[str], cluster_ids: list[str]) -> dict:
+        """Legacy layout of build: {'satellite': {(s, k, t): {'total', ...}}, 'dc': {(k, t): {'total', ...}}}."""
+        return dict(costs,
+                    satellite=ConfigDeterministic.tensor_to_dict(costs['satellite'], satellite_ids, cluster_ids),
+                    dc=ConfigDeterministic.tensor_to_dict(costs['dc'], cluster_ids))
@@ -0,0 +1,309 @@
+import time
+import multiprocessing
+import numpy as np
+import scipy.sparse as sp
+import gurobipy as gb
+from gurobipy import GRB
+from concurrent.futures import ProcessPoolExecutor
+from src.instrumentation import record
+
+
+class RecourseBlock:
+    """
+    Second stage of the location model for one scenario (or one group of periods) once the satellite openings
+    Y are fixed. data holds the arrays of the block:
+        cost_operation (S, T), cost_satellite (S, K, T), cost_dc (K, T), fleet_small (S, K, T),
+        fleet_large (K, T), demand (K, T), min_items_satellite, min_items_dc and optionally weight (default 1)
+        and candidates ((S, K) mask of the allowed satellite/cluster pairs).
+    Variables are laid out as [X | Z | W | U]; U[k, t] is demand left unserved, priced at penalty so that any Y
+    has a feasible second stage (with the default penalty it is only used when nothing else is feasible).
+    The rows are those of ModelDeterministic written as A x + B y (sense) rhs, B holding the Y coefficients.
+    """
+
+    def __init__(self, data: dict, y_satellite: np.ndarray, y_capacity: np.ndarray, serve_from_dc: bool = False,
+                 penalty: float = None):
+        self.data = data
+        self.weight = data.get('weight', 1.0)
+        self.y_satellite = np.asarray(y_satellite, dtype=np.intp)
+        self.y_capacity = np.asarray(y_capacity, dtype=float)
+        self.serve_from_dc = serve_from_dc
+        self.S, self.K, self.T = data['cost_satellite'].shape
+        if penalty is None:
+            penalty = 100 * (1 + max(np.max(data['cost_satellite'], initial=0), np.max(data['cost_dc'], initial=0),
+                                     np.max(data['cost_operation'].sum(axis=1), initial=0)))
+        self.penalty = penalty
+        self.__matrices = None
+
+    @property
+    def sizes(self) -> dict[str, int]:
+        S, K, T = self.S, self.K, self.T
+        return {'X': S * T, 'Z': S * K * T, 'W': K * T, 'U': K * T}
+
+    def matrices(self) -> dict:
+        if self.__matrices is not None:
+            return self.__matrices
+        data, S, K, T = self.data, self.S, self.K, self.T
+        n_Y = len(self.y_satellite)
+        index_X = np.arange(S * T).reshape(S, T)
+        index_Z = S * T + np.arange(S * K * T).reshape(S, K, T)
+        index_W = S * T + S * K * T + np.arange(K * T).reshape(K, T)
+        index_U = S * T + S * K * T + K * T + np.arange(K * T).reshape(K, T)
+        n = S * T + S * K * T + 2 * K * T
+
+        s_, k_, t_ = np.meshgrid(np.arange(S), np.arange(K), np.arange(T), indexing='ij')
+        s_st, t_st = np.meshgrid(np.arange(S), np.arange(T), indexing='ij')
+        k_kt, t_kt = np.meshgrid(np.arange(K), np.arange(T), indexing='ij')
+        t_y, y_ = np.repeat(np.arange(T), n_Y), np.tile(np.arange(n_Y), T)
+        s_y = self.y_satellite[y_]
+
+        # (row offset, rows, sense, rhs, entries in x, entries in y)
+        families = [
+            ('operating', S * T, GRB.LESS_EQUAL, 0.0,
+             [(t_st * S + s_st, index_X, 1.0)], [(t_y * S + s_y, y_, -1.0)]),
+            ('assign', S * K * T, GRB.LESS_EQUAL, 0.0,
+             [((t_ * K + k_) * S + s_, index_Z, 1.0), ((t_ * K + k_) * S + s_, index_X[s_, t_], -1.0)], []),
+            ('capacity', S * T, GRB.LESS_EQUAL, 0.0,
+             [(t_ * S + s_, index_Z, data['fleet_small'])], [(t_y * S + s_y, y_, -self.y_capacity[y_])]),
+            ('demand', K * T, GRB.EQUAL, 1.0,
+             [(t_ * K + k_, index_Z, 1.0), (t_kt * K + k_kt, index_W, 1.0), (t_kt * K + k_kt, index_U, 1.0)], []),
+            ('waldo_dc', T, GRB.GREATER_EQUAL, 0.0,
+             [(t_kt, index_W, data['demand'] - data['min_items_dc'] * data['fleet_large'])], []),
+            ('waldo_satellite', S * T, GRB.GREATER_EQUAL, 0.0,
+             [(t_ * S + s_, index_Z, data['demand'][None, :, :] - data['min_items_satellite'] * data['fleet_small'])],
+             [])
+        ]
+        rows_x, cols_x, values_x, rows_y, cols_y, values_y, sense, rhs = [], [], [], [], [], [], [], []
+        offset = 0
+        for _, n_rows, family_sense, family_rhs, entries_x, entries_y in families:
+            for rows, cols, values in entries_x:
+                rows_x.append(offset + np.ravel(rows))
+                cols_x.append(np.ravel(cols))
+                values_x.append(np.broadcast_to(values, np.shape(cols)).ravel())
+            for rows, cols, values in entries_y:
+                rows_y.append(offset + np.ravel(rows))
+                cols_y.append(np.ravel(cols))
+                values_y.append(np.broadcast_to(values, np.shape(cols)).ravel())
+            sense += [family_sense] * n_rows
+            rhs.append(np.full(n_rows, family_rhs))
+            offset += n_rows
+
+        A = sp.csr_matrix((np.concatenate(values_x), (np.concatenate(rows_x), np.concatenate(cols_x))),
+                          shape=(offset, n))
+        B = sp.csr_matrix((np.concatenate(values_y), (np.concatenate(rows_y), np.concatenate(cols_y))),
+                          shape=(offset, n_Y))
+        A.eliminate_zeros()
+        B.eliminate_zeros()
+        cost = np.concatenate([data['cost_operation'].ravel(), data['cost_satellite'].ravel(),
+                               data['cost_dc'].ravel(), np.full(K * T, self.penalty)])
+        upper = np.ones(n)
+        if not self.serve_from_dc:
+            upper[index_W.ravel()] = 0.0
+        if data.get('candidates') is not None:
+            upper[index_Z[~np.asarray(data['candidates'], dtype=bool)].ravel()] = 0.0
+        self.__matrices = {'A': A, 'B': B, 'sense': np.array(sense), 'rhs': np.concatenate(rhs), 'cost': cost,
+                           'upper': upper, 'integer': np.arange(n) < index_U.min(), 'families': families}
+        return self.__matrices
+
+    def model(self, integer: bool, env: gb.Env = None) -> tuple[gb.Model, gb.MVar, gb.MConstr]:
+        """Block model with continuous copies of Y fixed by equality rows, whose duals give the Benders cuts."""
+        matrices = self.matrices()
+        A, B = matrices['A'], matrices['B']
+        n, n_Y = A.shape[1], B.shape[1]
+        model = gb.Model('Recourse', env=env)
+        vtype = np.where(matrices['integer'], GRB.BINARY, GRB.CONTINUOUS) if integer else GRB.CONTINUOUS
+        x = model.addMVar(n + n_Y, lb=np.concatenate([np.zeros(n), np.full(n_Y, -GRB.INFINITY)]),
+                          ub=np.concatenate([matrices['upper'], np.full(n_Y, GRB.INFINITY)]),
+                          obj=np.concatenate([matrices['cost'], np.zeros(n_Y)]),
+                          vtype=np.concatenate([np.broadcast_to(vtype, n), np.full(n_Y, GRB.CONTINUOUS)]))
+        model.addMConstr(sp.hstack([A, B]).tocsr(), x, matrices['sense'], matrices['rhs'])
+        fix = model.addMConstr(sp.hstack([sp.csr_matrix((n_Y, n)), sp.identity(n_Y)]).tocsr(), x, GRB.EQUAL,
+                               np.zeros(n_Y))
+        model.ModelSense = GRB.MINIMIZE
+        return model, x, fix
+
+    def split(self, x: np.ndarray) -> dict[str, np.ndarray]:
+        """Block solution vector to X (S, T), Z (S, K, T), W (K, T) and U (K, T)."""
+        S, K, T = self.S, self.K, self.T
+        sizes = np.cumsum([0, S * T, S * K * T, K * T, K * T])
+        return {'X': x[sizes[0]:sizes[1]].reshape(S, T), 'Z': x[sizes[1]:sizes[2]].reshape(S, K, T),
+                'W': x[sizes[2]:sizes[3]].reshape(K, T), 'U': x[sizes[3]:sizes[4]].reshape(K, T)}
+
+
+# blocks, solver environment and built block models of the current worker process
+_blocks = None
+_env = None
+_models = {}
+
+
+def _initialize(blocks: list[RecourseBlock], threads: int) -> None:
+    global _blocks, _env, _models
+    if blocks is not None:
+        _blocks = blocks
+    _env = gb.Env(empty=True)
+    _env.setParam('OutputFlag', 0)
+    _env.setParam('Threads', threads)
+    _env.start()
+    _models = {}
+
+
+def _solve_block(j: int, y: np.ndarray, integer: bool, params: dict) -> dict:
+    """Solves block j at Y = y in the current process, reusing its model between calls."""
+    if (j, integer) not in _models:
+        model, x, fix = _blocks[j].model(integer, env=_env)
+        for key, value in (params or {}).items():
+            model.setParam(key, value)
+        _models[(j, integer)] = model, x, fix
+    model, x, fix = _models[(j, integer)]
+    fix.RHS = y
+    model.optimize()
+    result = {'block': j, 'status': model.Status, 'value': None, 'subgradient': None, 'x': None}
+    if model.SolCount > 0:
+        n = len(x.X) - len(y)
+        result['value'] = model.ObjVal
+        result['x'] = np.asarray(x.X[:n])
+        if not integer and model.Status == GRB.OPTIMAL:
+            result['subgradient'] = np.asarray(fix.Pi)
+        if integer:
+            result['bound'] = model.ObjBound
+    return result
+
+
+class BendersDecomposition:
+    """
+    Multi-cut Benders decomposition over the satellite openings Y. The master holds Y, the open-one-option
+    rows and one estimate theta_j per block; each block j is solved as an LP at the master's Y and returns the
+    cut theta_j >= Q_j(y) + pi_j (Y - y). Because the block LPs relax the binary X/Z/W, the master bound is a
+    valid lower bound of the mixed-integer problem; upper bounds come from solving the block MIPs at every new
+    Y (integer_recourse) or at the best Y once the cuts have converged. Blocks are solved on a process pool
+    when workers > 1, each worker keeping its block models between iterations.
+    """
+
+    def __init__(self, blocks: list[RecourseBlock], y_satellite: np.ndarray, y_cost: np.ndarray,
+                 workers: int = None, threads: int = None, params: dict = None, env: gb.Env = None):
+        self.blocks = blocks
+        self.y_satellite = np.asarray(y_satellite, dtype=np.intp)
+        self.y_cost = np.asarray(y_cost, dtype=float)
+        self.workers = workers or 1
+        self.threads = threads or multiprocessing.cpu_count()
+        self.params = params or {}
+        self.env = env
+        self.trajectory = []
+
+    def __master(self) -> tuple[gb.Model, gb.MVar, gb.MVar]:
+        n_Y = len(self.y_satellite)
+        master = gb.Model('Benders-Master', env=self.env)
+        master.setParam('OutputFlag', 0)
+        Y = master.addMVar(n_Y, vtype=GRB.BINARY, obj=self.y_cost)
+        theta = master.addMVar(len(self.blocks), lb=0.0, obj=np.array([block.weight for block in self.blocks]))
+        n_S = int(self.y_satellite.max()) + 1 if n_Y > 0 else 0
+        open_one = sp.csr_matrix((np.ones(n_Y), (self.y_satellite, np.arange(n_Y))), shape=(n_S, n_Y))
+        master.addMConstr(open_one, Y, GRB.LESS_EQUAL, np.ones(n_S))
+        master.ModelSense = GRB.MINIMIZE
+        return master, Y, theta
+
+    def solve(self, max_iterations: int = 100, gap: float = 1e-4, time_limit: float = None,
+              integer_recourse: bool = True, tolerance: float = 1e-6) -> dict:
+        start = time.time()
+        master, Y, theta = self.__master()
+        variables_Y, variables_theta = Y.tolist(), theta.tolist()
+        self.trajectory = []
+        lower_bound, upper_bound, best = -np.inf, np.inf, None
+        evaluated = {}
+
+        workers = min(self.workers, len(self.blocks))
+        pool = None
+        if workers > 1:
+            fork = 'fork' in multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if fork else None)
+            global _blocks
+            _blocks = self.blocks
+            pool = ProcessPoolExecutor(workers, mp_context=context, initializer=_initialize,
+                                       initargs=(None if fork else self.blocks, max(1, self.threads // workers)))
+        else:
+            _initialize(self.blocks, self.threads)
+
+        def evaluate(y: np.ndarray, integer: bool) -> list[dict]:
+            if pool is None:
+                return [_solve_block(j, y, integer, self.params) for j in range(len(self.blocks))]
+            return list(pool.map(_solve_block, range(len(self.blocks)), [y] * len(self.blocks),
+                                 [integer] * len(self.blocks), [self.params] * len(self.blocks)))
+
+        def evaluate_integer(y: np.ndarray) -> float:
+            key = y.tobytes()
+            if key not in evaluated:
+                results = evaluate(y, integer=True)
+                if any(result['value'] is None for result in results):
+                    evaluated[key] = np.inf, results
+                else:
+                    evaluated[key] = float(self.y_cost @ y + sum(
+                        block.weight * result['value'] for block, result in zip(self.blocks, results))), results
+            return evaluated[key][0]
+
+        try:
+            best_lp, best_lp_y = np.inf, None
+            for iteration in range(max_iterations):
+                if time_limit is not None:
+                    master.setParam('TimeLimit', max(time_limit - (time.time() - start), 0))
+                master.optimize()
+                if master.SolCount == 0:
+                    break
+                lower_bound = max(lower_bound, master.ObjBound)
+                y = np.round(Y.X)
+                estimate = np.asarray(theta.X)
+
+                results = evaluate(y, integer=False)
+                values = np.array([result['value'] for result in results], dtype=float)
+                upper_lp = float(self.y_cost @ y + sum(block.weight * value
+                                                       for block, value in zip(self.blocks, values)))
+                if upper_lp < best_lp:
+                    best_lp, best_lp_y = upper_lp, y
+                cuts = 0
+                for j, result in enumerate(results):
+                    if result['subgradient'] is not None and values[j] > estimate[j] + tolerance * (1 + abs(values[j])):
+                        pi = result['subgradient']
+                        master.addConstr(variables_theta[j] - gb.LinExpr(pi.tolist(), variables_Y)
+                                         >= values[j] - float(pi @ y))
+                        cuts += 1
+
+                if integer_recourse:
+                    value = evaluate_integer(y)
+                    if value < upper_bound:
+                        upper_bound, best = value, y
+                self.__log({'iteration': iteration, 'time': time.time() - start,
+                                        'lower_bound': lower_bound, 'upper_bound': upper_bound,
+                                        'upper_bound_lp': best_lp, 'cuts': cuts,
+                                        'gap': self.gap(lower_bound, upper_bound)})
+                if cuts == 0 or self.gap(lower_bound, upper_bound) <= gap or self.gap(lower_bound, best_lp) <= gap \
+                        or (time_limit is not None and time.time() - start >= time_limit):
+                    break
+
+            if best_lp_y is not None and (best is None or not integer_recourse):
+                value = evaluate_integer(best_lp_y)
+                if value < upper_bound:
+                    upper_bound, best = value, best_lp_y
+                self.__log({'iteration': len(self.trajectory), 'time': time.time() - start,
+                                        'lower_bound': lower_bound, 'upper_bound': upper_bound,
+                                        'upper_bound_lp': best_lp, 'cuts': 0,
+                                        'gap': self.gap(lower_bound, upper_bound)})
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            master.dispose()
+
+        solutions = None
+        if best is not None:
+            solutions = [self.blocks[j].split(result['x']) if result['x'] is not None else None
+                         for j, result in enumerate(evaluated[best.tobytes()][1])]
+        return {'y': best, 'objective': upper_bound, 'lower_bound': lower_bound,
+                'gap': self.gap(lower_bound, upper_bound), 'time': time.time() - start,
+                'trajectory': self.trajectory, 'solutions': solutions}
+
+    def __log(self, entry: dict) -> None:
+        self.trajectory.append(entry)
+        record('benders.iteration', blocks=len(self.blocks), **entry)
+
+    @staticmethod
+    def gap(lower_bound: float, upper_bound: float) -> float:
+        if not np.isfinite(upper_bound) or not np.isfinite(lower_bound):
+            return np.inf
+        return abs(upper_bound - lower_bound) / max(abs(upper_bound), 1e-10)
@@ -1,15 +1,53 @@
+import os
+import re
+import urllib.request
 import folium
+import numpy as np
 import branca.colormap as cm
-from branca.element import Figure
+from branca.element import Figure, MacroElement
+from folium.plugins import FastMarkerCluster
+from jinja2 import Template
 from src.classes import Locatable
 
 
+class ZoomSwitch(MacroElement):
+    """Shows each layer only while the map zoom is in its [low, high) range."""
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var levels = [{% for layer, low, high in this.levels %}
+                [{{ layer.get_name() }}, {{ low }}, {{ high }}],{% endfor %}
+            ];
+            function update() {
+                var zoom = map.getZoom();
+                levels.forEach(function(level) {
+                    var visible = zoom >= level[1] && zoom < level[2];
+                    if (visible && !map.hasLayer(level[0])) { map.addLayer(level[0]); }
+                    if (!visible && map.hasLayer(level[0])) { map.removeLayer(level[0]); }
+                });
+            }
+            map.on('zoomend', update);
+            update();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, levels: list[tuple]):
+        super().__init__()
+        self._name = 'ZoomSwitch'
+        self.levels = levels
+
+
 class DrawingMap:
     def __init__(self,
                  location: list[float],
-                 style: str = 'cartodbpositron'
+                 style: str = 'cartodbpositron',
+                 tiles: str = 'OpenStreetMap'
                  ):
-        self.map = folium.Map(location=location, zoom_start=12)
+        # tiles=None draws no base map, so that the HTML needs no tile server; saveMap with assets also inlines the
+        # Leaflet/plugin scripts and stylesheets, which folium otherwise loads from CDNs
+        self.map = folium.Map(location=location, zoom_start=12, tiles=tiles)
         self.fig = Figure(width=800, height=600)
         self.fig.add_child(self.map)
         self.linear = None
@@ -40,5 +78,135 @@ class DrawingMap:
             popup=label,
         ).add_to(self.map)
 
+    @staticmethod
+    def coordinates(list_locatables) -> tuple[np.ndarray, np.ndarray]:
+        """lat and lon arrays of Locatable objects or of a SatelliteArrays/ClusterArrays container."""
+        if isinstance(getattr(list_locatables, 'lat', None), np.ndarray):
+            return list_locatables.lat, list_locatables.lon
+        list_locatables = list(list_locatables)
+        return (np.array([obj.lat for obj in list_locatables], dtype=float),
+                np.array([obj.lon for obj in list_locatables], dtype=float))
+
+    def __pointLayer(self, lat: np.ndarray, lon: np.ndarray, colors: list, radius, fill, name: str) -> folium.GeoJson:
+        # one Point feature per node, coordinates rounded to ~0.1 m to keep the HTML small
+        features = [{'type': 'Feature', 'properties': {'color': color},
+                     'geometry': {'type': 'Point', 'coordinates': [x, y]}}
+                    for x, y, color in zip(np.round(lon, 6).tolist(), np.round(lat, 6).tolist(), colors)]
+        return folium.GeoJson({'type': 'FeatureCollection', 'features': features}, name=name,
+                              marker=folium.CircleMarker(radius=radius, fill=fill),
+                              style_function=lambda feature: {'color': feature['properties']['color'],
+                                                              'fillColor': feature['properties']['color']})
+
+    def addNodesBatched(self, list_locatables, values: np.ndarray = None, radius=1, fill=True, color='blue',
+                        mode: str = 'geojson', levels: dict[int, int] = None, name: str = 'nodes', seed: int = 0):
+        """
+        Batched version of addNodes: all nodes go to one layer instead of one marker each. mode 'geojson' writes
+        one GeoJSON layer of circle markers, colored by values through setHue when given; mode 'cluster' writes a
+        FastMarkerCluster, whose markers are created in the browser from a coordinate array.
+        levels maps a minimum zoom to the number of nodes drawn from that zoom on (None for all), e.g.
+        {0: 2000, 14: None}: each level is its own uniform sample of the nodes, shown only in its zoom range.
+        """
+        lat, lon = self.coordinates(list_locatables)
+        if values is not None and self.linear is not None:
+            colors = [self.linear(value) for value in np.asarray(values, dtype=float).tolist()]
+        else:
+            colors = [color] * len(lat)
+
+        def layer(index: np.ndarray, layer_name: str):
+            if mode == 'geojson':
+                return self.__pointLayer(lat[index], lon[index], [colors[i] for i in index.tolist()], radius, fill,
+                                         layer_name)
+            if mode == 'cluster':
+                return FastMarkerCluster(np.round(np.stack([lat[index], lon[index]], axis=1), 6).tolist(),
+                                         name=layer_name)
+            raise ValueError(f"mode must be 'geojson' or 'cluster', got {mode!r}")
+
+        if not levels:
+            return layer(np.arange(len(lat)), name).add_to(self.map)
+
+        rng = np.random.default_rng(seed)
+        zooms = sorted(levels.keys())
+        switch = []
+        for low, high in zip(zooms, zooms[1:] + [99]):
+            size = levels[low]
+            if size is None or size >= len(lat):
+                index = np.arange(len(lat))
+            else:
+                index = np.sort(rng.choice(len(lat), size, replace=False))
+            switch.append((layer(index, f'{name} (zoom {low}+)').add_to(self.map), low, high))
+        ZoomSwitch(switch).add_to(self.map)
+        return switch
+
+    def addAssignments(self, results: dict, periods: list[int] = None, color_satellite: str = 'red',
+                       color_line: str = 'gray', color_dc: str = 'black', weight: float = 1, radius=4):
+        """
+        Draws a get_results solution as one layer per period, selectable in a layer control: one line feature per
+        operating satellite joining it to all the clusters it serves, the satellites, and the clusters served
+        from the DC. Only the first period is shown initially.
+        """
+        periods = list(results['Z'].keys()) if periods is None else list(periods)
+        located = dict([(s_id, satellite) for (s_id, _), satellite in results['Y'].items()])
+        for n, t in enumerate(periods):
+            satellites = results['X'].get(t, {})
+            features = []
+            for s_id, clusters in results['Z'][t].items():
+                if not clusters:
+                    continue
+                satellite = located[s_id]
+                lat, lon = self.coordinates(clusters)
+                origin = [round(float(satellite.lon), 6), round(float(satellite.lat), 6)]
+                features.append({'type': 'Feature',
+                                 'properties': {'satellite': s_id, 'clusters': len(clusters), 'color': color_line},
+                                 'geometry': {'type': 'MultiLineString', 'coordinates': [
+                                     [origin, [x, y]] for x, y in zip(np.round(lon, 6).tolist(),
+                                                                      np.round(lat, 6).tolist())]}})
+            for s_id, satellite in satellites.items():
+                features.append({'type': 'Feature', 'properties': {'satellite': s_id, 'color': color_satellite},
+                                 'geometry': {'type': 'Point', 'coordinates': [round(float(satellite.lon), 6),
+                                                                               round(float(satellite.lat), 6)]}})
+            if results['W'].get(t):
+                lat, lon = self.coordinates(results['W'][t])
+                features.append({'type': 'Feature', 'properties': {'satellite': 'DC', 'color': color_dc},
+                                 'geometry': {'type': 'MultiPoint', 'coordinates': np.round(
+                                     np.stack([lon, lat], axis=1), 6).tolist()}})
+
+            group = folium.FeatureGroup(name=f'period {t}', show=n == 0)
+            folium.GeoJson({'type': 'FeatureCollection', 'features': features},
+                           marker=folium.CircleMarker(radius=radius, fill=True),
+                           style_function=lambda feature: {'color': feature['properties']['color'],
+                                                           'fillColor': feature['properties']['color'],
+                                                           'weight': weight},
+                           tooltip=folium.GeoJsonTooltip(fields=['satellite'])).add_to(group)
+            group.add_to(self.map)
+        folium.LayerControl().add_to(self.map)
+
     def viewMap(self):
         return self.map
+
+    def saveMap(self, path: str, assets: str = None) -> str:
+        """
+        Writes the map as a standalone HTML file. With assets, a directory of local copies of the CDN scripts and
+        stylesheets, each one is inlined so that the page renders offline (together with tiles=None). A copy missing
+        from the directory is downloaded into it first, so the directory can be filled once while online and shipped
+        with the maps. Files referenced from within the stylesheets (icon images, fonts) are not inlined.
+        """
+        html = self.map.get_root().render()
+        if assets is not None:
+            html = re.sub(r'<script src="(https?://[^"]+)"></script>',
+                          lambda match: '<script>' + self.__asset(assets, match.group(1)) + '</script>', html)
+            html = re.sub(r'<link rel="stylesheet" href="(https?://[^"]+)"/>',
+                          lambda match: '<style>' + self.__asset(assets, match.group(1)) + '</style>', html)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(html)
+        return path
+
+    @staticmethod
+    def __asset(assets: str, url: str) -> str:
+        """Content of url from its local copy in assets, named after the URL without its scheme."""
+        path = os.path.join(assets, re.sub(r'[^A-Za-z0-9._-]', '_', url.split('://', 1)[1]))
+        if not os.path.exists(path):
+            os.makedirs(assets, exist_ok=True)
+            with urllib.request.urlopen(url) as response, open(path, 'wb') as f:
+                f.write(response.read())
+        with open(path, encoding='utf-8') as f:
+            return f.read().replace('</script', '<\\/script')
@@ -0,0 +1,222 @@
+import time
+import numpy as np
+from src.classes import Cluster, Satellite
+from src.models import ModelDeterministic, values_to_array
+
+
+class GreedyHeuristic:
+    """
+    Constructive heuristic for ModelDeterministic. Satellites are opened greedily by cost per served demand,
+    clusters are assigned to the cheapest open satellite with capacity left in every period, and the plan is then
+    improved with drop and swap moves (swap also covers changing the capacity option of a satellite). As in the
+    model, W stays at zero: a plan is feasible when every cluster is assigned in every period and every operated
+    satellite meets min_items_satellite. solve returns the objective of the model; get_results gives the plan in
+    the layout of ModelDeterministic.get_results and set_start passes it to a built model as MIP start.
+    """
+
+    def __init__(self, satellites: list[Satellite], clusters: list[Cluster], vehicles_required: dict[str, dict],
+                 costs: dict[str, dict], periods: int, candidates: np.ndarray = None):
+        self.satellites, self.clusters = list(satellites), list(clusters)
+        self.PERIODS = periods
+        satellite_ids, cluster_ids = [s.id for s in self.satellites], [k.id for k in self.clusters]
+        S, K, T = len(satellite_ids), len(cluster_ids), periods
+
+        self.options = [list(s.capacity.keys()) for s in self.satellites]
+        Q = max([len(options) for options in self.options], default=0)
+        self.capacity = np.full((S, Q), np.nan)
+        self.cost_fixed = np.full((S, Q), np.nan)
+        for i, s in enumerate(self.satellites):
+            self.capacity[i, :len(self.options[i])] = [s.capacity[q_id] for q_id in self.options[i]]
+            self.cost_fixed[i, :len(self.options[i])] = [s.costFixed[q_id] / 25 for q_id in self.options[i]]
+        self.cost_operation = np.array([s.costOperation[:T] for s in self.satellites], dtype=float).reshape(S, T) / 25
+        self.cost = values_to_array(costs['satellite'], [satellite_ids, cluster_ids, range(T)], 'total')
+        self.fleet = values_to_array(vehicles_required['small'], [satellite_ids, cluster_ids, range(T)], 'fleet_size')
+        self.demand = np.array([k.demandByPeriod[:T] for k in self.clusters], dtype=float).reshape(K, T)
+        # contribution of each assignment to the WALDO row of its satellite, which must stay >= 0
+        self.waldo = self.demand[None, :, :] - costs['min_items_satellite'] * self.fleet
+        allowed = np.ones((S, K), dtype=bool) if candidates is None else np.asarray(candidates, dtype=bool)
+        self.cost = np.where(allowed[:, :, None], self.cost, np.inf)
+
+        self.option = None
+        self.assignment = None
+        self.objective = np.inf
+        self.report = {}
+
+    def assign_period(self, t: int, capacity: np.ndarray) -> np.ndarray:
+        """
+        (K,) satellite of every cluster in period t, -1 when unassigned, given the (S,) capacities (0 if closed).
+        Every round each unassigned cluster proposes to its cheapest satellite with room left and each satellite
+        accepts its proposals in order of cost until its capacity is used. Satellites that break their WALDO row
+        are then left out of the period and the period is assigned again.
+        """
+        S, K = self.cost.shape[:2]
+        cost, fleet, waldo = self.cost[:, :, t], self.fleet[:, :, t], self.waldo[:, :, t]
+        available = capacity > 0
+        while True:
+            remaining = np.where(available, capacity, 0.0)
+            assigned = np.full(K, -1)
+            pending = np.ones(K, dtype=bool)
+            while pending.any():
+                clusters = np.flatnonzero(pending)
+                # closed satellites are masked explicitly: a cluster-period needing no vehicle fits in remaining 0
+                proposal = np.where(available[:, None] & (fleet[:, clusters] <= remaining[:, None]), cost[:, clusters],
+                                    np.inf)
+                choice = np.argmin(proposal, axis=0)
+                best = proposal[choice, np.arange(len(clusters))]
+                valid = np.isfinite(best)
+                if not valid.any():
+                    break
+                clusters, choice, best = clusters[valid], choice[valid], best[valid]
+                order = np.lexsort((best, choice))
+                clusters, choice = clusters[order], choice[order]
+                load = fleet[choice, clusters]
+                # cumulative load of the proposals accepted before each one by the same satellite
+                cumulative = np.cumsum(load)
+                first = np.r_[True, choice[1:] != choice[:-1]]
+                offset = np.maximum.accumulate(np.where(first, cumulative - load, 0.0))
+                accepted = cumulative - offset <= remaining[choice] + 1e-9
+                assigned[clusters[accepted]] = choice[accepted]
+                remaining -= np.bincount(choice[accepted], load[accepted], minlength=S)
+                pending[clusters[accepted]] = False
+
+            used = assigned >= 0
+            rows = np.bincount(assigned[used], waldo[assigned[used], np.flatnonzero(used)], minlength=S)
+            broken = available & (rows < -1e-9)
+            if not broken.any():
+                return assigned
+            available &= ~broken
+
+    def evaluate(self, option: np.ndarray) -> tuple[float, np.ndarray, int]:
+        """Objective, (K, T) assignment and number of unassigned cluster-periods of the openings option (S,)."""
+        opened = option >= 0
+        capacity = np.where(opened, self.capacity[np.arange(len(option)), np.maximum(option, 0)], 0.0)
+        assignment = np.stack([self.assign_period(t, capacity) for t in range(self.PERIODS)], axis=1)
+        unassigned = int(np.sum(assignment < 0))
+        if unassigned > 0:
+            return np.inf, assignment, unassigned
+        K = assignment.shape[0]
+        k_, t_ = np.meshgrid(np.arange(K), np.arange(self.PERIODS), indexing='ij')
+        operated = np.zeros(self.cost_operation.shape, dtype=bool)
+        operated[assignment, t_] = True
+        objective = np.sum(self.cost_fixed[opened, option[opened]]) + np.sum(self.cost_operation[operated]) + \
+            np.sum(self.cost[assignment, k_, t_])
+        return float(objective), assignment, 0
+
+    def __ratios(self, assignment: np.ndarray) -> np.ndarray:
+        """(S, Q) cost per unit of demand of opening option q at s for the cluster-periods still unassigned."""
+        S, Q = self.capacity.shape
+        open_cost = self.cost_fixed + self.cost_operation.sum(axis=1)[:, None]
+        demand = np.where(assignment[None, :, :] < 0, self.demand[None, :, :], 0.0)
+        per_item = np.where(demand > 0, self.cost / np.maximum(demand, 1e-12), np.inf)
+        order = np.argsort(per_item, axis=1)
+        cost = np.take_along_axis(self.cost, order, axis=1)
+        fleet = np.take_along_axis(self.fleet, order, axis=1)
+        demand = np.take_along_axis(np.broadcast_to(demand, self.cost.shape), order, axis=1)
+        cumulative = np.cumsum(np.where(np.isfinite(cost) & (demand > 0), fleet, np.inf), axis=1)
+        ratios = np.full((S, Q), np.inf)
+        for q in range(Q):
+            fits = cumulative <= np.nan_to_num(self.capacity[:, q], nan=-1.0)[:, None, None]
+            served = np.sum(np.where(fits, demand, 0.0), axis=(1, 2))
+            total = open_cost[:, q] + np.sum(np.where(fits, cost, 0.0), axis=(1, 2))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratios[:, q] = np.where(served > 0, total / served, np.inf)
+        return np.where(np.isnan(self.capacity), np.inf, ratios)
+
+    def construct(self) -> np.ndarray:
+        """Opens satellites one at a time by lowest cost per served demand until every cluster is assigned."""
+        S = len(self.satellites)
+        option = np.full(S, -1)
+        _, assignment, unassigned = self.evaluate(option)
+        while unassigned > 0:
+            ratios = self.__ratios(assignment)
+            ratios[option >= 0] = np.inf
+            if not np.isfinite(ratios).any():
+                break
+            i, q = np.unravel_index(np.argmin(ratios), ratios.shape)
+            option[i] = q
+            _, assignment, unassigned = self.evaluate(option)
+        return option
+
+    def improve(self, option: np.ndarray, time_limit: float = None, max_swaps: int = 10) -> np.ndarray:
+        """
+        First-improvement local search: drop an open satellite, or swap it for one of the max_swaps closed
+        satellite/option pairs with the best cost per demand (including another option of the same satellite).
+        """
+        start = time.time()
+        objective, assignment, _ = self.evaluate(option)
+        moves, improved = 0, True
+        while improved and (time_limit is None or time.time() - start < time_limit):
+            improved = False
+            ratios = self.__ratios(np.full(assignment.shape, -1))
+            for i in np.flatnonzero(option >= 0):
+                candidates = [(i, -1)]
+                swap = ratios.copy()
+                swap[(option >= 0) & (np.arange(len(option)) != i)] = np.inf
+                swap[i, option[i]] = np.inf
+                best = np.argsort(swap, axis=None)[:max_swaps]
+                candidates += [(j, q) for j, q in zip(*np.unravel_index(best, swap.shape)) if np.isfinite(swap[j, q])]
+                for j, q in candidates:
+                    neighbour = option.copy()
+                    neighbour[i] = -1
+                    if q >= 0:
+                        neighbour[j] = q
+                    value, neighbour_assignment, _ = self.evaluate(neighbour)
+                    if value < objective - 1e-9:
+                        option, objective, assignment = neighbour, value, neighbour_assignment
+                        moves, improved = moves + 1, True
+                        break
+                if improved or (time_limit is not None and time.time() - start >= time_limit):
+                    break
+        self.report['moves'] = moves
+        return option
+
+    def solve(self, time_limit: float = None, local_search: bool = True, max_swaps: int = 10) -> dict[str, float]:
+        start = time.time()
+        option = self.construct()
+        objective_greedy, _, _ = self.evaluate(option)
+        if local_search:
+            remaining = None if time_limit is None else max(time_limit - (time.time() - start), 0)
+            option = self.improve(option, time_limit=remaining, max_swaps=max_swaps)
+        self.objective, self.assignment, unassigned = self.evaluate(option)
+        self.option = option
+        self.report.update({'objective_greedy': objective_greedy, 'objective': self.objective,
+                            'feasible': unassigned == 0, 'unassigned': unassigned,
+                            'open': int(np.sum(option >= 0)), 'time': time.time() - start})
+        return self.report
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """Y (S, Q), X (S, T) and Z (S, K, T) of the current plan as 0/1 arrays."""
+        S, K, T = self.cost.shape
+        Y = np.zeros(self.capacity.shape)
+        Y[np.flatnonzero(self.option >= 0), self.option[self.option >= 0]] = 1
+        Z = np.zeros((S, K, T))
+        k_, t_ = np.nonzero(self.assignment >= 0)
+        Z[self.assignment[k_, t_], k_, t_] = 1
+        return {'Y': Y, 'X': (Z.sum(axis=1) > 0).astype(float), 'Z': Z}
+
+    def get_results(self) -> dict:
+        arrays = self.arrays()
+        satellites, clusters = self.satellites, self.clusters
+        X, Z = arrays['X'] > 0, arrays['Z'] > 0
+        return {'Y': dict([((s.id, self.options[i][self.option[i]]), s) for i, s in enumerate(satellites)
+                           if self.option[i] >= 0]),
+                'X': dict([(t, dict([(s.id, s) for i, s in enumerate(satellites) if X[i, t]]))
+                           for t in range(self.PERIODS)]),
+                'Z': dict([(t, dict([(s.id, [k for j, k in enumerate(clusters) if Z[i, j, t]])
+                                     for i, s in enumerate(satellites)])) for t in range(self.PERIODS)]),
+                'W': dict([(t, []) for t in range(self.PERIODS)])}
+
+    def set_start(self, model: ModelDeterministic) -> int:
+        """Sets the plan as MIP start of a model built from the same inputs; returns the number of values set."""
+        arrays = self.arrays()
+        satellite_index = dict([(s.id, i) for i, s in enumerate(self.satellites)])
+        cluster_index = dict([(k.id, j) for j, k in enumerate(self.clusters)])
+        option_index = [dict([(q_id, q) for q, q_id in enumerate(options)]) for options in self.options]
+        values = [(variable, arrays['Y'][satellite_index[s_id], option_index[satellite_index[s_id]][q_id]])
+                  for (s_id, q_id), variable in model.Y.items()]
+        values += [(variable, arrays['X'][satellite_index[s_id], t]) for (s_id, t), variable in model.X.items()]
+        values += [(variable, arrays['Z'][satellite_index[s_id], cluster_index[k_id], t])
+                   for (s_id, k_id, t), variable in model.Z.items()]
+        values += [(variable, 0.0) for variable in model.W.values()]
+        model.model.setAttr('Start', [variable for variable, _ in values], [float(value) for _, value in values])
+        return len(values)
@@ -0,0 +1,235 @@
+import time
+import numpy as np
+from scipy.sparse import csr_matrix, bmat
+from scipy.sparse.csgraph import connected_components
+from gurobipy import GRB
+from src.classes import Cluster, Satellite, Vehicle
+from src.utils import ConfigDeterministic, object_ids, satellite_distances, dc_distances
+from src.costs import CostDeterministic
+from src.models import ModelDeterministic
+
+try:
+    import h3
+except ImportError:
+    h3 = None
+
+
+def parent_ids(cluster_ids: list[str], resolution: int) -> list[str]:
+    """
+    H3 parent cell of every cluster id at the given (coarser) resolution. Requires the optional h3 package; without
+    it, pass the parent ids to HierarchicalSolve through parents= instead of resolution.
+    """
+    if h3 is None:
+        raise ImportError('the h3 package is required to aggregate clusters by resolution; pass parents instead')
+    # h3 >= 4 renamed h3_to_parent to cell_to_parent
+    to_parent = getattr(h3, 'cell_to_parent', None) or getattr(h3, 'h3_to_parent')
+    return [to_parent(id_k, resolution) for id_k in cluster_ids]
+
+
+def aggregate_clusters(clusters: list[Cluster], parents: list[str], periods: int) -> tuple[list[Cluster], np.ndarray]:
+    """
+    One Cluster per parent id: demand, customers and area are summed, avgDrop and avgStopDensity are recomputed
+    from the sums, and location, intra-stop speed and k are demand-weighted means of the children. Returns the
+    parent clusters and, for every child, the position of its parent.
+    """
+    clusters = list(clusters)
+    ids, membership = np.unique(np.asarray(parents, dtype=str), return_inverse=True)
+    P = len(ids)
+    demand = np.array([k.demandByPeriod[:periods] for k in clusters], dtype=float).reshape(-1, periods)
+    customers = np.array([k.customersByPeriod[:periods] for k in clusters], dtype=float).reshape(-1, periods)
+    area = np.array([k.areaKm for k in clusters], dtype=float)
+    weight = np.maximum(demand.sum(axis=1), 1e-9)
+
+    def summed(values: np.ndarray) -> np.ndarray:
+        return np.stack([np.bincount(membership, values[:, t], minlength=P) for t in range(values.shape[1])], axis=1)
+
+    def weighted(values: np.ndarray) -> np.ndarray:
+        return np.bincount(membership, values * weight, minlength=P) / np.bincount(membership, weight, minlength=P)
+
+    demand_parent, customers_parent = summed(demand), summed(customers)
+    area_parent = np.bincount(membership, area, minlength=P)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_drop = np.where(customers_parent > 0, demand_parent / customers_parent, 0.0)
+        stop_density = np.where(area_parent[:, None] > 0, customers_parent / area_parent[:, None], 0.0)
+    lon = weighted(np.array([k.lon for k in clusters], dtype=float))
+    lat = weighted(np.array([k.lat for k in clusters], dtype=float))
+    k_parent = weighted(np.array([k.k for k in clusters], dtype=float))
+    speed = dict([(key, weighted(np.array([k.speed_intra[key] for k in clusters], dtype=float)))
+                  for key in clusters[0].speed_intra.keys()])
+    aggregated = [Cluster(id_c=str(ids[p])
+                          , lon=lon[p]
+                          , lat=lat[p]
+                          , areaKm=area_parent[p]
+                          , customersByPeriod=customers_parent[p].tolist()
+                          , demandByPeriod=demand_parent[p].tolist()
+                          , avgDrop=avg_drop[p].tolist()
+                          , speed_intra=dict([(key, value[p]) for key, value in speed.items()])
+                          , avgStopDensity=stop_density[p].tolist()
+                          , k=k_parent[p])
+                  for p in range(P)]
+    return aggregated, membership
+
+
+class HierarchicalSolve:
+    """
+    Two-level solve over the H3 hierarchy. The clusters are aggregated to their parent cells at `resolution`
+    (aggregate_clusters) and a ModelDeterministic on the parents chooses the satellites and options. The fine
+    model then keeps only the opened satellites and, for every cluster, the satellites that served its parent in
+    some period plus its `neighbors` nearest opened satellites. The satellite/cluster graph of these candidates
+    splits into independent regions, each solved on its own with Y fixed to the coarse choice (y_mode='fix') or
+    free among the opened satellites (y_mode='restrict'). A region infeasible with Y fixed, because aggregation
+    misjudged its fleet sizes, is re-solved with y_mode='restrict'.
+
+    With the disaggregated formulation W is zero and the regions share no constraint, so the fine solution is
+    optimal for the restricted candidates; the total is an upper bound of the full model. parents overrides the
+    H3 parent ids, e.g. when h3 is not installed.
+    """
+
+    def __init__(self, satellites: list[Satellite], clusters: list[Cluster], vehicles: dict[str, Vehicle],
+                 distances_satellites, distances_dc, periods: int, resolution: int = None, parents: list[str] = None,
+                 costs: CostDeterministic = None, config: ConfigDeterministic = None, neighbors: int = 1,
+                 y_mode: str = 'fix', params: dict = None, params_coarse: dict = None, env=None):
+        if y_mode not in ('fix', 'restrict'):
+            raise ValueError(f"y_mode must be 'fix' or 'restrict', got {y_mode!r}")
+        if parents is None and resolution is None:
+            raise ValueError('either resolution or parents is required')
+        self.satellites, self.clusters = list(satellites), list(clusters)
+        self.vehicles = vehicles
+        self.periods = periods
+        self.parents = list(parents) if parents is not None else parent_ids(object_ids(self.clusters), resolution)
+        self.costs = costs or CostDeterministic()
+        self.config = config or ConfigDeterministic()
+        self.neighbors = neighbors
+        self.y_mode = y_mode
+        self.params = dict({'OutputFlag': 0}, **(params or {}))
+        self.params_coarse = dict(self.params, **(params_coarse or {}))
+        self.env = env
+        satellite_ids, cluster_ids = object_ids(self.satellites), object_ids(self.clusters)
+        self.distance_satellites = satellite_distances(distances_satellites, satellite_ids, cluster_ids)
+        self.distance_dc = dc_distances(distances_dc, cluster_ids)
+        self.report = {}
+
+    def __inputs(self, clusters: list[Cluster], distance_satellites: np.ndarray,
+                 distance_dc: np.ndarray) -> tuple[dict, dict]:
+        vehicles_required = {
+            'small': self.config.calculate_fleet_size_tensor_from_satellites(
+                self.satellites, clusters, self.vehicles['small'], self.periods, distance_satellites),
+            'large': self.config.calculate_fleet_size_tensor_from_dc(
+                clusters, self.vehicles['large'], self.periods, distance_dc)
+        }
+        costs = self.costs.build(self.satellites, clusters, vehicles_required, self.periods, distance_satellites,
+                                 distance_dc, vehicles=self.vehicles)
+        return vehicles_required, costs
+
+    def solve_coarse(self) -> ModelDeterministic:
+        """Solves the model on the parent cells; child distances are averaged with demand weights."""
+        start = time.time()
+        coarse, membership = aggregate_clusters(self.clusters, self.parents, self.periods)
+        self.membership = membership
+        weight = np.maximum(np.array([k.demandByPeriod[:self.periods] for k in self.clusters],
+                                     dtype=float).reshape(-1, self.periods).sum(axis=1), 1e-9)
+        total = np.bincount(membership, weight, minlength=len(coarse))
+        distance_satellites = np.stack([np.bincount(membership, row * weight, minlength=len(coarse))
+                                        for row in self.distance_satellites]) / total[None, :]
+        distance_dc = np.bincount(membership, self.distance_dc * weight, minlength=len(coarse)) / total
+        vehicles_required, costs = self.__inputs(coarse, distance_satellites, distance_dc)
+
+        model = ModelDeterministic(periods=self.periods, name_model='Hierarchical-Coarse', env=self.env)
+        model.setParams(self.params_coarse)
+        model.build_matrix(self.satellites, coarse, vehicles_required, costs)
+        status = model.optimizeModel()
+        self.report['coarse'] = {'clusters': len(coarse), 'status': status, 'time': time.time() - start,
+                                 'objective': model.model.ObjVal if model.model.SolCount > 0 else None}
+        return model
+
+    def solve(self) -> dict:
+        """
+        Coarse solve followed by the regional fine solves. Returns the solution in the layout of
+        ModelDeterministic.get_solution (indices into the satellites and clusters given here), with the
+        coarse/fine details in self.report.
+        """
+        coarse = self.solve_coarse()
+        if coarse.model.SolCount == 0:
+            raise RuntimeError(f'the coarse model has no solution (status {coarse.model.Status})')
+        start = time.time()
+        coarse_solution = coarse.get_solution()
+        S, K, T = len(self.satellites), len(self.clusters), self.periods
+        opened = dict([(coarse_solution['satellite_ids'][i], coarse_solution['option_ids'][q])
+                       for i, q in coarse_solution['Y'].tolist()])
+        satellite_ids = object_ids(self.satellites)
+        is_open = np.array([id_s in opened for id_s in satellite_ids])
+        if not is_open.any():
+            raise RuntimeError('the coarse model opened no satellite')
+
+        # candidates: satellites that served the parent in some period, plus the nearest opened ones
+        served = np.zeros((S, len(coarse_solution['cluster_ids'])), dtype=bool)
+        served[coarse_solution['Z'][:, 0], coarse_solution['Z'][:, 1]] = True
+        candidates = served[:, self.membership] & is_open[:, None]
+        distance = np.where(is_open[:, None], self.distance_satellites, np.inf)
+        nearest = np.argsort(distance, axis=0)[:min(self.neighbors, int(is_open.sum()))]
+        candidates[nearest, np.arange(K)[None, :]] = True
+
+        vehicles_required, costs = self.__inputs(self.clusters, self.distance_satellites, self.distance_dc)
+        # regions: connected components of the satellite/cluster candidate graph
+        graph = bmat([[None, csr_matrix(candidates)], [csr_matrix(candidates.T), None]])
+        _, labels = connected_components(graph, directed=False)
+
+        solution = {'Y': [], 'X': [], 'Z': [], 'W': []}
+        option_ids = list(dict.fromkeys([q_id for s in self.satellites for q_id in s.capacity.keys()]))
+        regions, objective = [], 0.0
+        for label in np.unique(labels[:S][is_open]):
+            rows = np.flatnonzero((labels[:S] == label) & is_open)
+            columns = np.flatnonzero(labels[S:] == label)
+            region = self.__solveRegion(rows, columns, candidates, vehicles_required, costs, opened)
+            regions.append(region['report'])
+            if region['solution'] is None:
+                continue
+            objective += region['solution']['objective']
+            local = region['solution']
+            solution['Y'].append(np.stack([rows[local['Y'][:, 0]], np.array(
+                [option_ids.index(local['option_ids'][q]) for q in local['Y'][:, 1]], dtype=np.intp)], axis=1)
+                if len(local['Y']) else np.empty((0, 2), dtype=np.intp))
+            solution['X'].append(np.stack([rows[local['X'][:, 0]], local['X'][:, 1]], axis=1))
+            solution['Z'].append(np.stack([rows[local['Z'][:, 0]], columns[local['Z'][:, 1]], local['Z'][:, 2]],
+                                          axis=1))
+            solution['W'].append(np.stack([columns[local['W'][:, 0]], local['W'][:, 1]], axis=1))
+
+        width = {'Y': 2, 'X': 2, 'Z': 3, 'W': 2}
+        solution = dict([(family, np.concatenate(blocks).astype(np.intp) if blocks else
+                          np.empty((0, width[family]), dtype=np.intp)) for family, blocks in solution.items()])
+        solution.update(satellite_ids=np.asarray(satellite_ids), cluster_ids=np.asarray(object_ids(self.clusters)),
+                        option_ids=np.asarray(option_ids), periods=T, objective=float(objective))
+        self.report['fine'] = {'regions': len(regions), 'time': time.time() - start, 'objective': objective,
+                               'candidates': int(candidates.sum()), 'pairs': S * K,
+                               'feasible': all(region['status'] == GRB.OPTIMAL or region['solutions'] > 0
+                                               for region in regions), 'details': regions}
+        return solution
+
+    def __solveRegion(self, rows: np.ndarray, columns: np.ndarray, candidates: np.ndarray, vehicles_required: dict,
+                      costs: dict, opened: dict) -> dict:
+        satellites = [self.satellites[i] for i in rows.tolist()]
+        clusters = [self.clusters[j] for j in columns.tolist()]
+        region_required = {'small': vehicles_required['small']['fleet_size'][np.ix_(rows, columns)],
+                           'large': vehicles_required['large']['fleet_size'][columns]}
+        region_costs = dict(costs, satellite=costs['satellite']['total'][np.ix_(rows, columns)],
+                            dc=costs['dc']['total'][columns])
+        y_mode = self.y_mode
+        while True:
+            model = ModelDeterministic(periods=self.periods, name_model='Hierarchical-Fine', env=self.env)
+            model.setParams(self.params)
+            model.build_matrix(satellites, clusters, region_required, region_costs,
+                               candidates=candidates[np.ix_(rows, columns)])
+            if y_mode == 'fix':
+                keys = list(model.Y.keys())
+                values = [1.0 if opened.get(s_id) == q_id else 0.0 for s_id, q_id in keys]
+                model.model.setAttr('LB', list(model.Y.values()), values)
+                model.model.setAttr('UB', list(model.Y.values()), values)
+            status = model.optimizeModel()
+            if model.model.SolCount > 0 or y_mode == 'restrict':
+                break
+            y_mode = 'restrict'
+        report = {'satellites': len(rows), 'clusters': len(columns), 'status': status, 'y_mode': y_mode,
+                  'solutions': model.model.SolCount, 'runtime': model.model.Runtime}
+        solution = model.get_solution() if model.model.SolCount > 0 else None
+        model.model.dispose()
+        return {'report': report, 'solution': solution}
@@ -0,0 +1,66 @@
+import numpy as np
+from src.classes import ClusterArrays, Satellite, SatelliteArrays, Vehicle
+from src.utils import ConfigDeterministic, object_ids, satellite_distances, dc_distances
+from src.costs import CostDeterministic
+from src.models import ModelDeterministic
+from src.instrumentation import measure
+
+
+class IncrementalModel:
+    """
+    Keeps a built ModelDeterministic in sync with cluster edits. Clusters are edited through
+    ClusterArrays.update; apply then recomputes the fleet sizes and costs of the edited clusters only and patches
+    their objective, capacity and WALDO coefficients in the model, so a small edit costs one model update and a
+    warm-started re-solve instead of a rebuild. Shipping rates and distances, which do not depend on the edited
+    fields, are computed once here. vehicle_costs must match the costs the model was built with (build called
+    with or without vehicles).
+    """
+
+    def __init__(self, model: ModelDeterministic, satellites: list[Satellite], clusters: ClusterArrays,
+                 vehicles: dict[str, Vehicle], distances_satellites, distances_dc, costs: CostDeterministic = None,
+                 config: ConfigDeterministic = None, vehicle_costs: bool = True):
+        self.model = model
+        self.satellites = satellites
+        self.clusters = clusters
+        self.vehicles = vehicles
+        self.costs = costs or CostDeterministic()
+        self.config = config or ConfigDeterministic()
+        self.vehicle_costs = vehicle_costs
+
+        satellite_ids, cluster_ids = object_ids(satellites), object_ids(clusters)
+        self.distance_satellites = satellite_distances(distances_satellites, satellite_ids, cluster_ids)
+        self.distance_dc = dc_distances(distances_dc, cluster_ids)
+        self.rate_satellite, self.rate_dc = self.costs.rates(satellite_ids, cluster_ids, self.distance_satellites,
+                                                             self.distance_dc)
+        self.sourcing = np.asarray(satellites.costSourcing, dtype=float) if isinstance(satellites, SatelliteArrays) \
+            else np.array([s.costSourcing for s in satellites], dtype=float)
+
+    def apply(self) -> dict[str, int]:
+        """Pushes the cluster edits made since the last call; returns the coefficients changed per family."""
+        clusters = self.clusters.pop_changed()
+        if clusters.size == 0:
+            return {}
+        T = self.model.PERIODS
+        with measure('incremental.apply', model=self.model.model.ModelName, clusters=int(clusters.size)) as step:
+            subset = self.clusters.subset(clusters)
+            fleet_small = self.config.calculate_fleet_size_tensor_from_satellites(
+                self.satellites, subset, self.vehicles['small'], T, self.distance_satellites[:, clusters])['fleet_size']
+            fleet_large = self.config.calculate_fleet_size_tensor_from_dc(
+                subset, self.vehicles['large'], T, self.distance_dc[clusters])['fleet_size']
+            demand = subset.demandByPeriod[:, :T]
+            costs = self.costs.combine(sourcing=self.sourcing
+                                       , demand=demand
+                                       , rate_satellite=self.rate_satellite[:, clusters]
+                                       , rate_dc=self.rate_dc[clusters]
+                                       , fleet_small=fleet_small
+                                       , fleet_large=fleet_large
+                                       , vehicles=self.vehicles if self.vehicle_costs else None)
+            changed = self.model.update_clusters(clusters, demand, fleet_small, fleet_large,
+                                                 costs['satellite']['total'], costs['dc']['total'])
+            step.fields.update(changed)
+        return changed
+
+    def resolve(self) -> str:
+        """apply, then re-optimize from the previous incumbent."""
+        self.apply()
+        return self.model.resolve()
@@ -0,0 +1,187 @@
+import sys
+import json
+import time
+import socket
+import logging
+import functools
+import tracemalloc
+from gurobipy import GRB
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# one logger for the whole pipeline, silent until enable() is called; the state lives on the logger so that it is
+# shared however this module is imported (instrumentation or src.instrumentation)
+logger = logging.getLogger('metrics')
+logger.propagate = False
+if logger.level == logging.NOTSET:
+    logger.setLevel(logging.WARNING)
+
+
+class JsonlSink(logging.Handler):
+    """Appends every metrics record as one JSON line: time, run, host, event and the record fields."""
+    metrics_sink = True
+
+    def __init__(self, path: str, run: str = None):
+        super().__init__(logging.INFO)
+        self.path = path
+        self.run = run or time.strftime('%Y%m%dT%H%M%S')
+        self.host = socket.gethostname()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        line = dict({'time': record.created, 'run': self.run, 'host': self.host, 'event': record.getMessage()},
+                    **getattr(record, 'metrics', {}))
+        try:
+            with open(self.path, 'a') as file:
+                file.write(json.dumps(line, default=str) + '\n')
+        except Exception:
+            self.handleError(record)
+
+
+def enable(path: str = 'metrics.jsonl', run: str = None, track_memory: bool = False) -> JsonlSink:
+    """
+    Starts writing metrics to path. With track_memory every measured step also reports its Python peak memory
+    through tracemalloc, which slows allocation-heavy code down; otherwise only the process peak RSS is reported.
+    """
+    disable()
+    sink = JsonlSink(path, run)
+    logger.addHandler(sink)
+    logger.setLevel(logging.INFO)
+    logger.track_memory = track_memory
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return sink
+
+
+def disable() -> None:
+    for handler in [handler for handler in logger.handlers if getattr(handler, 'metrics_sink', False)]:
+        logger.removeHandler(handler)
+        handler.close()
+    logger.setLevel(logging.WARNING)
+    if getattr(logger, 'track_memory', False) and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    logger.track_memory = False
+
+
+def enabled() -> bool:
+    return logger.isEnabledFor(logging.INFO)
+
+
+def record(event: str, **fields) -> None:
+    if enabled():
+        logger.info(event, extra={'metrics': fields})
+
+
+def max_rss_mb() -> float:
+    """Peak resident memory of the process in MB (None where the resource module is unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+# peaks of the enclosing measured steps, carried over tracemalloc.reset_peak by the nested ones
+_peaks = []
+
+
+class measure:
+    """
+    Context manager timing a step and recording it as one event on exit. Fields added to .fields inside the block
+    are recorded too; .elapsed is available afterwards whether or not metrics are enabled.
+    """
+
+    def __init__(self, event: str, **fields):
+        self.event = event
+        self.fields = fields
+        self.elapsed = None
+
+    def __enter__(self):
+        self.memory = getattr(logger, 'track_memory', False) and tracemalloc.is_tracing()
+        if self.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            if _peaks:
+                _peaks[-1] = max(_peaks[-1], peak)
+            tracemalloc.reset_peak()
+            _peaks.append(0)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.elapsed = time.perf_counter() - self.start
+        self.fields['seconds'] = self.elapsed
+        if self.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            peak = max(_peaks.pop(), peak)
+            if _peaks:
+                _peaks[-1] = max(_peaks[-1], peak)
+            self.fields['peak_memory_mb'] = peak / 2 ** 20
+        if enabled():
+            self.fields['max_rss_mb'] = max_rss_mb()
+            if exc_type is not None:
+                self.fields['error'] = repr(exc)
+            record(self.event, **self.fields)
+
+
+def timed(event: str):
+    """Decorator recording every call of the function as a measured step."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with measure(event, function=function.__qualname__):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def chain(*callbacks):
+    """Single Gurobi callback calling the given ones in order; None when there is none."""
+    callbacks = [callback for callback in callbacks if callback is not None]
+    if not callbacks:
+        return None
+    if len(callbacks) == 1:
+        return callbacks[0]
+
+    def callback(model, where):
+        for function in callbacks:
+            function(model, where)
+    return callback
+
+
+class SolveProgress:
+    """
+    Gurobi callback recording the incumbent, best bound and gap during the MIP: on every new incumbent and at most
+    every interval seconds otherwise. The points are kept in .trajectory and recorded as events.
+    """
+
+    def __init__(self, interval: float = 1.0, event: str = 'solve.progress', **fields):
+        self.interval = interval
+        self.event = event
+        self.fields = fields
+        self.trajectory = []
+        self.last = -float('inf')
+
+    def __call__(self, model, where) -> None:
+        solution = None
+        if where == GRB.Callback.MIPSOL:
+            runtime = model.cbGet(GRB.Callback.RUNTIME)
+            incumbent, bound = model.cbGet(GRB.Callback.MIPSOL_OBJBST), model.cbGet(GRB.Callback.MIPSOL_OBJBND)
+            # objective of the new solution, which a lazy callback may still reject
+            solution = model.cbGet(GRB.Callback.MIPSOL_OBJ)
+        elif where == GRB.Callback.MIP:
+            runtime = model.cbGet(GRB.Callback.RUNTIME)
+            if runtime - self.last < self.interval:
+                return
+            incumbent, bound = model.cbGet(GRB.Callback.MIP_OBJBST), model.cbGet(GRB.Callback.MIP_OBJBND)
+        else:
+            return
+        self.last = runtime
+        found = abs(incumbent) < GRB.INFINITY
+        entry = {'seconds': runtime, 'incumbent': incumbent if found else None,
+                 'bound': bound if abs(bound) < GRB.INFINITY else None,
+                 'gap': abs(incumbent - bound) / max(abs(incumbent), 1e-10) if found else None,
+                 'solution': solution}
+        self.trajectory.append(entry)
+        record(self.event, **dict(self.fields, **entry))
@@ -1,17 +1,116 @@
+import os
+import time
+import tempfile
 from typing import Any
+from itertools import product
+from contextlib import contextmanager
+import numpy as np
+import scipy.sparse as sp
 import gurobipy as gb
 from gurobipy import GRB, quicksum
 from src.classes import Cluster, Satellite
+from src.decomposition import RecourseBlock, BendersDecomposition
+from src.results import id_array, save_results
+from src.cache import ModelCache, digest
+from src.instrumentation import measure, enabled, chain, SolveProgress
 from abc import ABC, abstractmethod
 
 
+def values_to_array(values, ids: list[list], field: str = None) -> np.ndarray:
+    """
+    Dense array, one axis per entry of ids, from either an array (returned as is), a dict of arrays such as the
+    fleet-size tensors (values[field]) or the legacy dict keyed by id tuples (values[key][field] if field).
+    """
+    if isinstance(values, np.ndarray):
+        return values
+    if field is not None and isinstance(values.get(field), np.ndarray):
+        return values[field]
+    keys = product(*ids)
+    if field is None:
+        flat = np.fromiter((values[key] for key in keys), dtype=float)
+    else:
+        flat = np.fromiter((values[key][field] for key in keys), dtype=float)
+    return flat.reshape([len(axis) for axis in ids])
+
+
+class IndexedMap:
+    """
+    Read-only dict over one variable or constraint family of a lean model. Keys are not stored: index holds, for
+    every entry, the positions of its key components in axes (id lists, or the periods), and key tuples are only
+    built on access. Values come from one MVar or MConstr.
+    """
+
+    def __init__(self, elements, index: np.ndarray, axes: list):
+        self.elements = elements
+        self.index = np.asarray(index, dtype=np.intp).reshape(len(index), -1)
+        self.axes = [list(axis) for axis in axes]
+        self.__positions = None
+
+    @staticmethod
+    def from_keys(elements, keys: list, axes: list = None) -> 'IndexedMap':
+        """
+        IndexedMap over explicit keys (tuples or single ids). Without axes, each axis lists its values in order of
+        appearance.
+        """
+        columns = list(zip(*[key if isinstance(key, tuple) else (key,) for key in keys]))
+        axes = [list(dict.fromkeys(column)) for column in columns] if axes is None else [list(axis) for axis in axes]
+        lookups = [dict([(value, i) for i, value in enumerate(axis)]) for axis in axes]
+        index = np.array([[lookup[value] for value in column] for lookup, column in zip(lookups, columns)],
+                         dtype=np.intp).T
+        return IndexedMap(elements, index, axes)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __key(self, row: tuple):
+        key = tuple(axis[i] for axis, i in zip(self.axes, row))
+        return key[0] if len(key) == 1 else key
+
+    def keys(self):
+        return (self.__key(row) for row in self.index.tolist())
+
+    def __iter__(self):
+        return self.keys()
+
+    def values(self) -> list:
+        return self.elements.tolist()
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+    def __position(self, key) -> int:
+        if self.__positions is None:
+            lookups = [dict([(value, i) for i, value in enumerate(axis)]) for axis in self.axes]
+            positions = np.full([len(axis) for axis in self.axes], -1, dtype=np.intp)
+            positions[tuple(self.index.T)] = np.arange(len(self.index))
+            self.__positions = lookups, positions
+        lookups, positions = self.__positions
+        key = key if isinstance(key, tuple) else (key,)
+        if len(key) != len(lookups) or any(part not in lookup for part, lookup in zip(key, lookups)):
+            return -1
+        return int(positions[tuple(lookup[part] for part, lookup in zip(key, lookups))])
+
+    def __contains__(self, key) -> bool:
+        return self.__position(key) >= 0
+
+    def __getitem__(self, key):
+        position = self.__position(key)
+        if position < 0:
+            raise KeyError(key)
+        return self.elements[position].item()
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
 class ModelMultiperiod(ABC):
 
-    def __init__(self, NAME_MODEL: str) -> None:
-        self.model = gb.Model(NAME_MODEL)
+    def __init__(self, NAME_MODEL: str, env: gb.Env = None) -> None:
+        self.model = gb.Model(NAME_MODEL, env=env)
+        self.env = env
 
-    def optimizeModel(self) -> str:
-        self.model.optimize()
+    def optimizeModel(self, callback=None) -> str:
+        self.model.optimize(callback)
         return self.model.Status
 
     def showModel(self):
@@ -28,14 +127,27 @@ class ModelMultiperiod(ABC):
 
 class ModelDeterministic(ModelMultiperiod):
     """
-    DocString
+    Deterministic multiperiod location model. formulation selects how Z is linked to X:
+        'disaggregated': one row Z[s,k,t] <= X[s,t] per pair and period, and W pinned to zero by K x T rows
+        'aggregated': one row sum_k Z[s,k,t] <= n_s X[s,t] per satellite and period (n_s its candidate clusters)
+        'lazy': no linking rows; Z[s,k,t] <= X[s,t] is added through a callback when an incumbent violates it
+    The last two fix W to zero through its upper bound.
 
+    lean=True saves memory on very large instances: variables and constraints get no names and, with
+    build_matrix, Z, W and the constraint families are IndexedMap views over integer index arrays instead of
+    dicts keyed by id tuples. Lookups by key still work, but each builds its key on the fly.
     """
+    FORMULATIONS = ('disaggregated', 'aggregated', 'lazy')
 
-    def __init__(self, periods: int, name_model="Deterministic-MultiPeriod"):
-        super().__init__(NAME_MODEL=name_model)
+    def __init__(self, periods: int, name_model="Deterministic-MultiPeriod", env: gb.Env = None,
+                 formulation: str = 'disaggregated', lean: bool = False):
+        super().__init__(NAME_MODEL=name_model, env=env)
+        if formulation not in self.FORMULATIONS:
+            raise ValueError(f'formulation must be one of {self.FORMULATIONS}, got {formulation!r}')
 
         self.PERIODS = periods
+        self.formulation = formulation
+        self.lean = lean
 
         # variables
         self.X = {}
@@ -43,54 +155,538 @@ class ModelDeterministic(ModelMultiperiod):
         self.W = {}
         self.Z = {}
 
+        # satellite/cluster pairs allowed to have a Z variable, None for all
+        self.candidates = None
+
+        # constraints by family, keyed like the variables
+        self.constraints = {}
+
+        # arrays the model was built from, used by update to patch it in place
+        self.data = {}
+
+        # last incumbent, used as MIP start by resolve
+        self.start = None
+
+        # solution arrays of solve_decomposition, read by get_results instead of the variables
+        self.solution = None
+
         # objetive & metrics
         self.results = {}
         self.metrics = {}
 
     def build(self, satellites: list[Satellite], clusters: list[Cluster], vehicles_required: dict[str, dict],
-              costs: dict[str, dict]) -> dict[str, float]:
+              costs: dict[str, dict], candidates: np.ndarray = None) -> dict[str, float]:
+        if candidates is not None and np.ndim(candidates) == 3:
+            raise ValueError('per-period (S, K, T) candidates are only supported by build_matrix')
         self.model.reset()
+        with measure('build', builder='build', model=self.model.ModelName, formulation=self.formulation) as total:
+            satellites, clusters = list(satellites), list(clusters)
+            self.__setCandidates(satellites, clusters, candidates)
+            self.__storeData(satellites, clusters, vehicles_required, costs)
+            self.metrics['families'] = {}
 
-        # variables
-        self.__addVariables(satellites, clusters)
-
-        # objective
-        self.__addObjective(satellites, clusters, costs)
-
-        # constraints
-        self.__addConstr_AllocationSatellite(satellites)
-        self.__addConstr_OperatingSatellite(satellites)
-        self.__addConstr_AssignClusterToSallite(satellites, clusters)
-        self.__addConstr_CapacitySatellite(satellites, clusters, vehicles_required)
-        self.__addConstr_DemandSatified(satellites, clusters)
-
-        print("1) add WALDO constraints")
-        self.__addConstr_VEHICLE_dc(clusters, vehicles_required_from_dc=vehicles_required['large'], cost_dc=costs)
-        self.__addConstr_VEHICLE_satellites(satellites, clusters,
-                                            vehicles_required_from_satellites=vehicles_required['small']
-                                            , cost_satellites=costs)
-
-        print('2) W to Zero')
-        self.__addConstr_Zero_W(clusters)
+            # variables
+            with self.__measureFamily('variables'):
+                self.__addVariables(satellites, clusters)
+
+            # objective
+            with self.__measureFamily('objective'):
+                self.__addObjective(satellites, clusters, costs)
+
+            # constraints
+            with self.__measureFamily('open'):
+                self.__addConstr_AllocationSatellite(satellites)
+            with self.__measureFamily('operating'):
+                self.__addConstr_OperatingSatellite(satellites)
+            with self.__measureFamily('assign'):
+                if self.formulation == 'disaggregated':
+                    self.__addConstr_AssignClusterToSallite(satellites, clusters)
+                elif self.formulation == 'aggregated':
+                    self.__addConstr_AssignAggregated(satellites, clusters)
+            with self.__measureFamily('capacity'):
+                self.__addConstr_CapacitySatellite(satellites, clusters, vehicles_required)
+            with self.__measureFamily('demand'):
+                self.__addConstr_DemandSatified(satellites, clusters)
+
+            with self.__measureFamily('waldo_dc'):
+                self.__addConstr_VEHICLE_dc(clusters, vehicles_required_from_dc=vehicles_required['large'],
+                                            cost_dc=costs)
+            with self.__measureFamily('waldo_satellite'):
+                self.__addConstr_VEHICLE_satellites(satellites, clusters,
+                                                    vehicles_required_from_satellites=vehicles_required['small']
+                                                    , cost_satellites=costs)
+
+            with self.__measureFamily('zero_W'):
+                if self.formulation == 'disaggregated':
+                    self.__addConstr_Zero_W(clusters)
+                else:
+                    self.model.setAttr('UB', list(self.W.values()), [0.0] * len(self.W))
+            self.model.update()
+            total.fields.update(self.__size())
+        return self.__buildMetrics(total)
+
+    def build_cached(self, cache: ModelCache, satellites: list[Satellite], clusters: list[Cluster],
+                     vehicles_required: dict[str, dict], costs: dict[str, dict], candidates: np.ndarray = None,
+                     builder: str = 'build_matrix', verify: bool = False) -> dict[str, float]:
+        """
+        build/build_matrix through a ModelCache. The inputs, periods and formulation are hashed; on a hit the
+        model file is read and the variable and constraint dicts are restored from the stored index maps (as
+        IndexedMaps for Z, W and the constraints of a lean model), so get_results, update and resolve work as after
+        a build. On a miss the model is built and stored. With
+        verify=True the model is always built and compared with the cached one, which is replaced when they
+        differ (metrics['cache']['stale']).
+        """
+        satellites, clusters = list(satellites), list(clusters)
+        key = cache.key_inputs('model', satellites, clusters, vehicles_required, costs, self.PERIODS, candidates,
+                               options={'formulation': self.formulation, 'lean': self.lean})
+        cached = cache.lookup(key)
+        if cached is not None and not verify:
+            with measure('build', builder='cache', model=self.model.ModelName, formulation=self.formulation) as total:
+                self.__setCandidates(satellites, clusters, candidates)
+                self.__storeData(satellites, clusters, vehicles_required, costs)
+                self.__readModel(*cached)
+                total.fields.update(self.__size())
+            self.metrics['cache'] = {'key': key, 'hit': True}
+            return self.__buildMetrics(total)
+
+        metrics = getattr(self, builder)(satellites, clusters, vehicles_required, costs, candidates=candidates)
+        fingerprint = self.__fingerprint()
+        stale = cached is not None and cached[1]['fingerprint'] != fingerprint
+        if cached is None or stale:
+            cache.save(key, self.model.write, self.__indexMaps(fingerprint))
+        self.metrics['cache'] = {'key': key, 'hit': False, 'stale': stale}
+        return metrics
+
+    def __fingerprint(self) -> str:
+        """Hash of the matrix, objective, bounds, types and right-hand sides of the built model."""
+        variables, constraints = self.model.getVars(), self.model.getConstrs()
+        matrix = self.model.getA().tocsr()
+        return digest(matrix.indptr, matrix.indices, matrix.data,
+                      *[np.array(self.model.getAttr(name, variables)) for name in ('Obj', 'LB', 'UB', 'VType')],
+                      *[np.array(self.model.getAttr(name, constraints)) for name in ('RHS', 'Sense')])
+
+    def __indexMaps(self, fingerprint: str) -> dict:
+        def entry(items: dict) -> dict:
+            keys = [list(key) if isinstance(key, tuple) else key for key in items.keys()]
+            return {'index': [item.index for item in items.values()], 'keys': keys}
+
+        return {'fingerprint': fingerprint,
+                'variables': dict([(family, entry(getattr(self, family))) for family in ('Y', 'X', 'Z', 'W')]),
+                'constraints': dict([(family, entry(constraints)) for family, constraints in self.constraints.items()])}
+
+    def __readModel(self, path: str, meta: dict) -> None:
+        """
+        Replaces self.model by the cached one, keeping the name and the parameters set so far. The file is read in
+        an environment of its own with OutputFlag=0, since reading logs to the console regardless of the model's
+        parameters.
+        """
+        name, output_flag = self.model.ModelName, self.model.Params.OutputFlag
+        quiet = gb.Env(empty=True)
+        quiet.setParam('OutputFlag', 0)
+        quiet.start()
+        with tempfile.TemporaryDirectory() as directory:
+            path_params = os.path.join(directory, 'model.prm')
+            self.model.write(path_params)
+            self.model.dispose()
+            self.model = gb.read(path, env=quiet)
+            self.model.read(path_params)
+        if self.model.Params.OutputFlag != output_flag:
+            self.model.Params.OutputFlag = output_flag
+        self.model.ModelName = name
+
+        def restore(entry: dict, items: list, fromlist=None, axes: list = None):
+            keys = [tuple(key) if isinstance(key, list) else key for key in entry['keys']]
+            selected = [items[i] for i in entry['index']]
+            if fromlist is None or not keys:
+                return dict(zip(keys, selected))
+            return IndexedMap.from_keys(fromlist(selected), keys, axes)
+
+        # Z and W on the build axes, which __indexZ relies on
+        satellite_ids, cluster_ids = list(self.data['satellite_index'].keys()), list(self.data['cluster_index'].keys())
+        axes = {'Z': [satellite_ids, cluster_ids, range(self.PERIODS)], 'W': [cluster_ids, range(self.PERIODS)]}
+        variables, constraints = self.model.getVars(), self.model.getConstrs()
+        for family, entry in meta['variables'].items():
+            setattr(self, family, restore(entry, variables, gb.MVar.fromlist if self.lean and family in axes else None,
+                                          axes.get(family)))
+        self.constraints = dict([(family, restore(entry, constraints, gb.MConstr.fromlist if self.lean else None))
+                                 for family, entry in meta['constraints'].items()])
+
+    def __name(self, name: str) -> str:
+        """name, or '' in lean mode, which stores no name (Gurobi reports its default C0/R0 names)."""
+        return '' if self.lean else name
+
+    def __size(self) -> dict[str, int]:
+        return {'constraints': self.model.NumConstrs, 'variables': self.model.NumVars, 'nonzeros': self.model.NumNZs}
+
+    @contextmanager
+    def __measureFamily(self, family: str):
+        """
+        Times one family of the legacy build. With metrics enabled the model is updated after the family to count
+        the rows, columns and nonzeros it added, which costs one extra update per family.
+        """
+        with measure('build.family', model=self.model.ModelName, family=family) as step:
+            counting = enabled()
+            if counting:
+                self.model.update()
+                before = self.__size()
+            yield step
+            if counting:
+                self.model.update()
+                after = self.__size()
+                step.fields.update(rows=after['constraints'] - before['constraints'],
+                                   columns=after['variables'] - before['variables'],
+                                   nonzeros=after['nonzeros'] - before['nonzeros'])
+        self.metrics['families'][family] = step.fields
+
+    def __buildMetrics(self, total: measure) -> dict[str, float]:
+        self.metrics['build'] = dict(total.fields, time_building=total.elapsed)
+        return dict({'time_building': total.elapsed}, **self.__size())
+
+    def build_matrix(self, satellites: list[Satellite], clusters: list[Cluster], vehicles_required: dict[str, dict],
+                     costs: dict[str, dict], candidates: np.ndarray = None) -> dict[str, float]:
+        """
+        Same model as build, assembled as sparse coefficient matrices and added one family at a time through the
+        matrix API. Variables keep the order of build (Y, X, Z, W) and the dicts Y, X, Z and W are filled with the
+        same keys, so get_results and any code reading them work unchanged. vehicles_required and costs accept
+        the legacy dicts as well as (S, K, T) / (K, T) arrays. candidates may also be an (S, K, T) mask, which
+        selects Z per period; a cluster and period with no candidate at all is then left unserved (its demand row
+        has right-hand side 0), which is how Presolve drops zero-demand periods.
+        """
+        with measure('build', builder='build_matrix', model=self.model.ModelName,
+                     formulation=self.formulation) as total:
+            self.__buildMatrix(satellites, clusters, vehicles_required, costs, candidates)
+            total.fields.update(self.__size())
+        return self.__buildMetrics(total)
+
+    def __buildMatrix(self, satellites: list[Satellite], clusters: list[Cluster], vehicles_required: dict[str, dict],
+                      costs: dict[str, dict], candidates: np.ndarray = None) -> None:
+        self.model.reset()
+        satellites, clusters = list(satellites), list(clusters)
+        self.__setCandidates(satellites, clusters, candidates)
+        self.__storeData(satellites, clusters, vehicles_required, costs)
+        self.metrics['families'] = {}
+        S, K, T = len(satellites), len(clusters), self.PERIODS
+        satellite_ids, cluster_ids, periods = [s.id for s in satellites], [k.id for k in clusters], range(T)
+
+        # data
+        keys_Y = [(s.id, q_id) for s in satellites for q_id in s.capacity.keys()]
+        y_satellite = np.array([i for i, s in enumerate(satellites) for _ in s.capacity.keys()], dtype=np.intp)
+        y_capacity = np.array([s.capacity[q_id] for s in satellites for q_id in s.capacity.keys()], dtype=float)
+        y_cost = np.array([s.costFixed[q_id] / 25 for s in satellites for q_id in s.capacity.keys()], dtype=float)
+        cost_operation = np.array([s.costOperation[:T] for s in satellites], dtype=float).reshape(S, T) / 25
+        demand, fleet_small, fleet_large = self.data['demand'], self.data['fleet_small'], self.data['fleet_large']
+        cost_satellite = values_to_array(costs['satellite'], [satellite_ids, cluster_ids, periods], 'total')
+        cost_dc = values_to_array(costs['dc'], [cluster_ids, periods], 'total')
+
+        # variables: one binary vector laid out as [Y | X | Z | W]
+        n_Y = len(keys_Y)
+        index_Y = np.arange(n_Y)
+        index_X = n_Y + np.arange(S * T).reshape(S, T)
+        mask = np.ones((S, K), dtype=bool) if candidates is None else np.asarray(candidates, dtype=bool)
+        # demand rows of the (k, t) left without candidates by a per-period mask get right-hand side 0
+        served = 1.0 if mask.ndim == 2 else mask.any(axis=0).T.ravel().astype(float)
+        mask = np.broadcast_to(mask.reshape(S, K, -1), (S, K, T))
+        n_Z = int(mask.sum())
+        index_Z = np.full((S, K, T), -1)
+        index_Z[mask] = n_Y + S * T + np.arange(n_Z)
+        index_W = n_Y + S * T + n_Z + np.arange(K * T).reshape(K, T)
+        n = n_Y + S * T + n_Z + K * T
+
+        objective = np.concatenate([y_cost, cost_operation.ravel(), cost_satellite[mask], cost_dc.ravel()])
+        upper = np.ones(n)
+        if self.formulation != 'disaggregated':
+            upper[index_W.ravel()] = 0.0
+        with measure('build.family', model=self.model.ModelName, family='variables', columns=n) as step:
+            variables = self.model.addMVar(n, ub=upper, vtype=GRB.BINARY, obj=objective,
+                                           name=None if self.lean else 'v')
+            self.model.ModelSense = GRB.MINIMIZE
+        self.metrics['families']['variables'] = step.fields
+
+        # (s, k, t) of every Z variable, in variable order
+        s_, k_, t_ = [axis[mask] for axis in np.meshgrid(np.arange(S), np.arange(K), np.arange(T), indexing='ij')]
+        index_Z = index_Z[mask]
+        fleet_small, demand_Z = fleet_small[mask], demand[k_, t_]
+        # rank of each (t, k, s) among the Z variables, i.e. its row in R_Assign
+        _, row_assign = np.unique((t_ * K + k_) * S + s_, return_inverse=True)
+        s_st, t_st = np.meshgrid(np.arange(S), np.arange(T), indexing='ij')
+        k_kt, t_kt = np.meshgrid(np.arange(K), np.arange(T), indexing='ij')
+        # Y entries repeated for every period, used by the (s, t) rows
+        t_y, y_ = np.repeat(np.arange(T), n_Y), np.tile(index_Y, T)
+        s_y = y_satellite[y_]
+
+        def add(blocks: list[tuple], keys: tuple, sense: str, rhs, name: str, family: str):
+            # keys: (index, axes) of the rows, see IndexedMap
+            index, axes = keys
+            with measure('build.family', model=self.model.ModelName, family=family) as step:
+                rows = np.concatenate([np.ravel(r) for r, _, _ in blocks])
+                cols = np.concatenate([np.ravel(c) for _, c, _ in blocks])
+                coefficients = np.concatenate([np.broadcast_to(v, np.shape(c)).ravel() for _, c, v in blocks])
+                matrix = sp.csr_matrix((coefficients, (rows, cols)), shape=(len(index), n))
+                matrix.eliminate_zeros()
+                constraints = self.model.addMConstr(matrix, variables, sense, np.full(len(index), rhs, dtype=float),
+                                                    name=None if self.lean else name)
+                self.constraints[family] = IndexedMap(constraints, index, axes)
+                step.fields.update(rows=len(index), nonzeros=int(matrix.nnz))
+                if enabled():
+                    step.fields['columns'] = int(np.unique(matrix.indices).size)
+            self.metrics['families'][family] = step.fields
+
+        # constraints, rows in the same order as build; keys are (id, t) positions, row t * S + s for (s, t)
+        periods = list(periods)
+        rows_ST, rows_KT = np.arange(S * T), np.arange(K * T)
+        keys_S = (np.arange(S), [satellite_ids])
+        keys_ST = (np.stack([rows_ST % S, rows_ST // S], axis=1), [satellite_ids, periods])
+        keys_KT = (np.stack([rows_KT % K, rows_KT // K], axis=1), [cluster_ids, periods])
+        keys_T = (np.arange(T), [periods])
+        # R_Assign rows in (t, k, s) order
+        code_assign = np.sort((t_ * K + k_) * S + s_)
+        keys_assign = (np.stack([code_assign % S, code_assign // S % K, code_assign // (S * K)], axis=1),
+                       [satellite_ids, cluster_ids, periods])
+        add([(y_satellite, index_Y, 1.0)], keys_S, GRB.LESS_EQUAL, 1, 'R_Open', 'open')
+        add([(t_st * S + s_st, index_X, 1.0), (t_y * S + s_y, y_, -1.0)], keys_ST, GRB.LESS_EQUAL, 0,
+            'R_Operating', 'operating')
+        if self.formulation == 'disaggregated':
+            add([(row_assign, index_Z, 1.0), (row_assign, index_X[s_, t_], -1.0)], keys_assign, GRB.LESS_EQUAL, 0,
+                'R_Assign', 'assign')
+        elif self.formulation == 'aggregated':
+            add([(t_ * S + s_, index_Z, 1.0), (t_st * S + s_st, index_X, -mask.sum(axis=1)[s_st, t_st])], keys_ST,
+                GRB.LESS_EQUAL, 0, 'R_Assign', 'assign')
+        add([(t_ * S + s_, index_Z, fleet_small), (t_y * S + s_y, y_, -y_capacity[y_])], keys_ST, GRB.LESS_EQUAL, 0,
+            'R_capacity', 'capacity')
+        add([(t_ * K + k_, index_Z, 1.0), (t_kt * K + k_kt, index_W, 1.0)], keys_KT, GRB.EQUAL, served,
+            'R_demand', 'demand')
+        add([(t_kt, index_W, demand - costs['min_items_dc'] * fleet_large)], keys_T, GRB.GREATER_EQUAL, 0,
+            'R_waldo', 'waldo_dc')
+        add([(t_ * S + s_, index_Z, demand_Z - costs['min_items_satellite'] * fleet_small)], keys_ST,
+            GRB.GREATER_EQUAL, 0, 'R_waldo_s', 'waldo_satellite')
+        if self.formulation == 'disaggregated':
+            add([(t_kt * K + k_kt, index_W, 1.0)], keys_KT, GRB.EQUAL, 0, 'R_zero_W', 'zero_W')
+
+        # variable maps with the keys used by build
+        self.Y = dict(zip(keys_Y, variables[:n_Y].tolist()))
+        self.X = dict(zip(product(satellite_ids, periods), variables[n_Y:n_Y + S * T].tolist()))
+        self.Z = IndexedMap(variables[n_Y + S * T:n_Y + S * T + n_Z],
+                            np.stack([s_, k_, t_], axis=1),
+                            [satellite_ids, cluster_ids, periods])
+        self.W = IndexedMap(variables[n_Y + S * T + n_Z:], np.stack([k_kt.ravel(), t_kt.ravel()], axis=1),
+                            [cluster_ids, periods])
         self.model.update()
-        return {'time_building': 1}
+        if not self.lean:
+            self.Z, self.W = dict(self.Z.items()), dict(self.W.items())
+            self.constraints = dict([(family, dict(constraints.items()))
+                                     for family, constraints in self.constraints.items()])
+
+    def __storeData(self, satellites: list[Satellite], clusters: list[Cluster], vehicles_required: dict[str, dict],
+                    costs: dict[str, dict]) -> None:
+        satellite_ids, cluster_ids, periods = [s.id for s in satellites], [k.id for k in clusters], range(self.PERIODS)
+        self.constraints = {}
+        self.start = None
+        self.solution = None
+        self.data = {
+            'satellite_index': dict([(id_s, i) for i, id_s in enumerate(satellite_ids)]),
+            'cluster_index': dict([(id_k, j) for j, id_k in enumerate(cluster_ids)]),
+            'demand': np.array([k.demandByPeriod[:self.PERIODS] for k in clusters],
+                               dtype=float).reshape(len(clusters), self.PERIODS),
+            # copies, since update_clusters writes to them
+            'fleet_small': np.array(values_to_array(vehicles_required['small'], [satellite_ids, cluster_ids, periods],
+                                                    'fleet_size'), dtype=float),
+            'fleet_large': np.array(values_to_array(vehicles_required['large'], [cluster_ids, periods], 'fleet_size'),
+                                    dtype=float),
+            'min_items_satellite': costs['min_items_satellite'],
+            'min_items_dc': costs['min_items_dc']
+        }
+
+    def __indexZ(self) -> np.ndarray:
+        """(n, 3) satellite/cluster/period indices of the Z variables, in the order of self.Z."""
+        if 'index_Z' not in self.data and isinstance(self.Z, IndexedMap):
+            self.data['index_Z'] = self.Z.index
+        if 'index_Z' not in self.data:
+            satellite_index, cluster_index = self.data['satellite_index'], self.data['cluster_index']
+            self.data['index_Z'] = np.array([
+                (satellite_index[s_id], cluster_index[k_id], t) for s_id, k_id, t in self.Z.keys()
+            ], dtype=np.intp).reshape(-1, 3)
+        return self.data['index_Z']
+
+    def __variablesZ(self, rows: np.ndarray) -> list:
+        """Z variables at the given positions of self.Z; a lean model takes them from its MVar directly."""
+        if isinstance(self.Z, IndexedMap):
+            return self.Z.elements[rows].tolist()
+        if 'variables_Z' not in self.data:
+            self.data['variables_Z'] = list(self.Z.values())
+        return [self.data['variables_Z'][n] for n in rows.tolist()]
+
+    def update(self, satellites: list[Satellite] = None, costs: dict[str, dict] = None) -> dict[str, int]:
+        """
+        Patches the built model in place instead of rebuilding it. costs (layout of build) sets the objective
+        coefficients of Z and W and, when min_items_satellite/min_items_dc changed, the WALDO coefficients.
+        satellites (same ids and capacity options as in build) sets the fixed and operating costs of Y and X and
+        the capacity coefficients. Returns the number of coefficients changed per family.
+        """
+        changed = {}
+        if costs is not None:
+            satellite_ids = list(self.data['satellite_index'].keys())
+            cluster_ids = list(self.data['cluster_index'].keys())
+            periods = range(self.PERIODS)
+            i, j, t = self.__indexZ().T
+            cost_satellite = values_to_array(costs['satellite'], [satellite_ids, cluster_ids, periods], 'total')
+            self.model.setAttr('Obj', list(self.Z.values()), cost_satellite[i, j, t].tolist())
+            cost_dc = values_to_array(costs['dc'], [cluster_ids, periods], 'total')
+            self.model.setAttr('Obj', list(self.W.values()), cost_dc.ravel().tolist())
+            changed['objective'] = len(self.Z) + len(self.W)
+
+            demand = self.data['demand']
+            if costs['min_items_satellite'] != self.data['min_items_satellite']:
+                coefficients = demand[j, t] - costs['min_items_satellite'] * self.data['fleet_small'][i, j, t]
+                for (s_id, _, period), variable, value in zip(self.Z.keys(), self.Z.values(), coefficients.tolist()):
+                    self.model.chgCoeff(self.constraints['waldo_satellite'][(s_id, period)], variable, value)
+                self.data['min_items_satellite'] = costs['min_items_satellite']
+                changed['waldo_satellite'] = len(self.Z)
+            if costs['min_items_dc'] != self.data['min_items_dc']:
+                coefficients = demand - costs['min_items_dc'] * self.data['fleet_large']
+                for (_, period), variable, value in zip(self.W.keys(), self.W.values(), coefficients.ravel().tolist()):
+                    self.model.chgCoeff(self.constraints['waldo_dc'][period], variable, value)
+                self.data['min_items_dc'] = costs['min_items_dc']
+                changed['waldo_dc'] = len(self.W)
+
+        if satellites is not None:
+            satellites = list(satellites)
+            self.model.setAttr('Obj', [self.Y[(s.id, q_id)] for s in satellites for q_id in s.capacity.keys()],
+                               [s.costFixed[q_id] / 25 for s in satellites for q_id in s.capacity.keys()])
+            self.model.setAttr('Obj', [self.X[(s.id, t)] for s in satellites for t in range(self.PERIODS)],
+                               [s.costOperation[t] / 25 for s in satellites for t in range(self.PERIODS)])
+            changed['objective'] = changed.get('objective', 0) + len(self.Y) + len(self.X)
+            for s in satellites:
+                for q_id in s.capacity.keys():
+                    for t in range(self.PERIODS):
+                        self.model.chgCoeff(self.constraints['capacity'][(s.id, t)], self.Y[(s.id, q_id)],
+                                            -s.capacity[q_id])
+            changed['capacity'] = len(self.Y) * self.PERIODS
+        self.model.update()
+        return changed
+
+    def update_clusters(self, clusters: np.ndarray, demand: np.ndarray, fleet_small: np.ndarray,
+                        fleet_large: np.ndarray, cost_satellite: np.ndarray, cost_dc: np.ndarray) -> dict[str, int]:
+        """
+        Patches the coefficients of the Z and W variables of the given cluster positions only: objective, capacity
+        rows and WALDO rows. demand, fleet_large and cost_dc are (n, T) and fleet_small and cost_satellite
+        (S, n, T), aligned on clusters. Returns the number of coefficients changed per family.
+        """
+        clusters = np.asarray(clusters, dtype=np.intp)
+        if clusters.size == 0:
+            return {}
+        position = np.full(len(self.data['cluster_index']), -1)
+        position[clusters] = np.arange(len(clusters))
+        self.data['demand'][clusters] = demand
+        self.data['fleet_small'][:, clusters] = fleet_small
+        self.data['fleet_large'][clusters] = fleet_large
+
+        # Z variables of the edited clusters, in the order of self.Z
+        index_Z = self.__indexZ()
+        rows = np.flatnonzero(position[index_Z[:, 1]] >= 0)
+        i, j, t = index_Z[rows].T
+        variables_Z = self.__variablesZ(rows)
+        satellite_ids, cluster_ids = list(self.data['satellite_index'].keys()), list(self.data['cluster_index'].keys())
+        keys_W = [(cluster_ids[n], period) for n in clusters.tolist() for period in range(self.PERIODS)]
+        variables_W = [self.W[key] for key in keys_W]
+
+        self.model.setAttr('Obj', variables_Z, cost_satellite[i, position[j], t].tolist())
+        self.model.setAttr('Obj', variables_W, np.asarray(cost_dc, dtype=float).ravel().tolist())
+        capacity = self.data['fleet_small'][i, j, t].tolist()
+        waldo_satellite = (self.data['demand'][j, t] - self.data['min_items_satellite'] *
+                           self.data['fleet_small'][i, j, t]).tolist()
+        # one row lookup per satellite and period touched
+        pairs, inverse = np.unique(np.stack([i, t], axis=1), axis=0, return_inverse=True)
+        keys = [(satellite_ids[n], period) for n, period in pairs.tolist()]
+        rows_capacity = [self.constraints['capacity'][key] for key in keys]
+        rows_waldo = [self.constraints['waldo_satellite'][key] for key in keys]
+        for n, variable, value_capacity, value_waldo in zip(inverse.ravel().tolist(), variables_Z, capacity,
+                                                            waldo_satellite):
+            self.model.chgCoeff(rows_capacity[n], variable, value_capacity)
+            self.model.chgCoeff(rows_waldo[n], variable, value_waldo)
+        waldo_dc = (self.data['demand'][clusters] - self.data['min_items_dc'] *
+                    self.data['fleet_large'][clusters]).ravel().tolist()
+        for (_, period), variable, value in zip(keys_W, variables_W, waldo_dc):
+            self.model.chgCoeff(self.constraints['waldo_dc'][period], variable, value)
+        self.model.update()
+        return {'objective': len(variables_Z) + len(variables_W), 'capacity': len(variables_Z),
+                'waldo_satellite': len(variables_Z), 'waldo_dc': len(variables_W)}
+
+    def resolve(self) -> str:
+        """Re-optimizes after update, starting from the previous incumbent."""
+        if self.start is not None:
+            variables, values = self.start
+            self.model.setAttr('Start', variables, values)
+        status = self.optimizeModel()
+        return status
+
+    def optimizeModel(self) -> str:
+        """
+        Solves the model. With metrics enabled, a SolveProgress callback records the incumbent, bound and gap over
+        time (chained with the lazy callback of formulation='lazy') and the solve summary goes to self.metrics.
+        """
+        callbacks = []
+        if self.formulation == 'lazy':
+            self.model.setParam('LazyConstraints', 1)
+            self.metrics['lazy_constraints'] = 0
+            callbacks.append(self.__callbackLazyAssign)
+        progress = SolveProgress(model=self.model.ModelName) if enabled() else None
+        with measure('solve', model=self.model.ModelName, formulation=self.formulation) as step:
+            status = super().optimizeModel(chain(*callbacks, progress))
+            step.fields.update(status=status, runtime=self.model.Runtime, solutions=self.model.SolCount,
+                               objective=self.model.ObjVal if self.model.SolCount > 0 else None,
+                               bound=self.model.ObjBound if self.model.IsMIP and self.model.SolCount > 0 else None,
+                               gap=self.model.MIPGap if self.model.IsMIP and self.model.SolCount > 0 else None,
+                               nodes=self.model.NodeCount if self.model.IsMIP else None,
+                               lazy_constraints=self.metrics.get('lazy_constraints'))
+        self.metrics['solve'] = step.fields
+        if progress is not None:
+            self.metrics['progress'] = progress.trajectory
+        if self.model.SolCount > 0:
+            variables = self.model.getVars()
+            self.start = variables, self.model.getAttr('X', variables)
+        return status
+
+    def __callbackLazyAssign(self, model: gb.Model, where: int) -> None:
+        """Adds Z[s,k,t] <= X[s,t] for every pair the new incumbent assigns to a satellite it does not operate."""
+        if where != GRB.Callback.MIPSOL:
+            return
+        if 'lazy_X' not in self.data:
+            i, _, t = self.__indexZ().T
+            self.data['lazy_X'] = i * self.PERIODS + t
+        variables_Z, variables_X, index_X = list(self.Z.values()), list(self.X.values()), self.data['lazy_X']
+        z, x = np.array(model.cbGetSolution(variables_Z)), np.array(model.cbGetSolution(variables_X))
+        violated = np.flatnonzero(z > x[index_X] + 1e-6)
+        for n in violated:
+            model.cbLazy(variables_Z[n] <= variables_X[index_X[n]])
+        self.metrics['lazy_constraints'] += len(violated)
+
+    def __setCandidates(self, satellites: list[Satellite], clusters: list[Cluster], candidates: np.ndarray) -> None:
+        if candidates is not None and np.ndim(candidates) == 3:
+            # pairs with a Z variable in some period
+            candidates = np.asarray(candidates, dtype=bool).any(axis=2)
+        self.candidates = None if candidates is None else set([
+            (satellites[i].id, clusters[j].id) for i, j in np.argwhere(candidates)
+        ])
+
+    def _is_candidate(self, s: Satellite, k: Cluster) -> bool:
+        return self.candidates is None or (s.id, k.id) in self.candidates
 
     def __addVariables(self, satellites: list[Satellite], clusters: list[Cluster]) -> None:
         self.Y = dict([
-            ((s.id, q_id), self.model.addVar(vtype=GRB.BINARY, name=f'Y_s{s.id}_q{q_id}')) for s in satellites for q_id
-            in s.capacity.keys()
+            ((s.id, q_id), self.model.addVar(vtype=GRB.BINARY, name=self.__name(f'Y_s{s.id}_q{q_id}')))
+            for s in satellites for q_id in s.capacity.keys()
         ])
         self.X = dict([
-            ((s.id, t), self.model.addVar(vtype=GRB.BINARY, name=f'X_s{s.id}_t{t}')) for s in satellites for t in
-            range(self.PERIODS)
+            ((s.id, t), self.model.addVar(vtype=GRB.BINARY, name=self.__name(f'X_s{s.id}_t{t}')))
+            for s in satellites for t in range(self.PERIODS)
         ])
         self.Z = dict(
-            [((s.id, k.id, t), self.model.addVar(vtype=GRB.BINARY, name=f'Z_s{s.id}_k{k.id}_t{t}')) for s in satellites
-             for k in clusters for t in range(self.PERIODS)]
+            [((s.id, k.id, t), self.model.addVar(vtype=GRB.BINARY, name=self.__name(f'Z_s{s.id}_k{k.id}_t{t}')))
+             for s in satellites for k in clusters if self._is_candidate(s, k) for t in range(self.PERIODS)]
         )
         self.W = dict([
-            ((k.id, t), self.model.addVar(vtype=GRB.BINARY, name=f'W_k{k.id}_t{t}')) for k in clusters for t in
-            range(self.PERIODS)
+            ((k.id, t), self.model.addVar(vtype=GRB.BINARY, name=self.__name(f'W_k{k.id}_t{t}')))
+            for k in clusters for t in range(self.PERIODS)
         ])
 
     def __addObjective(self, satellites: list[Satellite], clusters: list[Cluster], costs: dict[str, dict]):
@@ -104,7 +700,7 @@ class ModelDeterministic(ModelMultiperiod):
 
         cost_served_from_satellite = quicksum([
             costs['satellite'][(s.id, k.id, t)]['total'] * self.Z[(s.id, k.id, t)] for s in satellites for k in
-            clusters for t in
+            clusters if self._is_candidate(s, k) for t in
             range(self.PERIODS)
         ])
 
@@ -117,69 +713,88 @@ class ModelDeterministic(ModelMultiperiod):
         self.model.setObjective(cost_total, GRB.MINIMIZE)
 
     def __addConstr_AllocationSatellite(self, satellites: list[Satellite]):
+        self.constraints['open'] = {}
         for s in satellites:
             nameConstraint = f'R_Open_s{s.id}'
-            self.model.addConstr(
+            self.constraints['open'][s.id] = self.model.addConstr(
                 quicksum([
                     self.Y[(s.id, q_id)] for q_id in s.capacity.keys()
                 ]) <= 1
-                , name=nameConstraint
+                , name=self.__name(nameConstraint)
             )
 
     def __addConstr_OperatingSatellite(self, satellites: list[Satellite]):
+        self.constraints['operating'] = {}
         for t in range(self.PERIODS):
             for s in satellites:
                 nameConstraint = f'R_Operating_s{s.id}_{t}'
-                self.model.addConstr(
+                self.constraints['operating'][(s.id, t)] = self.model.addConstr(
                     self.X[(s.id, t)]
                     - quicksum([
                         self.Y[(s.id, q_id)] for q_id in s.capacity.keys()
                     ])
                     <= 0
-                    , name=nameConstraint
+                    , name=self.__name(nameConstraint)
                 )
 
     def __addConstr_AssignClusterToSallite(self, satellites: list[Satellite], clusters: list[Cluster]):
+        self.constraints['assign'] = {}
         for t in range(self.PERIODS):
             for k in clusters:
                 for s in satellites:
+                    if not self._is_candidate(s, k):
+                        continue
                     nameConstratint = f'R_Assign_s{s.id}_k{k.id}_t{t}'
-                    self.model.addConstr(
+                    self.constraints['assign'][(s.id, k.id, t)] = self.model.addConstr(
                         self.Z[(s.id, k.id, t)] - self.X[(s.id, t)]
                         <= 0
-                        , name=nameConstratint
+                        , name=self.__name(nameConstratint)
                     )
 
+    def __addConstr_AssignAggregated(self, satellites: list[Satellite], clusters: list[Cluster]):
+        self.constraints['assign'] = {}
+        for t in range(self.PERIODS):
+            for s in satellites:
+                assignable = [k for k in clusters if self._is_candidate(s, k)]
+                nameConstratint = f'R_Assign_s{s.id}_t{t}'
+                self.constraints['assign'][(s.id, t)] = self.model.addConstr(
+                    quicksum([self.Z[(s.id, k.id, t)] for k in assignable]) - len(assignable) * self.X[(s.id, t)]
+                    <= 0
+                    , name=self.__name(nameConstratint)
+                )
+
     def __addConstr_CapacitySatellite(self, satellites: list[Satellite], clusters: list[Cluster]
                                       , vehicles_required: dict[str, dict]):
+        self.constraints['capacity'] = {}
         for t in range(self.PERIODS):
             for s in satellites:
                 nameConstraint = f'R_capacity_s{s.id}_t{t}'
-                self.model.addConstr(
+                self.constraints['capacity'][(s.id, t)] = self.model.addConstr(
                     quicksum([
                         self.Z[(s.id, k.id, t)] * vehicles_required["small"][(s.id, k.id, t)]['fleet_size']
-                        for k in clusters
+                        for k in clusters if self._is_candidate(s, k)
                     ])
                     - quicksum([
                         self.Y[(s.id, q_id)] * s.capacity[q_id] for q_id in s.capacity.keys()
                     ])
                     <= 0
-                    , name=nameConstraint
+                    , name=self.__name(nameConstraint)
                 )
 
     def __addConstr_DemandSatified(self, satellites: list[Satellite], clusters: list[Cluster]):
+        self.constraints['demand'] = {}
         for t in range(self.PERIODS):
             for k in clusters:
                 nameConstraint = f'R_demand_k{k.id}_t{t}'
-                self.model.addConstr(
+                self.constraints['demand'][(k.id, t)] = self.model.addConstr(
                     quicksum([
-                        self.Z[(s.id, k.id, t)] for s in satellites
+                        self.Z[(s.id, k.id, t)] for s in satellites if self._is_candidate(s, k)
                     ])
                     + quicksum([
                         self.W[(k.id, t)]
                     ])
                     == 1
-                    , name=nameConstraint
+                    , name=self.__name(nameConstraint)
                 )
 
     # def __addConstr_VEHICLE_satellites(self, satellites: list[Satellite], clusters: list[Cluster]
@@ -204,19 +819,20 @@ class ModelDeterministic(ModelMultiperiod):
 
     def __addConstr_VEHICLE_satellites(self, satellites: list[Satellite], clusters: list[Cluster],
                                        vehicles_required_from_satellites, cost_satellites: dict[str, Any]):
+        self.constraints['waldo_satellite'] = {}
         for t in range(self.PERIODS):
             for s in satellites:
                 nameConstraint = f'R_waldo_s{s.id}_t{t}'
-                self.model.addConstr(
+                self.constraints['waldo_satellite'][(s.id, t)] = self.model.addConstr(
                     quicksum([
-                        k.demandByPeriod[t] * self.Z[(s.id, k.id, t)] for k in clusters
+                        k.demandByPeriod[t] * self.Z[(s.id, k.id, t)] for k in clusters if self._is_candidate(s, k)
                     ])
                     >= quicksum([
                         cost_satellites["min_items_satellite"] * vehicles_required_from_satellites[(s.id, k.id, t)][
                             "fleet_size"] * \
-                        self.Z[(s.id, k.id, t)] for k in clusters
+                        self.Z[(s.id, k.id, t)] for k in clusters if self._is_candidate(s, k)
                     ])
-                    , name=nameConstraint
+                    , name=self.__name(nameConstraint)
                 )
 
     # def __addConstr_VEHICLE_dc(self, clusters: list[Cluster], vehicles_required_from_dc, cost_dc: dict[str, Any]):
@@ -235,9 +851,10 @@ class ModelDeterministic(ModelMultiperiod):
     #        )
 
     def __addConstr_VEHICLE_dc(self, clusters: list[Cluster], vehicles_required_from_dc, cost_dc: dict[str, Any]):
+        self.constraints['waldo_dc'] = {}
         for t in range(self.PERIODS):
             nameConstraint = f'R_waldo_t{t}'
-            self.model.addConstr(
+            self.constraints['waldo_dc'][t] = self.model.addConstr(
                 quicksum([
                     k.demandByPeriod[t] * self.W[(k.id, t)] for k in clusters
                 ])
@@ -246,58 +863,463 @@ class ModelDeterministic(ModelMultiperiod):
                     cost_dc["min_items_dc"] * vehicles_required_from_dc[(k.id, t)]['fleet_size'] * \
                     self.W[(k.id, t)] for k in clusters
                 ])
-                , name=nameConstraint
+                , name=self.__name(nameConstraint)
             )
 
     def __addConstr_Zero_W(self, clusters: list[Cluster]):
+        self.constraints['zero_W'] = {}
         for t in range(self.PERIODS):
             for k in clusters:
-                self.model.addConstr(
+                self.constraints['zero_W'][(k.id, t)] = self.model.addConstr(
                     self.W[(k.id, t)] == 0
                 )
 
+    def solve_decomposition(self, satellites: list[Satellite], clusters: list[Cluster],
+                            vehicles_required: dict[str, dict], costs: dict[str, dict], candidates: np.ndarray = None,
+                            periods_per_block: int = 1, workers: int = None, threads: int = None, params: dict = None,
+                            max_iterations: int = 100, gap: float = 1e-4, time_limit: float = None,
+                            integer_recourse: bool = True) -> dict[str, Any]:
+        """
+        Benders decomposition on Y: the periods are coupled only through the satellite openings, so every group
+        of periods_per_block periods is an independent RecourseBlock solved on the worker pool, and the master
+        keeps Y plus one cut estimate per block. Nothing is added to self.model; get_results reads the best
+        solution found. Unmet demand is allowed at a penalty ('unserved' counts it, get_solution and get_results
+        list it under U), so an instance that is infeasible as a monolithic MIP still returns a solution. Returns
+        objective, lower bound, gap, time and the per-iteration trajectory.
+        """
+        satellites, clusters = list(satellites), list(clusters)
+        self.__setCandidates(satellites, clusters, candidates)
+        self.__storeData(satellites, clusters, vehicles_required, costs)
+        S, T = len(satellites), self.PERIODS
+        satellite_ids, cluster_ids, periods = [s.id for s in satellites], [k.id for k in clusters], range(T)
+        y_satellite = np.array([i for i, s in enumerate(satellites) for _ in s.capacity.keys()], dtype=np.intp)
+        y_capacity = np.array([s.capacity[q_id] for s in satellites for q_id in s.capacity.keys()], dtype=float)
+        y_cost = np.array([s.costFixed[q_id] / 25 for s in satellites for q_id in s.capacity.keys()], dtype=float)
+        cost_operation = np.array([s.costOperation[:T] for s in satellites], dtype=float).reshape(S, T) / 25
+        cost_satellite = values_to_array(costs['satellite'], [satellite_ids, cluster_ids, periods], 'total')
+        cost_dc = values_to_array(costs['dc'], [cluster_ids, periods], 'total')
+
+        blocks = []
+        for first in range(0, T, periods_per_block):
+            window = slice(first, min(first + periods_per_block, T))
+            data = {
+                'cost_operation': cost_operation[:, window],
+                'cost_satellite': cost_satellite[:, :, window],
+                'cost_dc': cost_dc[:, window],
+                'fleet_small': self.data['fleet_small'][:, :, window],
+                'fleet_large': self.data['fleet_large'][:, window],
+                'demand': self.data['demand'][:, window],
+                'min_items_satellite': costs['min_items_satellite'],
+                'min_items_dc': costs['min_items_dc'],
+                'candidates': candidates
+            }
+            blocks.append(RecourseBlock(data, y_satellite, y_capacity))
+
+        decomposition = BendersDecomposition(blocks, y_satellite, y_cost, workers=workers, threads=threads,
+                                             params=params)
+        result = decomposition.solve(max_iterations=max_iterations, gap=gap, time_limit=time_limit,
+                                     integer_recourse=integer_recourse)
+        if result['solutions'] is not None:
+            keys_Y = [(s.id, q_id) for s in satellites for q_id in s.capacity.keys()]
+            self.solution = {'Y': result['y'], 'keys_Y': keys_Y, 'objective': result['objective']}
+            for key in ('X', 'Z', 'W', 'U'):
+                self.solution[key] = np.concatenate([solution[key] for solution in result['solutions']], axis=-1)
+            result['unserved'] = int(np.sum(self.solution['U'] > 1e-6))
+        return dict([(key, value) for key, value in result.items() if key not in ('y', 'solutions')])
+
+    def solve_rolling(self, satellites: list[Satellite], clusters: list[Cluster], vehicles_required: dict[str, dict],
+                      costs: dict[str, dict], window: int, candidates: np.ndarray = None, plan: str = 'aggregated',
+                      y_mode: str = 'fix', penalty: float = 1.0, params: dict = None) -> dict[str, Any]:
+        """
+        Rolling-horizon solve for long horizons. Y is planned first, either on one period per block of an even split
+        of the horizon into `window` blocks (plan='aggregated': the block's peak-demand period carries the block's
+        summed costs) or on the first window (plan='window'). The periods are then solved `window` at a time by one
+        ModelDeterministic of `window` periods, built once and moved along the horizon with update_clusters and
+        re-solved from the previous incumbent; with an (S, K, T) candidates mask it is rebuilt whenever the
+        window's slice of the mask changes. With y_mode='fix' the windows keep the planned Y, falling back to
+        'penalty' for a window that is infeasible with it; with y_mode='penalty' a window may open more satellites
+        at penalty times their fixed cost, and an opened satellite stays open in later windows. Nothing is added
+        to self.model: get_results and get_solution read the stitched solution, whose objective is the full-horizon
+        cost. Returns objective, time and the plan and per-window details.
+        """
+        if plan not in ('aggregated', 'window'):
+            raise ValueError(f"plan must be 'aggregated' or 'window', got {plan!r}")
+        if y_mode not in ('fix', 'penalty'):
+            raise ValueError(f"y_mode must be 'fix' or 'penalty', got {y_mode!r}")
+        start_time = time.time()
+        satellites, clusters = list(satellites), list(clusters)
+        self.__setCandidates(satellites, clusters, candidates)
+        self.__storeData(satellites, clusters, vehicles_required, costs)
+        S, K, T = len(satellites), len(clusters), self.PERIODS
+        window = min(window, T)
+        satellite_ids, cluster_ids, periods = [s.id for s in satellites], [k.id for k in clusters], range(T)
+        keys_Y = [(s.id, q_id) for s in satellites for q_id in s.capacity.keys()]
+        y_cost = np.array([s.costFixed[q_id] / 25 for s in satellites for q_id in s.capacity.keys()], dtype=float)
+        cost_operation = np.array([s.costOperation[:T] for s in satellites], dtype=float).reshape(S, T) / 25
+        cost_satellite = values_to_array(costs['satellite'], [satellite_ids, cluster_ids, periods], 'total')
+        cost_dc = values_to_array(costs['dc'], [cluster_ids, periods], 'total')
+        demand, fleet_small, fleet_large = self.data['demand'], self.data['fleet_small'], self.data['fleet_large']
+        params = dict({'OutputFlag': 0}, **(params or {}))
+        report = {'plan': None, 'windows': []}
+
+        def build(selected: np.ndarray, cost_operation_selected: np.ndarray, cost_satellite_selected: np.ndarray,
+                  cost_dc_selected: np.ndarray, name: str) -> ModelDeterministic:
+            model = ModelDeterministic(periods=len(selected), name_model=name, env=self.env,
+                                       formulation=self.formulation, lean=self.lean)
+            model.setParams(params)
+            model.build_matrix(satellites, self.__clusterPeriods(clusters, selected),
+                               {'small': fleet_small[:, :, selected], 'large': fleet_large[:, selected]},
+                               dict(costs, satellite=cost_satellite_selected, dc=cost_dc_selected),
+                               candidates=candidates if np.ndim(candidates) != 3 else candidates[:, :, selected])
+            model.model.setAttr('Obj', list(model.X.values()), cost_operation_selected.ravel().tolist())
+            return model
+
+        planned = None
+        if plan == 'aggregated':
+            blocks = np.array_split(np.arange(T), window)
+            peaks = np.array([block[np.argmax(demand[:, block].sum(axis=0))] for block in blocks])
+            model = build(peaks,
+                          np.stack([cost_operation[:, block].sum(axis=1) for block in blocks], axis=1),
+                          np.stack([cost_satellite[:, :, block].sum(axis=2) for block in blocks], axis=2),
+                          np.stack([cost_dc[:, block].sum(axis=1) for block in blocks], axis=1),
+                          'Rolling-Plan')
+            status = model.optimizeModel()
+            if model.model.SolCount == 0:
+                raise RuntimeError(f'the aggregated plan model has no solution (status {status})')
+            planned = np.array(model.model.getAttr('X', list(model.Y.values()))) > 0.5
+            report['plan'] = {'periods': peaks.tolist(), 'status': status, 'runtime': model.model.Runtime,
+                              'opened': int(planned.sum())}
+            model.model.dispose()
+
+        X, Z, W = np.zeros((S, T), dtype=bool), np.zeros((S, K, T), dtype=bool), np.zeros((K, T), dtype=bool)
+        model, window_mask = None, None
+        for first in range(0, T, window):
+            # the last window is shifted back to keep `window` periods; only its new periods are kept
+            begin = min(first, T - window)
+            selected = np.arange(begin, begin + window)
+            # update_clusters cannot change which Z exist, so a per-period mask that differs needs a new model
+            previous_mask, window_mask = window_mask, None if np.ndim(candidates) != 3 else \
+                np.asarray(candidates, dtype=bool)[:, :, selected]
+            if model is not None and window_mask is not None and not np.array_equal(window_mask, previous_mask):
+                model.model.dispose()
+                model = None
+            if model is None:
+                model = build(selected, cost_operation[:, selected], cost_satellite[:, :, selected],
+                              cost_dc[:, selected], 'Rolling-Window')
+            else:
+                model.update_clusters(np.arange(K), demand[:, selected], fleet_small[:, :, selected],
+                                      fleet_large[:, selected], cost_satellite[:, :, selected], cost_dc[:, selected])
+                model.model.setAttr('Obj', list(model.X.values()), cost_operation[:, selected].ravel().tolist())
+            variables_Y = list(model.Y.values())
+            mode = None if planned is None else y_mode
+            while True:
+                if mode == 'fix':
+                    model.model.setAttr('LB', variables_Y, planned.astype(float).tolist())
+                    model.model.setAttr('UB', variables_Y, planned.astype(float).tolist())
+                elif mode == 'penalty':
+                    model.model.setAttr('LB', variables_Y, planned.astype(float).tolist())
+                    model.model.setAttr('UB', variables_Y, [1.0] * len(variables_Y))
+                    model.model.setAttr('Obj', variables_Y, np.where(planned, 0.0, penalty * y_cost).tolist())
+                status = model.resolve()
+                if model.model.SolCount > 0 or mode != 'fix':
+                    break
+                mode = 'penalty'
+            if model.model.SolCount == 0:
+                raise RuntimeError(f'window starting at period {begin} has no solution (status {status})')
+
+            solution = model.get_solution()
+            kept = solution['X'][:, 1] >= first - begin
+            X[solution['X'][kept, 0], begin + solution['X'][kept, 1]] = True
+            kept = solution['Z'][:, 2] >= first - begin
+            Z[solution['Z'][kept, 0], solution['Z'][kept, 1], begin + solution['Z'][kept, 2]] = True
+            kept = solution['W'][:, 1] >= first - begin
+            W[solution['W'][kept, 0], begin + solution['W'][kept, 1]] = True
+            opened = np.array(model.model.getAttr('X', variables_Y)) > 0.5
+            report['windows'].append({'first': first, 'begin': begin, 'status': status, 'y_mode': mode,
+                                      'runtime': model.model.Runtime, 'objective': model.model.ObjVal,
+                                      'opened': int((opened & ~planned).sum()) if planned is not None else
+                                      int(opened.sum())})
+            planned = opened if planned is None else planned | opened
+        model.model.dispose()
+
+        if np.ndim(candidates) == 3 and (Z & ~np.asarray(candidates, dtype=bool)).any():
+            raise RuntimeError('the stitched solution assigns pairs outside the candidates mask')
+        objective = float(y_cost[planned].sum() + cost_operation[X].sum() + cost_satellite[Z].sum() +
+                          cost_dc[W].sum())
+        self.solution = {'Y': planned, 'keys_Y': keys_Y, 'X': X, 'Z': Z, 'W': W, 'objective': objective}
+        report.update(objective=objective, time=time.time() - start_time,
+                      fallbacks=sum(1 for row in report['windows'] if row['y_mode'] == 'penalty' != y_mode))
+        self.metrics['rolling'] = report
+        return report
+
+    @staticmethod
+    def __clusterPeriods(clusters: list[Cluster], periods: np.ndarray) -> list[Cluster]:
+        """Copies of the clusters holding only the given periods of their per-period fields."""
+        return [Cluster(id_c=k.id
+                        , lon=k.lon
+                        , lat=k.lat
+                        , areaKm=k.areaKm
+                        , customersByPeriod=np.asarray(k.customersByPeriod, dtype=float)[periods]
+                        , demandByPeriod=np.asarray(k.demandByPeriod, dtype=float)[periods]
+                        , avgDrop=np.asarray(k.avgDrop, dtype=float)[periods]
+                        , speed_intra=k.speed_intra
+                        , avgStopDensity=np.asarray(k.avgStopDensity, dtype=float)[periods]
+                        , k=k.k)
+                for k in clusters]
+
+    def get_solution(self, threshold: float = 0.5) -> dict[str, np.ndarray]:
+        """
+        Selected variables as integer index arrays into satellite_ids, cluster_ids and option_ids (build order):
+        Y (n, 2) satellite/option, X (n, 2) satellite/period, Z (n, 3) satellite/cluster/period and W (n, 2)
+        cluster/period, plus the objective. After solve_decomposition, U (n, 2) cluster/period lists the demand left
+        unserved at a penalty, which is in neither Z nor W. Values are read with one getAttr call per family, so
+        the cost is linear in the number of variables and the result holds no solver or domain objects (see
+        save_results).
+        """
+        solution = self.__selected(threshold)
+        for key in ('satellite_ids', 'cluster_ids', 'option_ids'):
+            solution[key] = id_array(solution[key])
+        return solution
+
+    def __selected(self, threshold: float) -> dict:
+        satellite_index = self.data['satellite_index']
+        satellite_ids, cluster_ids = list(satellite_index.keys()), list(self.data['cluster_index'].keys())
+        S, K, T = len(satellite_ids), len(cluster_ids), self.PERIODS
+        unserved = {}
+        if self.solution is not None:
+            keys_Y, values_Y = self.solution['keys_Y'], self.solution['Y']
+            X = np.argwhere(self.solution['X'] > threshold)
+            Z = np.argwhere(self.solution['Z'] > threshold)
+            W = np.argwhere(self.solution['W'] > threshold)
+            objective = self.solution['objective']
+            if 'U' in self.solution:
+                unserved = {'U': np.argwhere(self.solution['U'] > 1e-6).astype(np.intp)}
+        else:
+            keys_Y = list(self.Y.keys())
+            values_Y = np.array(self.model.getAttr('X', list(self.Y.values())))
+            X = np.argwhere(np.array(self.model.getAttr('X', list(self.X.values()))).reshape(S, T) > threshold)
+            Z = self.__indexZ()[np.array(self.model.getAttr('X', list(self.Z.values()))) > threshold]
+            W = np.argwhere(np.array(self.model.getAttr('X', list(self.W.values()))).reshape(K, T) > threshold)
+            objective = self.model.ObjVal
+        option_ids = list(dict.fromkeys([q_id for _, q_id in keys_Y]))
+        option_index = dict([(q_id, q) for q, q_id in enumerate(option_ids)])
+        Y = np.array([(satellite_index[s_id], option_index[q_id]) for (s_id, q_id), value in zip(keys_Y, values_Y)
+                      if value > threshold], dtype=np.intp).reshape(-1, 2)
+        return dict({'Y': Y, 'X': X.astype(np.intp), 'Z': Z.astype(np.intp), 'W': W.astype(np.intp),
+                     'satellite_ids': satellite_ids, 'cluster_ids': cluster_ids, 'option_ids': option_ids,
+                     'periods': T, 'objective': float(objective)}, **unserved)
+
+    def save_results(self, path: str, threshold: float = 0.5) -> dict[str, np.ndarray]:
+        """Writes get_solution to path (.npz or .parquet), readable with results.load_results."""
+        solution = self.get_solution(threshold)
+        save_results(solution, path)
+        return solution
+
     # abstract method
     def get_results(self, satellites: list[Satellite], clusters: list[Cluster]) -> dict:
-        # variable Y
+        """
+        Solution in the original layout, built from get_solution: only the selected variables are visited. After
+        solve_decomposition, U holds per period the clusters left unserved, as in ModelStochastic.get_results.
+        """
+        solution = self.__selected(0.5)
+        satellites, clusters = list(satellites), list(clusters)
+        satellite_by_id = dict([(s.id, s) for s in satellites])
+        cluster_by_id = dict([(k.id, k) for k in clusters])
+        satellite_ids, cluster_ids, options = solution['satellite_ids'], solution['cluster_ids'], solution['option_ids']
+        # orders of the passed lists, so that the grouped values come out in the same order as before
+        satellite_order = dict([(s.id, i) for i, s in enumerate(satellites)])
+        cluster_order = dict([(k.id, j) for j, k in enumerate(clusters)])
+
         variable_Y = dict([
-            ((s.id, q_id), s) for s in satellites for q_id in s.capacity.keys() if self.Y[(s.id, q_id)].x > 0
+            ((satellite_ids[i], options[q]), satellite_by_id[satellite_ids[i]])
+            for i, q in sorted(solution['Y'].tolist(), key=lambda iq: satellite_order[satellite_ids[iq[0]]])
         ])
 
-        variable_X = dict([
-            (t, dict([
-                (s.id, s) for s in satellites if self.X[(s.id, t)].x > 0
-            ])) for t in range(self.PERIODS)
-        ])
+        variable_X = dict([(t, {}) for t in range(self.PERIODS)])
+        for i, t in sorted(solution['X'].tolist(), key=lambda it: satellite_order[satellite_ids[it[0]]]):
+            variable_X[t][satellite_ids[i]] = satellite_by_id[satellite_ids[i]]
 
-        variable_Z = dict([
-            (t, dict([
-                (s.id, [
-                    k for k in clusters if self.Z[(s.id, k.id, t)].x > 0
-                ]) for s in satellites
-            ])) for t in range(self.PERIODS)
-        ])
+        variable_Z = dict([(t, dict([(s.id, []) for s in satellites])) for t in range(self.PERIODS)])
+        for i, j, t in sorted(solution['Z'].tolist(), key=lambda ijt: cluster_order[cluster_ids[ijt[1]]]):
+            variable_Z[t][satellite_ids[i]].append(cluster_by_id[cluster_ids[j]])
 
-        variable_W = dict([
-            (t, [
-                k for k in clusters if self.W[(k.id, t)].x > 0
-            ]) for t in range(self.PERIODS)
-        ])
+        variable_W = dict([(t, []) for t in range(self.PERIODS)])
+        for j, t in sorted(solution['W'].tolist(), key=lambda jt: cluster_order[cluster_ids[jt[0]]]):
+            variable_W[t].append(cluster_by_id[cluster_ids[j]])
 
-        return {'Y': variable_Y,
-                'X': variable_X,
-                'Z': variable_Z,
-                'W': variable_W}
+        results = {'Y': variable_Y,
+                   'X': variable_X,
+                   'Z': variable_Z,
+                   'W': variable_W}
+        if 'U' in solution:
+            results['U'] = dict([(t, []) for t in range(self.PERIODS)])
+            for j, t in sorted(solution['U'].tolist(), key=lambda jt: cluster_order[cluster_ids[jt[0]]]):
+                results['U'][t].append(cluster_by_id[cluster_ids[j]])
+        return results
 
 
 class ModelStochastic(ModelMultiperiod):
     """
-    DocString
+    Two-stage sample-average model. The satellite openings Y are decided once; the operation X, assignment Z and
+    DC service W are decided per scenario, each scenario being a RecourseBlock weighted by its probability.
+    Unmet demand is priced at `penalty` so that every Y has a feasible second stage. The extensive form is built
+    by build and solved with optimizeModel; solve_decomposition solves the same model with Benders cuts on Y,
+    the scenarios being solved in parallel workers, and reports the bound/gap trajectory.
 
+    A scenario is a dict with 'vehicles_required' (layout of ModelDeterministic.build, dicts or arrays) and
+    optionally 'costs' ({'satellite': ..., 'dc': ...}), 'demand' (K, T) and 'probability' (default uniform).
     """
 
-    def __init__(self, NAME_MODEL: str) -> None:
-        super().__init__(NAME_MODEL)
+    def __init__(self, periods: int, name_model="Stochastic-MultiPeriod", env: gb.Env = None,
+                 serve_from_dc: bool = False, penalty: float = None) -> None:
+        super().__init__(name_model, env=env)
+        self.PERIODS = periods
+        self.env = env
+        self.serve_from_dc = serve_from_dc
+        self.penalty = penalty
+        self.Y = {}
+        self.blocks = []
+        self.data = {}
+        self.solutions = None
+        self.decomposition = None
+
+    def blocks_from_scenarios(self, satellites: list[Satellite], clusters: list[Cluster], scenarios: list[dict],
+                              costs: dict[str, dict]) -> list[RecourseBlock]:
+        satellites, clusters = list(satellites), list(clusters)
+        S, K, T = len(satellites), len(clusters), self.PERIODS
+        satellite_ids, cluster_ids, periods = [s.id for s in satellites], [k.id for k in clusters], range(T)
+        self.data = {
+            'keys_Y': [(s.id, q_id) for s in satellites for q_id in s.capacity.keys()],
+            'y_satellite': np.array([i for i, s in enumerate(satellites) for _ in s.capacity.keys()], dtype=np.intp),
+            'y_capacity': np.array([s.capacity[q_id] for s in satellites for q_id in s.capacity.keys()], dtype=float),
+            'y_cost': np.array([s.costFixed[q_id] / 25 for s in satellites for q_id in s.capacity.keys()],
+                               dtype=float)
+        }
+        cost_operation = np.array([s.costOperation[:T] for s in satellites], dtype=float).reshape(S, T) / 25
+        demand = np.array([k.demandByPeriod[:T] for k in clusters], dtype=float).reshape(K, T)
+
+        blocks = []
+        for scenario in scenarios:
+            scenario_costs = dict(costs, **scenario.get('costs', {}))
+            data = {
+                'cost_operation': cost_operation,
+                'cost_satellite': values_to_array(scenario_costs['satellite'], [satellite_ids, cluster_ids, periods],
+                                                  'total'),
+                'cost_dc': values_to_array(scenario_costs['dc'], [cluster_ids, periods], 'total'),
+                'fleet_small': values_to_array(scenario['vehicles_required']['small'],
+                                               [satellite_ids, cluster_ids, periods], 'fleet_size'),
+                'fleet_large': values_to_array(scenario['vehicles_required']['large'], [cluster_ids, periods],
+                                               'fleet_size'),
+                'demand': np.asarray(scenario.get('demand', demand), dtype=float),
+                'min_items_satellite': costs['min_items_satellite'],
+                'min_items_dc': costs['min_items_dc'],
+                'weight': scenario.get('probability', 1 / len(scenarios))
+            }
+            blocks.append(RecourseBlock(data, self.data['y_satellite'], self.data['y_capacity'],
+                                        serve_from_dc=self.serve_from_dc, penalty=self.penalty))
+        self.blocks = blocks
+        return blocks
+
+    @staticmethod
+    def scenarios_from_samples(fleet_satellites: dict[str, np.ndarray], fleet_dc: dict[str, np.ndarray],
+                               costs: dict[str, dict], demand: np.ndarray = None) -> list[dict]:
+        """
+        Equiprobable scenarios from the 'scenarios' tensors of ConfigStochastic ((R, S, K, T) and (R, K, T)).
+        With demand (the nominal (K, T) demand) the serving costs, which are per item, are scaled by the sampled
+        demand of each scenario ('demand_scenarios'); costs must then be arrays.
+        """
+        n = len(fleet_satellites['scenarios'])
+        scenarios = []
+        for r in range(n):
+            scenario = {'vehicles_required': {'small': fleet_satellites['scenarios'][r],
+                                              'large': fleet_dc['scenarios'][r]},
+                        'probability': 1 / n}
+            if demand is not None:
+                sampled = fleet_dc['demand_scenarios'][r]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    ratio = np.where(demand > 0, sampled / demand, 1.0)
+                scenario['demand'] = sampled
+                scenario['costs'] = {'satellite': costs['satellite'] * ratio[None, :, :], 'dc': costs['dc'] * ratio}
+            scenarios.append(scenario)
+        return scenarios
+
+    def build(self, satellites: list[Satellite], clusters: list[Cluster], scenarios: list[dict],
+              costs: dict[str, dict]) -> dict[str, float]:
+        """Extensive form: Y followed by the variables of every scenario, one row block per scenario."""
+        self.model.reset()
+        blocks = self.blocks_from_scenarios(satellites, clusters, scenarios, costs)
+        y_satellite, y_cost = self.data['y_satellite'], self.data['y_cost']
+        n_Y, n_S = len(y_satellite), len(list(satellites))
+        matrices = [block.matrices() for block in blocks]
+
+        open_one = sp.csr_matrix((np.ones(n_Y), (y_satellite, np.arange(n_Y))), shape=(n_S, n_Y))
+        rows = [[open_one] + [None] * len(blocks)]
+        for j, matrix in enumerate(matrices):
+            rows.append([matrix['B']] + [matrix['A'] if i == j else None for i in range(len(blocks))])
+        A = sp.bmat(rows, format='csr')
+        objective = np.concatenate([y_cost] + [block.weight * matrix['cost']
+                                               for block, matrix in zip(blocks, matrices)])
+        upper = np.concatenate([np.ones(n_Y)] + [matrix['upper'] for matrix in matrices])
+        vtype = np.concatenate([np.full(n_Y, GRB.BINARY)] + [
+            np.where(matrix['integer'], GRB.BINARY, GRB.CONTINUOUS) for matrix in matrices])
+        sense = np.concatenate([np.full(n_S, GRB.LESS_EQUAL)] + [matrix['sense'] for matrix in matrices])
+        rhs = np.concatenate([np.ones(n_S)] + [matrix['rhs'] for matrix in matrices])
+
+        self.variables = self.model.addMVar(A.shape[1], lb=0.0, ub=upper, obj=objective, vtype=vtype, name='v')
+        self.model.addMConstr(A, self.variables, sense, rhs, name='R')
+        self.model.ModelSense = GRB.MINIMIZE
+        self.model.update()
+        self.Y = dict(zip(self.data['keys_Y'], self.variables.tolist()[:n_Y]))
+        self.data['offsets'] = n_Y + np.cumsum([0] + [matrix['A'].shape[1] for matrix in matrices])
+        self.solutions = None
+        return {'variables': A.shape[1], 'constraints': A.shape[0], 'scenarios': len(blocks)}
+
+    def optimizeModel(self) -> str:
+        status = super().optimizeModel()
+        if self.model.SolCount > 0:
+            x = np.asarray(self.variables.X)
+            offsets = self.data['offsets']
+            self.data['y'] = np.round(x[:offsets[0]])
+            self.solutions = [block.split(x[offsets[j]:offsets[j + 1]]) for j, block in enumerate(self.blocks)]
+        return status
+
+    def solve_decomposition(self, satellites: list[Satellite], clusters: list[Cluster], scenarios: list[dict],
+                            costs: dict[str, dict], workers: int = None, threads: int = None, params: dict = None,
+                            max_iterations: int = 100, gap: float = 1e-4, time_limit: float = None,
+                            integer_recourse: bool = True) -> dict[str, Any]:
+        """
+        Benders decomposition of the same model (see BendersDecomposition). Returns the objective, lower bound,
+        gap, time and the per-iteration trajectory; get_results then reads the best solution found and raises a
+        RuntimeError when there is none.
+        """
+        blocks = self.blocks_from_scenarios(satellites, clusters, scenarios, costs)
+        self.decomposition = BendersDecomposition(blocks, self.data['y_satellite'], self.data['y_cost'],
+                                                  workers=workers, threads=threads, params=params, env=self.env)
+        result = self.decomposition.solve(max_iterations=max_iterations, gap=gap, time_limit=time_limit,
+                                          integer_recourse=integer_recourse)
+        self.data['y'] = result['y']
+        self.solutions = result['solutions']
+        return dict([(key, value) for key, value in result.items() if key not in ('y', 'solutions')])
 
     # abstract method
-    def get_results(self) -> dict:
-        pass
+    def get_results(self, satellites: list[Satellite], clusters: list[Cluster]) -> dict:
+        """Y as in ModelDeterministic.get_results and, per scenario, its X, Z, W and unserved clusters U."""
+        if self.solutions is None:
+            raise RuntimeError('no solution to read: the model was not solved or its solve found no incumbent')
+        satellites, clusters = list(satellites), list(clusters)
+        variable_Y = dict([
+            (key, satellites[i]) for key, i, y in zip(self.data['keys_Y'], self.data['y_satellite'], self.data['y'])
+            if y > 0.5
+        ])
+        scenarios = []
+        for solution in self.solutions:
+            X, Z, W, U = solution['X'] > 0.5, solution['Z'] > 0.5, solution['W'] > 0.5, solution['U'] > 1e-6
+            scenarios.append({
+                'X': dict([(t, dict([(s.id, s) for i, s in enumerate(satellites) if X[i, t]]))
+                           for t in range(self.PERIODS)]),
+                'Z': dict([(t, dict([(s.id, [k for j, k in enumerate(clusters) if Z[i, j, t]])
+                                     for i, s in enumerate(satellites)])) for t in range(self.PERIODS)]),
+                'W': dict([(t, [k for j, k in enumerate(clusters) if W[j, t]]) for t in range(self.PERIODS)]),
+                'U': dict([(t, [k for j, k in enumerate(clusters) if U[j, t]]) for t in range(self.PERIODS)])
+            })
+        return {'Y': variable_Y, 'scenarios': scenarios}
@@ -0,0 +1,138 @@
+import numpy as np
+from src.classes import Cluster, Satellite
+from src.models import ModelDeterministic, values_to_array
+from src.instrumentation import record
+
+
+class Presolve:
+    """
+    Structural reductions of an instance before ModelDeterministic.build_matrix, all on the fleet and cost arrays:
+        zero_demand: a cluster with no demand in a period gets no Z in that period and is not served; a cluster
+            with no demand in any period is removed
+        fleet: Z[s,k,t] is fixed to zero (not created) when the small-vehicle fleet it needs exceeds the largest
+            capacity option of s, since R_capacity could never hold
+        options: a capacity option is removed when another option of the same satellite has at least its capacity
+            for at most its fixed cost
+        satellites: a satellite left with no Z is removed
+    The model has no DC service (W is fixed to zero in every formulation), so a satellite more expensive than the
+    DC for every cluster is still needed and is only counted in the report ('worse_than_dc').
+    reduce returns the inputs of build_matrix for the reduced instance, candidates being an (S, K, T) mask; restore
+    maps get_solution of the reduced model back to the original indices and get_results gives the original
+    layout. What was eliminated is in self.report and recorded as a 'presolve' metrics event.
+    """
+
+    def __init__(self, zero_demand: bool = True, fleet: bool = True, options: bool = True,
+                 satellites: bool = True):
+        self.zero_demand = zero_demand
+        self.fleet = fleet
+        self.options = options
+        self.satellites = satellites
+        self.report = {}
+        self.original = None
+        self.satellite_index = None
+        self.cluster_index = None
+
+    def reduce(self, satellites: list[Satellite], clusters: list[Cluster], vehicles_required: dict[str, dict],
+               costs: dict[str, dict], periods: int, candidates: np.ndarray = None) -> dict:
+        satellites, clusters = list(satellites), list(clusters)
+        S, K, T = len(satellites), len(clusters), periods
+        satellite_ids, cluster_ids = [s.id for s in satellites], [k.id for k in clusters]
+        self.original = {'satellites': satellites, 'clusters': clusters,
+                         'option_ids': list(dict.fromkeys([q_id for s in satellites for q_id in s.capacity.keys()]))}
+        demand = np.array([k.demandByPeriod[:T] for k in clusters], dtype=float).reshape(K, T)
+        fleet_small = values_to_array(vehicles_required['small'], [satellite_ids, cluster_ids, range(T)], 'fleet_size')
+        fleet_large = values_to_array(vehicles_required['large'], [cluster_ids, range(T)], 'fleet_size')
+        cost_satellite = values_to_array(costs['satellite'], [satellite_ids, cluster_ids, range(T)], 'total')
+        cost_dc = values_to_array(costs['dc'], [cluster_ids, range(T)], 'total')
+        mask = np.ones((S, K, T), dtype=bool)
+        if candidates is not None:
+            mask &= np.asarray(candidates, dtype=bool).reshape(S, K, -1)
+        report = {'satellites': S, 'clusters': K, 'variables_Z': int(mask.sum())}
+
+        keep_clusters = np.ones(K, dtype=bool)
+        if self.zero_demand:
+            zero = demand <= 0
+            keep_clusters = ~zero.all(axis=1)
+            report['zero_demand_periods'] = int(zero[keep_clusters].sum())
+            report['clusters_removed'] = int(K - keep_clusters.sum())
+            mask &= ~zero[None, :, :]
+
+        if self.fleet:
+            largest = np.array([max(s.capacity.values(), default=0.0) for s in satellites], dtype=float)
+            infeasible = mask & (fleet_small > largest[:, None, None])
+            report['Z_fixed_fleet'] = int(infeasible.sum())
+            mask &= ~infeasible
+
+        reduced = satellites
+        if self.options:
+            reduced = [self.__collapseOptions(s) for s in satellites]
+            report['options_removed'] = sum(len(s.capacity) - len(r.capacity) for s, r in zip(satellites, reduced))
+
+        keep_satellites = np.ones(S, dtype=bool)
+        if self.satellites:
+            keep_satellites = mask.any(axis=(1, 2))
+            report['satellites_removed'] = int(S - keep_satellites.sum())
+        report['worse_than_dc'] = int(np.sum([np.all(cost_satellite[i][mask[i]] >= cost_dc[mask[i]])
+                                              for i in np.flatnonzero(mask.any(axis=(1, 2)))]))
+
+        rows, columns = np.flatnonzero(keep_satellites), np.flatnonzero(keep_clusters)
+        self.satellite_index, self.cluster_index = rows, columns
+        mask = mask[np.ix_(rows, columns)]
+        # demand left without any satellite: infeasible, as in the full model, since W is fixed to zero
+        report['unservable'] = int(np.sum((demand[columns] > 0) & ~mask.any(axis=0)))
+        report.update(satellites_kept=len(rows), clusters_kept=len(columns), variables_Z_kept=int(mask.sum()))
+        self.report = report
+        record('presolve', **report)
+        return {'satellites': [reduced[i] for i in rows.tolist()],
+                'clusters': [clusters[j] for j in columns.tolist()],
+                'vehicles_required': {'small': fleet_small[np.ix_(rows, columns)], 'large': fleet_large[columns]},
+                'costs': dict(costs, satellite=cost_satellite[np.ix_(rows, columns)], dc=cost_dc[columns]),
+                'candidates': mask}
+
+    @staticmethod
+    def __collapseOptions(s: Satellite) -> Satellite:
+        """Copy of s without its dominated capacity options; s itself when none is dominated."""
+        option_ids = list(s.capacity.keys())
+        capacity = np.array([s.capacity[q_id] for q_id in option_ids], dtype=float)
+        cost = np.array([s.costFixed[q_id] for q_id in option_ids], dtype=float)
+        # dominates[a, b]: option a has at least the capacity of b for at most its cost, strictly better or earlier
+        at_least = (capacity[:, None] >= capacity[None, :]) & (cost[:, None] <= cost[None, :])
+        better = (capacity[:, None] > capacity[None, :]) | (cost[:, None] < cost[None, :])
+        earlier = np.arange(len(option_ids))[:, None] < np.arange(len(option_ids))[None, :]
+        dominated = np.any(at_least & (better | earlier), axis=0)
+        if not dominated.any():
+            return s
+        kept = [q_id for q_id, drop in zip(option_ids, dominated.tolist()) if not drop]
+        return Satellite(id_s=s.id
+                         , lon=s.lon
+                         , lat=s.lat
+                         , distanceFromDC=s.distanceFromDC
+                         , durationFromDC=s.durationFromDC
+                         , durationInTrafficFromDC=s.durationInTrafficFromDC
+                         , costFixed=dict([(q_id, s.costFixed[q_id]) for q_id in kept])
+                         , costOperation=s.costOperation
+                         , costSourcing=s.costSourcing
+                         , capacity=dict([(q_id, s.capacity[q_id]) for q_id in kept])
+                         )
+
+    def restore(self, solution: dict) -> dict:
+        """get_solution of the reduced model with indices into the original satellites, clusters and options."""
+        if self.original is None:
+            raise RuntimeError('call reduce first')
+        rows, columns = self.satellite_index, self.cluster_index
+        option_ids = self.original['option_ids']
+        options = np.array([option_ids.index(q_id) for q_id in solution['option_ids'].tolist()], dtype=np.intp)
+        return dict(solution,
+                    Y=np.stack([rows[solution['Y'][:, 0]], options[solution['Y'][:, 1]]], axis=1),
+                    X=np.stack([rows[solution['X'][:, 0]], solution['X'][:, 1]], axis=1),
+                    Z=np.stack([rows[solution['Z'][:, 0]], columns[solution['Z'][:, 1]], solution['Z'][:, 2]], axis=1),
+                    W=np.stack([columns[solution['W'][:, 0]], solution['W'][:, 1]], axis=1),
+                    satellite_ids=np.asarray([s.id for s in self.original['satellites']]),
+                    cluster_ids=np.asarray([k.id for k in self.original['clusters']]),
+                    option_ids=np.asarray(option_ids))
+
+    def get_results(self, model: ModelDeterministic) -> dict:
+        """get_results of the reduced model over the original satellites and clusters; removed ones stay empty."""
+        if self.original is None:
+            raise RuntimeError('call reduce first')
+        return model.get_results(self.original['satellites'], self.original['clusters'])
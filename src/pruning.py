@@ -0,0 +1,138 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from gurobipy import GRB
+from src.classes import Cluster, Satellite, DistanceMatrix
+from src.models import ModelDeterministic, values_to_array
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def unit_vectors(lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """Points on the unit sphere; their chord distance is monotone in the great-circle distance."""
+    lon, lat = np.radians(np.asarray(lon, dtype=float)), np.radians(np.asarray(lat, dtype=float))
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+
+
+class CandidatePruning:
+    """
+    Selects the satellite/cluster pairs that get a Z variable in ModelDeterministic. A pair is kept when the
+    satellite is among the k_nearest of the cluster or within radius km of it; with dominance=n it is then
+    dropped when at least n kept satellites cost no more and need no more vehicles for the cluster in every period,
+    and are strictly better in some period (of two satellites tied in every period, the first one listed stays).
+    The nearest satellite of every cluster is always kept. prune returns an (S, K) boolean mask for
+    build/build_matrix(candidates=...) and leaves a summary in self.report.
+    """
+
+    def __init__(self, k_nearest: int = None, radius: float = None, dominance: int = None):
+        self.k_nearest = k_nearest
+        self.radius = radius
+        self.dominance = dominance
+        self.report = {}
+
+    @staticmethod
+    def distance_matrix(satellites: list[Satellite], clusters: list[Cluster], distances=None) -> np.ndarray:
+        """(S, K) distances: from the linehaul matrix when given (missing pairs are inf), else great-circle km."""
+        if distances is None:
+            chord = np.linalg.norm(unit_vectors([s.lon for s in satellites], [s.lat for s in satellites])[:, None, :]
+                                   - unit_vectors([k.lon for k in clusters], [k.lat for k in clusters])[None, :, :],
+                                   axis=2)
+            return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0))
+        if isinstance(distances, DistanceMatrix):
+            matrix = distances.take([s.id for s in satellites], [k.id for k in clusters], strict=False)
+        elif isinstance(distances, np.ndarray):
+            matrix = distances.astype(float)
+        else:
+            matrix = np.array([[distances.get((s.id, k.id), np.nan) for k in clusters] for s in satellites])
+        return np.where(np.isnan(matrix), np.inf, matrix)
+
+    def __nearest(self, satellites: list[Satellite], clusters: list[Cluster], n: int) -> np.ndarray:
+        """(K, n) indices of the n nearest satellites of every cluster through a KD-tree on lon/lat."""
+        tree = cKDTree(unit_vectors([s.lon for s in satellites], [s.lat for s in satellites]))
+        _, nearest = tree.query(unit_vectors([k.lon for k in clusters], [k.lat for k in clusters]), k=n)
+        return np.asarray(nearest).reshape(len(clusters), n)
+
+    def prune(self, satellites: list[Satellite], clusters: list[Cluster], distances=None,
+              vehicles_required: dict[str, dict] = None, costs: dict[str, dict] = None,
+              periods: int = None) -> np.ndarray:
+        satellites, clusters = list(satellites), list(clusters)
+        S, K = len(satellites), len(clusters)
+        columns = np.arange(K)
+
+        keep = np.zeros((S, K), dtype=bool)
+        if self.k_nearest is None and self.radius is None:
+            keep[:] = True
+        if distances is None and self.radius is None:
+            # lon/lat only and no radius: the KD-tree answers the k-nearest query without the full matrix
+            nearest = self.__nearest(satellites, clusters, min(self.k_nearest or 1, S))
+        else:
+            matrix = self.distance_matrix(satellites, clusters, distances)
+            nearest = np.argsort(matrix, axis=0)[:min(self.k_nearest or 1, S)].T
+            if self.radius is not None:
+                keep |= matrix <= self.radius
+        if self.k_nearest is not None:
+            keep[nearest.T, columns[None, :]] = True
+        nearest_one = np.zeros((S, K), dtype=bool)
+        nearest_one[nearest[:, 0], columns] = True
+        # the nearest satellite is added back below, so it never counts as removed
+        removed_spatial = int((~keep & ~nearest_one).sum())
+
+        removed_dominance = 0
+        if self.dominance is not None:
+            satellite_ids, cluster_ids = [s.id for s in satellites], [k.id for k in clusters]
+            cost = values_to_array(costs['satellite'], [satellite_ids, cluster_ids, range(periods)], 'total')
+            fleet = values_to_array(vehicles_required['small'], [satellite_ids, cluster_ids, range(periods)],
+                                    'fleet_size')
+            dominated = np.zeros((S, K), dtype=bool)
+            for k in range(K):
+                kept = np.flatnonzero(keep[:, k])
+                c, f = cost[kept, k, :], fleet[kept, k, :]
+                # better[i, j]: satellite j is no worse than satellite i for cluster k in every period, and strictly
+                # better in some period or, on an exact tie, listed first (so that one of two equal satellites stays)
+                at_least = np.all((c[None, :, :] <= c[:, None, :]) & (f[None, :, :] <= f[:, None, :]), axis=2)
+                strictly = np.any((c[None, :, :] < c[:, None, :]) | (f[None, :, :] < f[:, None, :]), axis=2)
+                earlier = np.arange(len(kept))[None, :] < np.arange(len(kept))[:, None]
+                better = at_least & (strictly | earlier)
+                dominated[kept[better.sum(axis=1) >= self.dominance], k] = True
+            removed_dominance = int((keep & dominated & ~nearest_one).sum())
+            keep &= ~dominated
+
+        keep |= nearest_one
+        self.report = {'pairs': S * K, 'kept': int(keep.sum()), 'removed': int(S * K - keep.sum()),
+                       'removed_spatial': removed_spatial, 'removed_dominance': removed_dominance}
+        if periods is not None:
+            # one Z variable and one R_Assign row per removed pair and period
+            self.report['variables_removed'] = self.report['removed'] * periods
+            self.report['constraints_removed'] = self.report['removed'] * periods
+        return keep
+
+    def verify(self, candidates: np.ndarray, satellites: list[Satellite], clusters: list[Cluster],
+               vehicles_required: dict[str, dict], costs: dict[str, dict], periods: int,
+               tolerance: float = 1e-6, params: dict = None) -> np.ndarray:
+        """
+        Safe mode: solves the LP relaxation of the full model and restores every dropped pair whose Z is positive
+        or has a reduced cost within tolerance of zero in some period, i.e. could still improve the LP bound.
+        """
+        satellites, clusters = list(satellites), list(clusters)
+        model = ModelDeterministic(periods=periods, name_model='Candidates-LP')
+        model.setParams(dict({'OutputFlag': 0}, **(params or {})))
+        model.build_matrix(satellites, clusters, vehicles_required, costs)
+        variables = model.model.getVars()
+        model.model.setAttr('VType', variables, [GRB.CONTINUOUS] * len(variables))
+        model.optimizeModel()
+
+        dropped = np.argwhere(~np.asarray(candidates, dtype=bool))
+        restored = np.asarray(candidates, dtype=bool).copy()
+        if model.model.Status == GRB.OPTIMAL and len(dropped) > 0:
+            z = [model.Z[(satellites[i].id, clusters[j].id, t)] for i, j in dropped for t in range(periods)]
+            value = np.array(model.model.getAttr('X', z)).reshape(len(dropped), periods)
+            reduced_cost = np.array(model.model.getAttr('RC', z)).reshape(len(dropped), periods)
+            needed = np.any((value > tolerance) | (reduced_cost <= tolerance), axis=1)
+            restored[dropped[needed, 0], dropped[needed, 1]] = True
+        self.report['lp_status'] = model.model.Status
+        self.report['restored'] = int(restored.sum() - np.sum(candidates))
+        self.report['kept'] = int(restored.sum())
+        self.report['removed'] = int(restored.size - restored.sum())
+        if 'variables_removed' in self.report:
+            self.report['variables_removed'] = self.report['removed'] * periods
+            self.report['constraints_removed'] = self.report['removed'] * periods
+        return restored
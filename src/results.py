@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+# index columns of every variable family in a solution
+COLUMNS = {'Y': ('satellite', 'option'), 'X': ('satellite', 'period'), 'Z': ('satellite', 'cluster', 'period'),
+           'W': ('cluster', 'period'), 'U': ('cluster', 'period')}
+
+
+def id_array(ids: list) -> np.ndarray:
+    """Ids as a plain numpy array; mixed or object ids are stored as strings so the file loads without pickle."""
+    array = np.asarray(ids)
+    return array.astype(str) if array.dtype == object else array
+
+
+def save_results(solution: dict, path: str) -> None:
+    """
+    Writes a solution of get_solution: .npz keeps one integer index array per family plus the id arrays and
+    the scalars; .parquet writes one long table with a family column (requires pyarrow or fastparquet). U is
+    only in solutions of solve_decomposition.
+    """
+    if path.endswith('.parquet'):
+        frames = []
+        for family, columns in COLUMNS.items():
+            if family not in solution:
+                continue
+            frame = pd.DataFrame(solution[family], columns=list(columns))
+            for column in columns:
+                ids = solution.get(f'{column}_ids')
+                if ids is not None:
+                    frame[column] = np.asarray(ids)[frame[column].to_numpy()]
+            frame.insert(0, 'family', family)
+            frames.append(frame)
+        table = pd.concat(frames, ignore_index=True)
+        table['period'] = table['period'].astype('Int64')
+        table.attrs = dict([(key, value) for key, value in solution.items() if np.isscalar(value)])
+        table.to_parquet(path, index=False)
+    else:
+        np.savez_compressed(path, **solution)
+
+
+def load_results(path: str) -> dict:
+    """Reads save_results output back: a dict of arrays (.npz) or the long table (.parquet)."""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    with np.load(path, allow_pickle=False) as file:
+        return dict([(key, file[key][()] if file[key].ndim == 0 else file[key]) for key in file.files])
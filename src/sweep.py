@@ -0,0 +1,206 @@
+import os
+import copy
+import json
+import time
+import traceback
+import multiprocessing
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import gurobipy as gb
+from src.models import ModelDeterministic
+from src.utils import ConfigDeterministic
+
+# read-only inputs and solver environment of the current worker process
+_shared = None
+_env = None
+# queue on which the worker announces every scenario it starts
+_started = None
+
+
+def _initialize(loader, shared, threads: int, started=None) -> None:
+    global _shared, _env, _started
+    _started = started
+    if loader is not None:
+        _shared = loader()
+    elif shared is not None:
+        _shared = shared
+    _env = gb.Env(empty=True)
+    _env.setParam('OutputFlag', 0)
+    _env.setParam('Threads', threads)
+    _env.start()
+
+
+def _run(task, scenario: dict) -> dict:
+    if _started is not None:
+        _started.put(scenario['id'])
+    start = time.time()
+    try:
+        result = task(_shared, scenario, _env)
+        return {'id': scenario['id'], 'scenario': scenario, 'status': 'ok', 'result': result,
+                'time': time.time() - start, 'pid': os.getpid()}
+    except Exception as error:
+        return {'id': scenario['id'], 'scenario': scenario, 'status': 'error', 'error': repr(error),
+                'traceback': traceback.format_exc(), 'time': time.time() - start, 'pid': os.getpid()}
+
+
+def solve_deterministic(shared: dict, scenario: dict, env: gb.Env) -> dict:
+    """
+    Default sweep task. shared holds 'satellites', 'clusters', 'vehicles' ({'small': Vehicle, 'large': Vehicle}),
+    'distances' ({'satellite': ..., 'dc': ...} linehaul distances), 'costs' (the legacy dicts of
+    ModelDeterministic.build or the arrays of CostDeterministic.build) and 'periods'. A scenario may override:
+        vehicles: {'small': {attribute: value}, 'large': {...}}, recomputing the fleet sizes
+        cost_multiplier: factor on the satellite and DC serving costs
+        capacity_multiplier: factor on every satellite capacity option
+        min_items_satellite / min_items_dc
+        params: Gurobi parameters, e.g. {'TimeLimit': 600, 'MIPGap': 0.01}
+    """
+    periods = shared['periods']
+    satellites, clusters = shared['satellites'], shared['clusters']
+
+    vehicles = dict(shared['vehicles'])
+    for key, overrides in scenario.get('vehicles', {}).items():
+        vehicle = copy.copy(vehicles[key])
+        for attribute, value in overrides.items():
+            setattr(vehicle, attribute, value)
+        vehicles[key] = vehicle
+    vehicles_required = shared.get('vehicles_required')
+    if vehicles_required is None or 'vehicles' in scenario:
+        config = ConfigDeterministic()
+        vehicles_required = {
+            'small': config.calculate_fleet_size_tensor_from_satellites(satellites, clusters, vehicles['small'],
+                                                                        periods, shared['distances']['satellite']),
+            'large': config.calculate_fleet_size_tensor_from_dc(clusters, vehicles['large'], periods,
+                                                                shared['distances']['dc'])
+        }
+
+    costs = dict(shared['costs'])
+    multiplier = scenario.get('cost_multiplier', 1.0)
+    if multiplier != 1.0:
+        for key in ('satellite', 'dc'):
+            if isinstance(costs[key], dict) and isinstance(costs[key].get('total'), np.ndarray):
+                costs[key] = dict(costs[key], total=costs[key]['total'] * multiplier)
+            elif isinstance(costs[key], dict):
+                costs[key] = dict([(index, {'total': value['total'] * multiplier})
+                                   for index, value in costs[key].items()])
+            else:
+                costs[key] = costs[key] * multiplier
+    for key in ('min_items_satellite', 'min_items_dc'):
+        costs[key] = scenario.get(key, costs[key])
+
+    multiplier = scenario.get('capacity_multiplier', 1.0)
+    if multiplier != 1.0:
+        satellites = [copy.copy(s) for s in satellites]
+        for s in satellites:
+            s.capacity = dict([(q_id, value * multiplier) for q_id, value in s.capacity.items()])
+
+    model = ModelDeterministic(periods=periods, env=env)
+    model.setParams(scenario.get('params', {}))
+    model.build_matrix(satellites, clusters, vehicles_required, costs)
+    status = model.optimizeModel()
+    result = {'status': status, 'runtime': model.model.Runtime, 'solutions': model.model.SolCount}
+    if model.model.SolCount > 0:
+        result.update({'objective': model.model.ObjVal, 'bound': model.model.ObjBound, 'gap': model.model.MIPGap,
+                       'open': [key for key, variable in model.Y.items() if variable.X > 0.5]})
+    model.model.dispose()
+    return result
+
+
+class SweepRunner:
+    """
+    Runs a task over many scenarios on a process pool. Every worker opens its own Gurobi environment, and the
+    thread budget is split so that workers x Threads does not exceed it. Large inputs reach the workers once:
+    either through loader(), called in each worker (e.g. reading an InputCache, whose arrays are memory-mapped
+    and shared through the page cache), or through shared, inherited copy-on-write on platforms that fork.
+    Each finished scenario is appended to the output JSONL file right away; scenarios already in the file are
+    skipped, so a sweep can be restarted after a crash. A worker that dies takes its pool down: the pool is
+    restarted for the remaining scenarios. Only the scenarios that had started when it broke count an attempt and
+    are retried up to max_attempts times; queued ones go back to the pool as they were.
+    """
+
+    def __init__(self, task=solve_deterministic, loader=None, shared=None, workers: int = None,
+                 threads: int = None, output: str = 'sweep.jsonl', max_attempts: int = 2):
+        self.task = task
+        self.loader = loader
+        self.shared = shared
+        self.workers = workers
+        self.threads = threads or os.cpu_count()
+        self.output = output
+        self.max_attempts = max_attempts
+
+    @staticmethod
+    def grid(**axes) -> list[dict]:
+        """Cartesian product of the given axes, e.g. grid(cost_multiplier=[0.9, 1.1], min_items_dc=[200, 290])."""
+        keys = list(axes.keys())
+        return [dict(zip(keys, values)) for values in product(*axes.values())]
+
+    def thread_budget(self, n_scenarios: int) -> tuple[int, int]:
+        workers = max(1, min(self.workers or self.threads, self.threads, n_scenarios))
+        return workers, max(1, self.threads // workers)
+
+    def finished(self) -> set:
+        if not os.path.exists(self.output):
+            return set()
+        with open(self.output) as file:
+            return set(json.loads(line)['id'] for line in file if line.strip())
+
+    def run(self, scenarios: list[dict]) -> list[dict]:
+        scenarios = [dict({'id': i}, **scenario) for i, scenario in enumerate(scenarios)]
+        done = self.finished()
+        pending = dict([(scenario['id'], scenario) for scenario in scenarios if scenario['id'] not in done])
+        attempts = dict([(id_scenario, 0) for id_scenario in pending])
+        results = []
+
+        fork = 'fork' in multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if fork else None)
+        global _shared
+        while pending:
+            workers, threads = self.thread_budget(len(pending))
+            if fork:
+                # inherited by the forked workers instead of being pickled
+                _shared = self.shared
+            # SimpleQueue writes synchronously, so a start is seen even when the worker dies right after it
+            started, running = context.SimpleQueue(), set()
+            initargs = (self.loader, None if fork else self.shared, threads, started)
+            try:
+                with ProcessPoolExecutor(workers, mp_context=context, initializer=_initialize,
+                                         initargs=initargs) as pool:
+                    futures = {}
+                    for id_scenario, scenario in pending.items():
+                        futures[pool.submit(_run, self.task, scenario)] = id_scenario
+                    for future in as_completed(futures):
+                        # drained as results come in, so that the pipe never fills up and blocks the workers
+                        self.__drain(started, running)
+                        record = future.result()
+                        running.discard(futures[future])
+                        record['threads'] = threads
+                        self.__write(record)
+                        results.append(record)
+                        pending.pop(futures[future])
+            except BrokenProcessPool:
+                self.__drain(started, running)
+                running &= set(pending)
+                # no scenario started (e.g. the initializer failed): count the attempt for all of them
+                for id_scenario in running or set(pending):
+                    attempts[id_scenario] += 1
+                for id_scenario in [key for key, value in attempts.items() if key in pending
+                                    and value >= self.max_attempts]:
+                    record = {'id': id_scenario, 'scenario': pending.pop(id_scenario), 'status': 'crashed',
+                              'error': 'worker process terminated abruptly'}
+                    self.__write(record)
+                    results.append(record)
+            finally:
+                _shared = None
+                started.close()
+        return results
+
+    @staticmethod
+    def __drain(started, running: set) -> None:
+        while not started.empty():
+            running.add(started.get())
+
+    def __write(self, record: dict) -> None:
+        with open(self.output, 'a') as file:
+            file.write(json.dumps(record, default=str) + '\n')
+            file.flush()
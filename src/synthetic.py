@@ -0,0 +1,191 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from src.classes import Vehicle
+
+EARTH_RADIUS_KM = 6371.0
+# La Paz, as in application.ipynb
+CENTER = (-16.501457, -68.149887)
+LOCATION_DC = (-16.5354544, -68.1958506)
+
+
+def haversine(lon_a: np.ndarray, lat_a: np.ndarray, lon_b: np.ndarray, lat_b: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km, broadcasting over its arguments."""
+    lon_a, lat_a, lon_b, lat_b = [np.radians(np.asarray(x, dtype=float)) for x in (lon_a, lat_a, lon_b, lat_b)]
+    a = np.sin((lat_b - lat_a) / 2) ** 2 + np.cos(lat_a) * np.cos(lat_b) * np.sin((lon_b - lon_a) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def hexagon_centers(n: int, edge_km: float) -> np.ndarray:
+    """(n, 2) axial coordinates of the first n cells of a hexagonal grid, in rings around the origin."""
+    directions = [(1, 0), (1, -1), (0, -1), (-1, 0), (-1, 1), (0, 1)]
+    cells, ring = [(0, 0)], 1
+    while len(cells) < n:
+        q, r = -ring, ring
+        for dq, dr in directions:
+            for _ in range(ring):
+                cells.append((q, r))
+                q, r = q + dq, r + dr
+        ring += 1
+    return np.array(cells[:n], dtype=float)
+
+
+class SyntheticInstance:
+    """
+    Random instance in the layout of the input CSVs read by LoadingData: satellites, H3-like hexagonal clusters
+    (resolution-8-sized cells in rings around the city center), satellite-cluster and DC-cluster distance
+    matrices, and the vehicles of application.ipynb. Road distances are great-circle distances times a random
+    circuity factor; drop is the range of items per customer. Satellite capacity options are scaled to the
+    generated demand so that the instance is feasible for ModelDeterministic when min_items_satellite and
+    min_items_dc stay below the loads of MIN_ITEMS. The same seed gives the same instance.
+    """
+    EDGE_KM = 0.461
+    OPTIONS = {'small': 0.5, 'medium': 1.0, 'large': 1.6}
+    # WALDO thresholds below the items per vehicle of the default drop range
+    MIN_ITEMS = {'satellite': 40, 'dc': 30}
+
+    def __init__(self, n_satellites: int, n_clusters: int, periods: int, seed: int = None,
+                 center: tuple[float, float] = CENTER, location_dc: tuple[float, float] = LOCATION_DC,
+                 demand_mean: float = 60.0, demand_cv: float = 0.6, seasonality: float = 0.15,
+                 drop: tuple[float, float] = (15.0, 40.0), circuity: float = 1.35, speed_kmh: float = 25.0):
+        self.S, self.K, self.T = n_satellites, n_clusters, periods
+        self.rng = np.random.default_rng(seed)
+        self.center = center
+        self.location_dc = location_dc
+        self.demand_mean = demand_mean
+        self.demand_cv = demand_cv
+        self.seasonality = seasonality
+        self.drop = drop
+        self.circuity = circuity
+        self.speed_kmh = speed_kmh
+        self.__generate()
+
+    def __offset(self, x_km: np.ndarray, y_km: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """lon/lat of points x_km east and y_km north of the center."""
+        lat0, lon0 = self.center
+        lat = lat0 + np.degrees(y_km / EARTH_RADIUS_KM)
+        lon = lon0 + np.degrees(x_km / (EARTH_RADIUS_KM * np.cos(np.radians(lat0))))
+        return lon, lat
+
+    def __road(self, distance_km: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Road distance (m), duration and duration in traffic (s) from great-circle km."""
+        road = distance_km * self.circuity * self.rng.uniform(0.9, 1.2, distance_km.shape) + 0.2
+        duration = road / self.speed_kmh * 3600
+        return road * 1000, duration, duration * self.rng.uniform(1.1, 1.8, distance_km.shape)
+
+    def __generate(self) -> None:
+        rng, S, K, T = self.rng, self.S, self.K, self.T
+
+        # clusters: hexagonal cells around the center, demand with a period profile shared by all clusters
+        axial = hexagon_centers(K, self.EDGE_KM)
+        x = self.EDGE_KM * np.sqrt(3) * (axial[:, 0] + axial[:, 1] / 2)
+        y = self.EDGE_KM * 1.5 * axial[:, 1]
+        self.cluster_lon, self.cluster_lat = self.__offset(x, y)
+        self.cluster_ids = [f'88{0x2b2a0000000 + i:011x}ff' for i in range(K)]
+        self.area = np.full(K, 3 * np.sqrt(3) / 2 * self.EDGE_KM ** 2) * rng.uniform(0.95, 1.05, K)
+        sigma = np.sqrt(np.log1p(self.demand_cv ** 2))
+        base = self.demand_mean * np.exp(rng.normal(-sigma ** 2 / 2, sigma, K))
+        profile = 1 + self.seasonality * np.sin(2 * np.pi * np.arange(T) / max(T, 1)) + rng.normal(0, 0.05, T)
+        self.demand = np.maximum(base[:, None] * profile[None, :] * rng.uniform(0.9, 1.1, (K, T)), 1.0)
+        self.customers = np.maximum(self.demand / rng.uniform(*self.drop, (K, 1)), 1.0)
+        self.avg_drop = self.demand / self.customers
+        self.stop_density = self.customers / self.area[:, None]
+        self.speed_intra = {'small': rng.uniform(1.2, 2.0, K), 'large': rng.uniform(0.9, 1.4, K)}
+
+        # satellites: uniform in the disc covered by the clusters
+        radius = max(np.hypot(x, y).max(), self.EDGE_KM)
+        angle, distance = rng.uniform(0, 2 * np.pi, S), radius * np.sqrt(rng.uniform(0, 1, S))
+        self.satellite_lon, self.satellite_lat = self.__offset(distance * np.cos(angle), distance * np.sin(angle))
+        self.satellite_ids = [f'SAT-{i:04d}' for i in range(S)]
+        # capacity in vehicles: enough for the peak demand when every satellite opens its medium option, a route
+        # carrying at least one drop of the smallest size
+        peak_vehicles = self.demand.sum(axis=0).max() / self.drop[0]
+        base_capacity = max(np.ceil(peak_vehicles / max(S, 1)), 2.0)
+        self.capacity = dict([(q_id, np.ceil(base_capacity * factor * rng.uniform(0.9, 1.1, S)))
+                              for q_id, factor in self.OPTIONS.items()])
+        self.cost_fixed = dict([(q_id, 1500 * factor ** 0.8 * rng.uniform(0.8, 1.2, S))
+                                for q_id, factor in self.OPTIONS.items()])
+        self.cost_operation = rng.uniform(20, 60, (S, 1)) * rng.uniform(0.9, 1.1, (S, T))
+
+        dc_lat, dc_lon = self.location_dc
+        self.satellite_from_dc = self.__road(haversine(dc_lon, dc_lat, self.satellite_lon, self.satellite_lat))
+        self.matrix_satellites = self.__road(haversine(self.satellite_lon[:, None], self.satellite_lat[:, None],
+                                                       self.cluster_lon[None, :], self.cluster_lat[None, :]))
+        self.matrix_dc = self.__road(haversine(dc_lon, dc_lat, self.cluster_lon, self.cluster_lat))
+
+    @staticmethod
+    def __pipe(matrix: np.ndarray) -> list[str]:
+        return ['|'.join(repr(float(value)) for value in row) for row in matrix]
+
+    def satellites_frame(self) -> pd.DataFrame:
+        options = list(self.OPTIONS.keys())
+        distance, duration, traffic = self.satellite_from_dc
+        return pd.DataFrame({
+            'nombre': self.satellite_ids,
+            'longitud': self.satellite_lon,
+            'latitud': self.satellite_lat,
+            'distance.value': distance,
+            'duration.value': duration,
+            'duration_in_traffic.value': traffic,
+            'costFixed': [json.dumps(dict([(q_id, float(self.cost_fixed[q_id][i])) for q_id in options]))
+                          for i in range(self.S)],
+            'costOperation': self.__pipe(self.cost_operation),
+            'costSourcing': np.full(self.S, 0.389),
+            'capacity': [json.dumps(dict([(q_id, float(self.capacity[q_id][i])) for q_id in options]))
+                         for i in range(self.S)]
+        })
+
+    def clusters_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            'id_cluster': self.cluster_ids,
+            'lon': self.cluster_lon,
+            'lat': self.cluster_lat,
+            'areakm2': self.area,
+            'avg_customers': self.__pipe(self.customers),
+            'demandByPeriod': self.__pipe(self.demand),
+            'avgDrop': self.__pipe(self.avg_drop),
+            'intra_stop_speed': [json.dumps({'small': float(small), 'large': float(large)})
+                                 for small, large in zip(self.speed_intra['small'], self.speed_intra['large'])],
+            'avgStopDensity': self.__pipe(self.stop_density)
+        })
+
+    def matrix_satellites_frame(self) -> pd.DataFrame:
+        distance, duration, traffic = self.matrix_satellites
+        return pd.DataFrame({
+            'Satelite': np.repeat(self.satellite_ids, self.K),
+            'h3_address': np.tile(self.cluster_ids, self.S),
+            'distance.value': distance.ravel(),
+            'duration.value': duration.ravel(),
+            'duration_in_traffic.value': traffic.ravel()
+        })
+
+    def matrix_dc_frame(self) -> pd.DataFrame:
+        distance, duration, traffic = self.matrix_dc
+        return pd.DataFrame({'h3_address': self.cluster_ids, 'distance': distance, 'duration': duration,
+                             'duration_in_traffic': traffic})
+
+    def write(self, directory: str) -> dict[str, str]:
+        """Writes the four CSVs to directory; returns their paths, keyed like the LoadingData arguments."""
+        os.makedirs(directory, exist_ok=True)
+        paths = {
+            'satellites': os.path.join(directory, 'satellites.csv'),
+            'clusters': os.path.join(directory, 'clusters.csv'),
+            'matrix_satellites': os.path.join(directory, 'matrix_satellites.csv'),
+            'matrix_dc': os.path.join(directory, 'matrix_dc.csv')
+        }
+        self.satellites_frame().to_csv(paths['satellites'], index=False)
+        self.clusters_frame().to_csv(paths['clusters'], index=False)
+        self.matrix_satellites_frame().to_csv(paths['matrix_satellites'], index=False)
+        self.matrix_dc_frame().to_csv(paths['matrix_dc'], index=False)
+        return paths
+
+    @staticmethod
+    def vehicles() -> dict[str, Vehicle]:
+        """Small and large vehicles of application.ipynb."""
+        return {
+            'small': Vehicle(id='small', type='small', capacity=115, costFixed=2, time_service=0.05, time_fixed=0.05,
+                             time_load=0.0072, time_dispatch=0.625, speed_line=40, Tmax=12, k=1.3),
+            'large': Vehicle(id='large', type='large', capacity=456, costFixed=8, time_service=0.05, time_fixed=0.05,
+                             time_load=0.0142, time_dispatch=0.75, speed_line=40, Tmax=12, k=1.3)
+        }
@@ -2,115 +2,317 @@ import json
 import pandas as pd
 import numpy as np
 from abc import ABC, abstractmethod
-from classes import Satellite, Cluster, Vehicle
+from src.classes import Satellite, Cluster, Vehicle, SatelliteArrays, ClusterArrays, DistanceMatrix, Instance, attributes
+from src.cache import InputCache, digest
+from src.instrumentation import timed, record
+
+
+PATH_SATELLITES = '../others/data/base_satellites_READY.csv'
+PATH_CLUSTERS = '../others/data/base_cluster_READY.csv'
+PATH_MATRIX_SATELLITES = '../others/Levantamiento de Información/Informacion Satelites a Hexagonos.csv'
+PATH_MATRIX_DC = '../others/Levantamiento de Información/distance_from_dc_to_clusters.csv'
+# rows per chunk of the streaming distance loaders
+CHUNKSIZE = 200_000
+# (field, column, scale) of the distance files: km and hours from meters and seconds
+FIELDS_SATELLITE = [('distance', 'distance.value', 1000), ('duration', 'duration.value', 3600),
+                    ('duration_in_traffic', 'duration_in_traffic.value', 3600)]
+FIELDS_DC = [('distance', 'distance', 1000), ('duration', 'duration', 3600),
+             ('duration_in_traffic', 'duration_in_traffic', 3600)]
+
+
+def split_by_period(column: pd.Series) -> np.ndarray:
+    """Parses a column of pipe-delimited values ("1.0|2.5|...") into a (rows x periods) float matrix."""
+    return np.ascontiguousarray(column.astype(str).str.split("|", expand=True).astype(float).to_numpy())
+
+
+def parse_json_column(column: pd.Series) -> tuple[list[str], np.ndarray]:
+    """
+    Parses a column of flat JSON objects into a (rows x keys) float matrix, NaN where a row lacks a key.
+    Each distinct string is decoded once.
+    """
+    codes, uniques = pd.factorize(column)
+    parsed = [json.loads(value) for value in uniques]
+    keys = list(dict.fromkeys(key for item in parsed for key in item.keys()))
+    values = np.array([[item.get(key, np.nan) for key in keys] for item in parsed], dtype=float)
+    return keys, np.ascontiguousarray(values.reshape(len(parsed), len(keys))[codes])
+
+
+def stream_distances(path: str, origin_column: str, destination_column: str, fields: list[tuple[str, str, float]],
+                     origin_ids: list[str], destination_ids: list[str],
+                     chunksize: int = CHUNKSIZE) -> DistanceMatrix:
+    """
+    Reads a distance CSV in chunks of chunksize rows, with only the id and value columns and explicit dtypes, and
+    writes the pairs whose origin and destination are among origin_ids and destination_ids straight into
+    preallocated (origins x destinations) arrays. Other rows are dropped while reading, so peak memory is the
+    output plus one chunk. fields lists (field, column, scale) with value = column / scale. origin_column None
+    reads a single-origin file, whose only origin is origin_ids[0].
+    """
+    origin_index, destination_index = pd.Index(origin_ids), pd.Index(destination_ids)
+    arrays = dict([(field, np.full((len(origin_ids), len(destination_ids)), np.nan)) for field, _, _ in fields])
+    id_columns = [column for column in (origin_column, destination_column) if column is not None]
+    dtype = dict([(column, str) for column in id_columns] + [(column, np.float64) for _, column, _ in fields])
+    rows = kept = 0
+    with pd.read_csv(path, usecols=list(dtype.keys()), dtype=dtype, chunksize=chunksize) as reader:
+        for chunk in reader:
+            destinations = destination_index.get_indexer(chunk[destination_column])
+            if origin_column is None:
+                origins = np.zeros(len(chunk), dtype=np.intp)
+            else:
+                origins = origin_index.get_indexer(chunk[origin_column])
+            keep = (origins >= 0) & (destinations >= 0)
+            for field, column, scale in fields:
+                arrays[field][origins[keep], destinations[keep]] = chunk[column].to_numpy()[keep] / scale
+            rows, kept = rows + len(chunk), kept + int(keep.sum())
+    record('loading.stream', path=path, rows=rows, kept=kept, chunksize=chunksize)
+    return DistanceMatrix(origin_ids=list(origin_ids), destination_ids=list(destination_ids), **arrays)
 
 
 class LoadingData:
     @staticmethod
-    def load_satellites(DEBUG: bool = False) -> tuple[dict[str, Satellite], pd.DataFrame]:
-        satellites = {}
-        df = pd.read_csv('../others/data/base_satellites_READY.csv')
-        for i in range(len(df)):
-            id_s = str(df.nombre[i])
-            cost_operation = list(np.float_(list(str(df.loc[i, 'costOperation']).split("|"))))
-            cost_sourcing = df.loc[i, 'costSourcing']
-            capacity = json.loads(df.loc[i, 'capacity'])
-            new_satellite = Satellite(id_s=id_s
-                                      , lon=df.longitud[i]
-                                      , lat=df.latitud[i]
-                                      , distanceFromDC=df.loc[i, 'distance.value'] / 1000
-                                      , durationFromDC=df.loc[i, 'duration.value'] / 3600
-                                      , durationInTrafficFromDC=df.loc[i, 'duration_in_traffic.value'] / 3600
-                                      , costFixed=json.loads(df.loc[i, 'costFixed'])
-                                      , costOperation=cost_operation
-                                      , costSourcing=cost_sourcing
-                                      , capacity=capacity
-                                      )
-            satellites[id_s] = new_satellite
-        if DEBUG:
-            print("-" * 50)
-            print("Count of SATELLITES: ", len(satellites))
-            print("First Satellite:")
-            print(json.dumps(list(satellites.values())[0].__dict__, indent=2, default=str))
+    @timed('loading.satellites')
+    def load_satellite_arrays(path: str = PATH_SATELLITES) -> tuple[SatelliteArrays, pd.DataFrame]:
+        df = pd.read_csv(path)
+        capacity_ids, capacity = parse_json_column(df['capacity'])
+        cost_fixed_ids, cost_fixed = parse_json_column(df['costFixed'])
+        cost_fixed = cost_fixed[:, [cost_fixed_ids.index(q_id) for q_id in capacity_ids]]
+        satellites = SatelliteArrays(ids=df.nombre.astype(str).tolist()
+                                     , lon=df.longitud.to_numpy()
+                                     , lat=df.latitud.to_numpy()
+                                     , distanceFromDC=df['distance.value'].to_numpy() / 1000
+                                     , durationFromDC=df['duration.value'].to_numpy() / 3600
+                                     , durationInTrafficFromDC=df['duration_in_traffic.value'].to_numpy() / 3600
+                                     , costFixed=cost_fixed
+                                     , costOperation=split_by_period(df['costOperation'])
+                                     , costSourcing=df['costSourcing'].to_numpy()
+                                     , capacity=capacity
+                                     , capacity_ids=capacity_ids
+                                     )
         return satellites, df
 
     @staticmethod
-    def load_customer_clusters(DEBUG: bool = False) -> tuple[dict[str, Cluster], pd.DataFrame]:
-        clusters = {}
-        df = pd.read_csv('../others/data/base_cluster_READY.csv')
+    @timed('loading.clusters')
+    def load_cluster_arrays(path: str = PATH_CLUSTERS) -> tuple[ClusterArrays, pd.DataFrame]:
+        df = pd.read_csv(path)
 
         # filtered only rows with data cajas > 0
         df.dropna(inplace=True)
         df.reset_index(drop=True, inplace=True)
         #
 
-        for i in range(len(df)):
-            id_k = str(df.loc[i, 'id_cluster'])
-
-            avg_drop_by_period = list(np.float_(list(str(df.loc[i, 'avgDrop']).split("|"))))
-            avg_stop_density_by_period = list((np.float_(list(str(df.loc[i, 'avgStopDensity']).split("|")))))
-            demand_by_period = list((np.float_(list(str(df.loc[i, 'demandByPeriod']).split("|")))))
-            customers_by_period = list((np.float_(list(str(df.loc[i, 'avg_customers']).split("|")))))
-            new_cluster = Cluster(id_c=id_k
-                                  , lon=df.loc[i, 'lon']
-                                  , lat=df.loc[i, 'lat']
-                                  , areaKm=df.loc[i, 'areakm2']
-                                  , customersByPeriod=customers_by_period
-                                  , demandByPeriod=demand_by_period
-                                  , avgDrop=avg_drop_by_period
-                                  , speed_intra=json.loads(df.loc[i, 'intra_stop_speed'])
-                                  , avgStopDensity=avg_stop_density_by_period
-                                  , k=1
-                                  )
-            clusters[id_k] = new_cluster
+        speed_ids, speed_intra = parse_json_column(df['intra_stop_speed'])
+        clusters = ClusterArrays(ids=df['id_cluster'].astype(str).tolist()
+                                 , lon=df['lon'].to_numpy()
+                                 , lat=df['lat'].to_numpy()
+                                 , areaKm=df['areakm2'].to_numpy()
+                                 , customersByPeriod=split_by_period(df['avg_customers'])
+                                 , demandByPeriod=split_by_period(df['demandByPeriod'])
+                                 , avgDrop=split_by_period(df['avgDrop'])
+                                 , speed_intra=dict([(key, speed_intra[:, j]) for j, key in enumerate(speed_ids)])
+                                 , avgStopDensity=split_by_period(df['avgStopDensity'])
+                                 , k=np.ones(len(df))
+                                 )
+        return clusters, df
+
+    @staticmethod
+    @timed('loading.instance')
+    def load_instance(path_satellites: str = PATH_SATELLITES, path_clusters: str = PATH_CLUSTERS,
+                      cache: InputCache = None) -> Instance:
+        def build() -> Instance:
+            satellites, _ = LoadingData.load_satellite_arrays(path_satellites)
+            clusters, _ = LoadingData.load_cluster_arrays(path_clusters)
+            return Instance(satellites=satellites, clusters=clusters)
+
+        if cache is None:
+            return build()
+        return cache.get_or_build('instance', [path_satellites, path_clusters], build, Instance.from_arrays)
+
+    @staticmethod
+    def load_satellites(DEBUG: bool = False, path: str = PATH_SATELLITES) -> tuple[dict[str, Satellite], pd.DataFrame]:
+        arrays, df = LoadingData.load_satellite_arrays(path)
+        satellites = arrays.views()
+        if DEBUG:
+            print("-" * 50)
+            print("Count of SATELLITES: ", len(satellites))
+            print("First Satellite:")
+            print(json.dumps(attributes(list(satellites.values())[0]), indent=2, default=str))
+        return satellites, df
+
+    @staticmethod
+    def load_customer_clusters(DEBUG: bool = False, path: str = PATH_CLUSTERS) -> tuple[dict[str, Cluster], pd.DataFrame]:
+        arrays, df = LoadingData.load_cluster_arrays(path)
+        clusters = arrays.views()
         if DEBUG:
             print("-" * 50)
             print("Count of clusters: ", len(clusters))
             print("First segment:")
-            print(json.dumps(list(clusters.values())[0].__dict__, indent=2, default=str))
+            print(json.dumps(attributes(list(clusters.values())[0]), indent=2, default=str))
         return clusters, df
 
     @staticmethod
-    def load_distances_duration_matrix_from_satellite() -> dict[str, dict]:
-        df = pd.read_csv('../others/Levantamiento de Información/Informacion Satelites a Hexagonos.csv')
-        size = len(df)
-        distance = dict(
-            [((df.Satelite[i], df.h3_address[i]), df.loc[i, "distance.value"] / 1000) for i in range(size)]
-        )
-        duration = dict(
-            [((df.Satelite[i], df.h3_address[i]), df.loc[i, "duration.value"] / 3600) for i in range(size)]
-        )
-        duration_in_traffic = dict(
-            [((df.Satelite[i], df.h3_address[i]), df.loc[i, "duration_in_traffic.value"] / 3600) for i in range(size)]
-        )
-        matrixes = {
-            'duration': duration,
-            'distance': distance,
-            'duration_in_traffic': duration_in_traffic
-        }
-        return matrixes
+    @timed('loading.distances_satellite')
+    def load_distance_matrix_from_satellite(path: str = PATH_MATRIX_SATELLITES, cache: InputCache = None,
+                                            satellite_ids: list[str] = None, cluster_ids: list[str] = None,
+                                            chunksize: int = CHUNKSIZE) -> DistanceMatrix:
+        """
+        Satellite to cluster matrix. Given satellite_ids and cluster_ids (e.g. of the loaded satellites and of the
+        clusters kept by load_customer_clusters), the file is streamed through stream_distances and the matrix
+        is aligned on those ids; otherwise every pair of the file is loaded.
+        """
+        if (satellite_ids is None) != (cluster_ids is None):
+            raise ValueError('satellite_ids and cluster_ids must be given together')
+
+        def build() -> DistanceMatrix:
+            if satellite_ids is not None:
+                return stream_distances(path, 'Satelite', 'h3_address', FIELDS_SATELLITE, satellite_ids, cluster_ids,
+                                        chunksize)
+            df = pd.read_csv(path, usecols=['Satelite', 'h3_address', 'distance.value', 'duration.value',
+                                            'duration_in_traffic.value'])
+            origins, origin_ids = pd.factorize(df.Satelite.astype(str))
+            destinations, destination_ids = pd.factorize(df.h3_address.astype(str))
+            shape = (len(origin_ids), len(destination_ids))
+            fields = {}
+            for field, column, scale in FIELDS_SATELLITE:
+                fields[field] = np.full(shape, np.nan)
+                fields[field][origins, destinations] = df[column].to_numpy() / scale
+            return DistanceMatrix(origin_ids=list(origin_ids), destination_ids=list(destination_ids), **fields)
+
+        if cache is None:
+            return build()
+        options = None if satellite_ids is None else {'ids': digest(list(satellite_ids), list(cluster_ids))}
+        return cache.get_or_build('matrix_satellites', [path], build, DistanceMatrix.from_arrays, options)
 
     @staticmethod
-    def load_distances_duration_matrix_from_dc() -> dict[str, dict]:
-        df = pd.read_csv('../others/Levantamiento de Información/distance_from_dc_to_clusters.csv')
-        size = len(df)
-        distance = dict(
-            [(df.h3_address[i], df.loc[i, "distance"] / 1000) for i in range(size)]
-        )
-        duration = dict(
-            [(df.h3_address[i], df.loc[i, "duration"] / 3600) for i in range(size)]
-        )
-        duration_in_traffic = dict(
-            [(df.h3_address[i], df.loc[i, "duration_in_traffic"] / 3600) for i in range(size)]
-        )
-        matrixes = {
-            'duration': duration,
-            'distance': distance,
-            'duration_in_traffic': duration_in_traffic
-        }
+    @timed('loading.distances_dc')
+    def load_distance_matrix_from_dc(path: str = PATH_MATRIX_DC, cache: InputCache = None,
+                                     cluster_ids: list[str] = None, chunksize: int = CHUNKSIZE) -> DistanceMatrix:
+        """Single-origin ('DC') matrix from the DC to every cluster, streamed and aligned on cluster_ids if given."""
+        def build() -> DistanceMatrix:
+            if cluster_ids is not None:
+                return stream_distances(path, None, 'h3_address', FIELDS_DC, ['DC'], cluster_ids, chunksize)
+            df = pd.read_csv(path, usecols=['h3_address', 'distance', 'duration', 'duration_in_traffic'])
+            destinations, destination_ids = pd.factorize(df.h3_address.astype(str))
+            fields = {}
+            for field, column, scale in FIELDS_DC:
+                fields[field] = np.full((1, len(destination_ids)), np.nan)
+                fields[field][0, destinations] = df[column].to_numpy() / scale
+            return DistanceMatrix(origin_ids=['DC'], destination_ids=list(destination_ids), **fields)
+
+        if cache is None:
+            return build()
+        options = None if cluster_ids is None else {'ids': digest(list(cluster_ids))}
+        return cache.get_or_build('matrix_dc', [path], build, DistanceMatrix.from_arrays, options)
+
+    @staticmethod
+    @timed('loading.distances_satellite_dicts')
+    def load_distances_duration_matrix_from_satellite(path: str = PATH_MATRIX_SATELLITES,
+                                                      satellite_ids: list[str] = None, cluster_ids: list[str] = None,
+                                                      chunksize: int = CHUNKSIZE) -> dict[str, dict]:
+        """Legacy dicts keyed by (satellite, cluster), restricted to the given ids when passed."""
+        if satellite_ids is not None or cluster_ids is not None:
+            matrix = LoadingData.load_distance_matrix_from_satellite(path, satellite_ids=satellite_ids,
+                                                                     cluster_ids=cluster_ids, chunksize=chunksize)
+            return dict([(field, matrix.as_dict(field)) for field in ('duration', 'distance', 'duration_in_traffic')])
+        return LoadingData.__streamDicts(path, ['Satelite', 'h3_address'], FIELDS_SATELLITE, chunksize)
+
+    @staticmethod
+    @timed('loading.distances_dc_dicts')
+    def load_distances_duration_matrix_from_dc(path: str = PATH_MATRIX_DC, cluster_ids: list[str] = None,
+                                               chunksize: int = CHUNKSIZE) -> dict[str, dict]:
+        """Legacy dicts keyed by cluster, restricted to cluster_ids when passed."""
+        if cluster_ids is not None:
+            matrix = LoadingData.load_distance_matrix_from_dc(path, cluster_ids=cluster_ids, chunksize=chunksize)
+            return dict([(field, dict([(id_k, value) for (_, id_k), value in matrix.as_dict(field).items()]))
+                         for field in ('duration', 'distance', 'duration_in_traffic')])
+        return LoadingData.__streamDicts(path, ['h3_address'], FIELDS_DC, chunksize)
+
+    @staticmethod
+    def __streamDicts(path: str, id_columns: list[str], fields: list[tuple[str, str, float]],
+                      chunksize: int) -> dict[str, dict]:
+        # one pass over each chunk; keys are id tuples, or the id itself for a single id column
+        matrixes = {'duration': {}, 'distance': {}, 'duration_in_traffic': {}}
+        dtype = dict([(column, str) for column in id_columns] + [(column, np.float64) for _, column, _ in fields])
+        with pd.read_csv(path, usecols=list(dtype.keys()), dtype=dtype, chunksize=chunksize) as reader:
+            for chunk in reader:
+                keys = list(zip(*[chunk[column] for column in id_columns])) if len(id_columns) > 1 else \
+                    chunk[id_columns[0]].tolist()
+                for field, column, scale in fields:
+                    matrixes[field].update(zip(keys, (chunk[column].to_numpy() / scale).tolist()))
         return matrixes
 
 
+def object_ids(objects) -> list[str]:
+    """Ids of a list of domain objects or of an array-backed container, in order."""
+    return objects.ids if isinstance(objects, (SatelliteArrays, ClusterArrays)) else [obj.id for obj in objects]
+
+
+def satellite_distances(distances_linehaul, satellite_ids: list[str], cluster_ids: list[str]) -> np.ndarray:
+    """(S, K) linehaul distances from the (satellite, cluster) dict, a DistanceMatrix or an array."""
+    if isinstance(distances_linehaul, DistanceMatrix):
+        distance = distances_linehaul.take(satellite_ids, cluster_ids)
+    elif isinstance(distances_linehaul, np.ndarray):
+        distance = distances_linehaul
+    else:
+        distance = np.array([[distances_linehaul[s, k] for k in cluster_ids] for s in satellite_ids], dtype=float)
+    return distance.reshape(len(satellite_ids), len(cluster_ids))
+
+
+def dc_distances(distances_linehaul, cluster_ids: list[str]) -> np.ndarray:
+    """(K,) linehaul distances from the cluster dict, the DC DistanceMatrix or an array."""
+    if isinstance(distances_linehaul, DistanceMatrix):
+        distance = distances_linehaul.take(distances_linehaul.origin_ids[:1], cluster_ids)[0]
+    elif isinstance(distances_linehaul, np.ndarray):
+        distance = distances_linehaul
+    else:
+        distance = np.array([distances_linehaul[k] for k in cluster_ids], dtype=float)
+    return distance.reshape(len(cluster_ids))
+
+
+def fleet_size_arrays(avg_drop: np.ndarray, avg_stop_density: np.ndarray, demand: np.ndarray,
+                      speed_intra: np.ndarray, cluster_k: np.ndarray, vehicle: Vehicle,
+                      distance: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Array version of ConfigDeterministic.avg_fleet_size. Every input is broadcast against the others, so the
+    same kernel serves (S, K, T) tensors from satellites and (K, T) tensors from the DC. As the scalar version,
+    it raises ZeroDivisionError for a zero intra-stop speed or a zero tour time in the beta denominator.
+    """
+    if np.any(np.asarray(speed_intra) == 0):
+        raise ZeroDivisionError('intra-stop speed is zero')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # effective vehicle capacity
+        effective_vehicle_capacity = np.where(avg_drop > 0, vehicle.capacity / avg_drop, 0.0)
+
+        # time services
+        time_services = vehicle.time_fixed + vehicle.time_service * avg_drop
+
+        # time intra stop
+        time_intra_stop = (vehicle.k * cluster_k) / speed_intra
+
+        # average tour time
+        avg_tour_time = effective_vehicle_capacity * (time_services + time_intra_stop)
+
+        # time preparing
+        time_preparing_dispatch = vehicle.time_dispatch + effective_vehicle_capacity * avg_drop * vehicle.time_load
+
+        # time line_haul
+        time_line_haul = 2 * (distance * vehicle.k / vehicle.speed_line)
+
+        # number of fully loaded tours
+        tour_time = avg_tour_time + time_preparing_dispatch + time_line_haul
+        if np.any(tour_time == 0):
+            raise ZeroDivisionError('tour time is zero in the number of fully loaded tours')
+        beta = vehicle.Tmax / tour_time
+
+        # average fleet size
+        denominador = beta * effective_vehicle_capacity
+        v = np.where(denominador > 0, avg_stop_density / denominador, 0.0)
+
+    shape = np.broadcast(v, demand).shape
+    return {'fleet_size': v, 'avg_tour_time': np.broadcast_to(avg_tour_time, shape),
+            'fully_loaded_tours': beta, 'effective_capacity': np.broadcast_to(effective_vehicle_capacity, shape),
+            'demand_served': np.broadcast_to(demand, shape), 'avg_drop': np.broadcast_to(avg_drop, shape),
+            'avg_stop_density': np.broadcast_to(avg_stop_density, shape)}
+
+
 class Config(ABC):
 
     @abstractmethod
@@ -176,6 +378,7 @@ class ConfigDeterministic(Config):
                 'avg_drop': cluster.avgDrop[t], 'avg_stop_density': cluster.avgStopDensity[t]}
 
     # overwrite
+    @timed('fleet_size.satellites')
     def calculate_avg_fleet_size_from_satellites(self, satellites: list[Satellite]
                                                  , clusters: list[Cluster]
                                                  , vehicle: Vehicle
@@ -189,6 +392,7 @@ class ConfigDeterministic(Config):
 
         return fleet_size
 
+    @timed('fleet_size.dc')
     def calculate_avg_fleet_size_from_dc(self, clusters: list[Cluster]
                                          , vehicle: Vehicle
                                          , periods: int
@@ -201,14 +405,235 @@ class ConfigDeterministic(Config):
 
         return fleet_size
 
+    @staticmethod
+    def clusters_to_arrays(clusters: list[Cluster], vehicle: Vehicle, periods: int) -> dict[str, np.ndarray]:
+        if isinstance(clusters, ClusterArrays):
+            return {
+                'avg_drop': clusters.avgDrop[:, :periods],
+                'avg_stop_density': clusters.avgStopDensity[:, :periods],
+                'demand': clusters.demandByPeriod[:, :periods],
+                'speed_intra': clusters.speed_intra[vehicle.type],
+                'k': clusters.k
+            }
+        clusters = list(clusters)
+        return {
+            'avg_drop': np.array([k.avgDrop[:periods] for k in clusters], dtype=float).reshape(-1, periods),
+            'avg_stop_density': np.array([k.avgStopDensity[:periods] for k in clusters],
+                                         dtype=float).reshape(-1, periods),
+            'demand': np.array([k.demandByPeriod[:periods] for k in clusters], dtype=float).reshape(-1, periods),
+            'speed_intra': np.array([k.speed_intra[vehicle.type] for k in clusters], dtype=float),
+            'k': np.array([k.k for k in clusters], dtype=float)
+        }
+
+    @timed('fleet_size.satellites')
+    def calculate_fleet_size_tensor_from_satellites(self, satellites: list[Satellite]
+                                                    , clusters: list[Cluster]
+                                                    , vehicle: Vehicle
+                                                    , periods: int
+                                                    , distances_linehaul
+                                                    , sparse: bool = False
+                                                    , **params) -> dict[str, np.ndarray]:
+        """
+        Batched version of calculate_avg_fleet_size_from_satellites. Returns one (S, K, T) array per metric of
+        avg_fleet_size. distances_linehaul is the (satellite, cluster) dict, a DistanceMatrix or an (S, K) array.
+        With sparse=True only the entries with a positive fleet size are returned, as an (n, 3) 'index' array of
+        (satellite, cluster, period) positions plus one 1-D array per metric.
+        """
+        data = self.clusters_to_arrays(clusters, vehicle, periods)
+        distance = satellite_distances(distances_linehaul, object_ids(satellites), object_ids(clusters))
+
+        tensors = fleet_size_arrays(avg_drop=data['avg_drop'][None, :, :]
+                                    , avg_stop_density=data['avg_stop_density'][None, :, :]
+                                    , demand=data['demand'][None, :, :]
+                                    , speed_intra=data['speed_intra'][None, :, None]
+                                    , cluster_k=data['k'][None, :, None]
+                                    , vehicle=vehicle
+                                    , distance=distance[:, :, None])
+        return self.__sparsify(tensors) if sparse else tensors
+
+    @timed('fleet_size.dc')
+    def calculate_fleet_size_tensor_from_dc(self, clusters: list[Cluster]
+                                            , vehicle: Vehicle
+                                            , periods: int
+                                            , distances_linehaul
+                                            , sparse: bool = False
+                                            , **params) -> dict[str, np.ndarray]:
+        """
+        Batched version of calculate_avg_fleet_size_from_dc. Returns one (K, T) array per metric of avg_fleet_size.
+        distances_linehaul is the cluster dict, the DC DistanceMatrix or a (K,) array.
+        """
+        data = self.clusters_to_arrays(clusters, vehicle, periods)
+        distance = dc_distances(distances_linehaul, object_ids(clusters))
+
+        tensors = fleet_size_arrays(avg_drop=data['avg_drop']
+                                    , avg_stop_density=data['avg_stop_density']
+                                    , demand=data['demand']
+                                    , speed_intra=data['speed_intra'][:, None]
+                                    , cluster_k=data['k'][:, None]
+                                    , vehicle=vehicle
+                                    , distance=distance[:, None])
+        return self.__sparsify(tensors) if sparse else tensors
 
-class ConfigStochastic(Config):
+    @staticmethod
+    def __sparsify(tensors: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+        index = np.nonzero(tensors['fleet_size'])
+        sparse = dict([(key, value[index]) for key, value in tensors.items()])
+        sparse['index'] = np.stack(index, axis=1)
+        return sparse
 
-    def __init__(self) -> None:
+    @staticmethod
+    def tensor_to_dict(tensors: dict[str, np.ndarray], *ids: list[str]) -> dict[tuple, dict[str, float]]:
+        """
+        Converts dense tensors back to the dict layout of calculate_avg_fleet_size_*, keyed by the ids of each
+        leading axis followed by the period, e.g. tensor_to_dict(tensors, satellite_ids, cluster_ids).
+        """
+        keys = list(tensors.keys())
+        values = np.stack([np.asarray(tensors[key], dtype=float) for key in keys], axis=-1)
+        result = {}
+        for index in np.ndindex(values.shape[:-1]):
+            key = tuple(ids_axis[i] for ids_axis, i in zip(ids, index)) + tuple(index[len(ids):])
+            result[key] = dict(zip(keys, values[index].tolist()))
+        return result
+
+
+class ConfigStochastic(Config):
+    """
+    Monte Carlo version of ConfigDeterministic. Per-period demand, drop size and stop density of every cluster
+    are sampled around the Cluster values (their mean) with the given coefficient of variation, and the fleet
+    size formulas are evaluated on whole chunks of scenarios at once. Statistics are accumulated chunk by chunk:
+    mean and standard deviation exactly, quantiles from a uniform reservoir of `reservoir` scenarios, which is
+    also returned as the scenario tensor. Memory therefore depends on chunk_size and reservoir, not on
+    n_scenarios. The same seed draws the same cluster scenarios in every calculate_* call, so the satellite and
+    DC estimates share their scenarios.
+    """
+    FIELDS = {'demandByPeriod': 'demand', 'avgDrop': 'avg_drop', 'avgStopDensity': 'avg_stop_density'}
+
+    def __init__(self,
+                 n_scenarios: int = 1000,
+                 seed: int = None,
+                 distribution: str = 'lognormal',
+                 cv: dict[str, float] = None,
+                 quantiles: tuple[float] = (0.05, 0.5, 0.95),
+                 chunk_size: int = 256,
+                 reservoir: int = 100) -> None:
         super().__init__()
+        self.n_scenarios = n_scenarios
+        self.seed = seed
+        self.distribution = distribution
+        self.cv = dict({'demandByPeriod': 0.2, 'avgDrop': 0.1, 'avgStopDensity': 0.2}, **(cv or {}))
+        self.quantiles = tuple(quantiles)
+        self.chunk_size = chunk_size
+        self.reservoir = reservoir
+
+    def sample(self, rng: np.random.Generator, mean: np.ndarray, cv: float, n: int) -> np.ndarray:
+        """n samples with the given mean and coefficient of variation; entries with mean <= 0 stay at 0."""
+        mean = np.asarray(mean, dtype=float)
+        positive = np.where(mean > 0, mean, 0.0)
+        if cv <= 0:
+            return np.broadcast_to(positive, (n,) + mean.shape).copy()
+        if self.distribution == 'lognormal':
+            sigma = np.sqrt(np.log1p(cv ** 2))
+            with np.errstate(divide='ignore'):
+                mu = np.log(positive) - sigma ** 2 / 2
+            samples = np.exp(mu + sigma * rng.standard_normal((n,) + mean.shape))
+        elif self.distribution == 'gamma':
+            samples = rng.gamma(1 / cv ** 2, positive * cv ** 2, size=(n,) + mean.shape)
+        elif self.distribution == 'normal':
+            samples = np.maximum(positive * (1 + cv * rng.standard_normal((n,) + mean.shape)), 0.0)
+        else:
+            raise ValueError(f'unknown distribution: {self.distribution}')
+        return np.where(positive > 0, samples, 0.0)
+
+    def __simulate(self, data: dict[str, np.ndarray], vehicle: Vehicle, distance: np.ndarray,
+                   from_satellites: bool) -> dict[str, np.ndarray]:
+        rng = np.random.default_rng(self.seed)
+        rng_reservoir = np.random.default_rng(None if self.seed is None else [self.seed, 1])
+        # axis of the satellites between the scenario and the cluster axes
+        expand = (lambda array: array[:, None, :, :]) if from_satellites else (lambda array: array)
+        speed_intra = data['speed_intra'][None, None, :, None] if from_satellites else data['speed_intra'][None, :, None]
+        cluster_k = data['k'][None, None, :, None] if from_satellites else data['k'][None, :, None]
+        distance = distance[None, :, :, None] if from_satellites else distance[None, :, None]
+
+        count, mean, m2, reservoir, reservoir_demand = 0, None, None, None, None
+        size_reservoir = min(self.reservoir, self.n_scenarios)
+        while count < self.n_scenarios:
+            n = min(self.chunk_size, self.n_scenarios - count)
+            samples = dict([(key, self.sample(rng, data[key], self.cv[field], n))
+                            for field, key in self.FIELDS.items()])
+            fleet = fleet_size_arrays(avg_drop=expand(samples['avg_drop'])
+                                      , avg_stop_density=expand(samples['avg_stop_density'])
+                                      , demand=expand(samples['demand'])
+                                      , speed_intra=speed_intra
+                                      , cluster_k=cluster_k
+                                      , vehicle=vehicle
+                                      , distance=distance)['fleet_size']
+
+            # mean and variance, merged chunk by chunk (Chan et al.)
+            chunk_mean = fleet.mean(axis=0)
+            chunk_m2 = ((fleet - chunk_mean) ** 2).sum(axis=0)
+            if mean is None:
+                mean, m2 = chunk_mean, chunk_m2
+                reservoir = np.empty((size_reservoir,) + fleet.shape[1:])
+                reservoir_demand = np.empty((size_reservoir,) + samples['demand'].shape[1:])
+            else:
+                delta = chunk_mean - mean
+                mean = mean + delta * n / (count + n)
+                m2 = m2 + chunk_m2 + delta ** 2 * count * n / (count + n)
+
+            # reservoir sampling (algorithm R) of whole scenarios
+            index = np.arange(count, count + n)
+            slot = np.where(index < size_reservoir, index, rng_reservoir.integers(0, index + 1))
+            keep = slot < size_reservoir
+            reservoir[slot[keep]] = fleet[keep]
+            reservoir_demand[slot[keep]] = samples['demand'][keep]
+            count += n
+
+        return {'fleet_size': mean,
+                'fleet_size_std': np.sqrt(m2 / max(count - 1, 1)),
+                'fleet_size_quantiles': np.quantile(reservoir, self.quantiles, axis=0),
+                'demand_served': data['demand'] if not from_satellites else np.broadcast_to(
+                    data['demand'][None, :, :], mean.shape),
+                'scenarios': reservoir,
+                'demand_scenarios': reservoir_demand}
+
+    @timed('fleet_size.satellites')
+    def calculate_fleet_size_tensor_from_satellites(self, satellites: list[Satellite]
+                                                    , clusters: list[Cluster]
+                                                    , vehicle: Vehicle
+                                                    , periods: int
+                                                    , distances_linehaul
+                                                    , **params) -> dict[str, np.ndarray]:
+        """
+        (S, K, T) fleet-size mean and std, (Q, S, K, T) quantiles, (R, S, K, T) reservoir scenarios and the
+        matching (R, K, T) demand scenarios.
+        """
+        data = ConfigDeterministic.clusters_to_arrays(clusters, vehicle, periods)
+        distance = satellite_distances(distances_linehaul, object_ids(satellites), object_ids(clusters))
+        return self.__simulate(data, vehicle, distance, from_satellites=True)
+
+    @timed('fleet_size.dc')
+    def calculate_fleet_size_tensor_from_dc(self, clusters: list[Cluster]
+                                            , vehicle: Vehicle
+                                            , periods: int
+                                            , distances_linehaul
+                                            , **params) -> dict[str, np.ndarray]:
+        """(K, T) fleet-size mean and std, (Q, K, T) quantiles and (R, K, T) reservoir scenarios."""
+        data = ConfigDeterministic.clusters_to_arrays(clusters, vehicle, periods)
+        distance = dc_distances(distances_linehaul, object_ids(clusters))
+        return self.__simulate(data, vehicle, distance, from_satellites=False)
+
+    def __to_dict(self, tensors: dict[str, np.ndarray], *ids: list[str]) -> dict[tuple, dict[str, float]]:
+        summary = {'fleet_size': tensors['fleet_size'], 'fleet_size_std': tensors['fleet_size_std'],
+                   'demand_served': tensors['demand_served']}
+        for q, values in zip(self.quantiles, tensors['fleet_size_quantiles']):
+            summary[f'fleet_size_q{q:g}'] = values
+        return ConfigDeterministic.tensor_to_dict(summary, *ids)
 
-    def avg_fleet_size(self, cluster: Cluster, vehicle: Vehicle, t: int, distance: float, **params) -> float:
-        pass
+    def avg_fleet_size(self, cluster: Cluster, vehicle: Vehicle, t: int, distance: float, **params) -> dict[str, float]:
+        data = ConfigDeterministic.clusters_to_arrays([cluster], vehicle, t + 1)
+        data = dict([(key, value[:, t:t + 1] if value.ndim == 2 else value) for key, value in data.items()])
+        tensors = self.__simulate(data, vehicle, np.array([distance], dtype=float), from_satellites=False)
+        return self.__to_dict(tensors, [cluster.id])[(cluster.id, 0)]
 
     def calculate_avg_fleet_size_from_satellites(self, satellites: list[Satellite]
                                                  , clusters: list[Cluster]
@@ -216,11 +641,14 @@ class ConfigStochastic(Config):
                                                  , periods: int
                                                  , distances_linehaul: dict[(str, str)]
                                                  , **params) -> dict[(str, str, int), float]:
-        pass
+        tensors = self.calculate_fleet_size_tensor_from_satellites(satellites, clusters, vehicle, periods,
+                                                                   distances_linehaul)
+        return self.__to_dict(tensors, object_ids(satellites), object_ids(clusters))
 
     def calculate_avg_fleet_size_from_dc(self, clusters: list[Cluster]
                                          , vehicle: Vehicle
                                          , periods: int
                                          , distances_linehaul: dict[str]
                                          , **params) -> dict[(str, int), float]:
-        pass
+        tensors = self.calculate_fleet_size_tensor_from_dc(clusters, vehicle, periods, distances_linehaul)
+        return self.__to_dict(tensors, object_ids(clusters))
@@ -0,0 +1,61 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src import utils  # noqa: E402
+from src.costs import CostDeterministic  # noqa: E402
+from src.models import ModelDeterministic  # noqa: E402
+from src.synthetic import SyntheticInstance  # noqa: E402
+
+PERIODS = 3
+
+
+@pytest.fixture(scope='module')
+def instance(tmp_path_factory):
+    synthetic = SyntheticInstance(4, 12, PERIODS, seed=1)
+    paths = synthetic.write(str(tmp_path_factory.mktemp('synthetic')))
+    satellites, _ = utils.LoadingData.load_satellite_arrays(path=paths['satellites'])
+    clusters, _ = utils.LoadingData.load_cluster_arrays(path=paths['clusters'])
+    matrix_satellite = utils.LoadingData.load_distance_matrix_from_satellite(paths['matrix_satellites'])
+    matrix_dc = utils.LoadingData.load_distance_matrix_from_dc(paths['matrix_dc'])
+    vehicles = synthetic.vehicles()
+    config = utils.ConfigDeterministic()
+    vehicles_required = {
+        'small': config.calculate_fleet_size_tensor_from_satellites(satellites, clusters, vehicles['small'], PERIODS,
+                                                                   matrix_satellite),
+        'large': config.calculate_fleet_size_tensor_from_dc(clusters, vehicles['large'], PERIODS, matrix_dc)}
+    cost = CostDeterministic(min_items_satellite=40, min_items_dc=30)
+    costs = cost.build(satellites, clusters, vehicles_required, PERIODS, matrix_satellite, matrix_dc,
+                       vehicles=vehicles)
+    return {'satellites': satellites, 'clusters': clusters, 'vehicles_required': vehicles_required, 'costs': costs,
+            'costs_dict': cost.as_dict(costs, satellites.ids, clusters.ids),
+            'vehicles_required_dict': {
+                'small': config.tensor_to_dict(vehicles_required['small'], satellites.ids, clusters.ids),
+                'large': config.tensor_to_dict(vehicles_required['large'], clusters.ids)}}
+
+
+def solve(instance, builder, formulation, lean):
+    model = ModelDeterministic(periods=PERIODS, formulation=formulation, lean=lean)
+    model.setParams({'OutputFlag': 0})
+    if builder == 'build':
+        model.build(list(instance['satellites']), list(instance['clusters']), instance['vehicles_required_dict'],
+                    instance['costs_dict'])
+    else:
+        model.build_matrix(instance['satellites'], instance['clusters'], instance['vehicles_required'],
+                           instance['costs'])
+    model.optimizeModel()
+    return model.model
+
+
+@pytest.mark.parametrize('lean', [False, True])
+@pytest.mark.parametrize('formulation', ModelDeterministic.FORMULATIONS)
+def test_build_matrix_matches_build(instance, formulation, lean):
+    legacy = solve(instance, 'build', formulation, lean)
+    matrix = solve(instance, 'build_matrix', formulation, lean)
+    assert matrix.Status == legacy.Status == 2
+    assert matrix.ObjVal == pytest.approx(legacy.ObjVal, rel=1e-9)
+    assert (matrix.NumVars, matrix.NumConstrs, matrix.NumNZs) == (legacy.NumVars, legacy.NumConstrs, legacy.NumNZs)
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.classes import DistanceMatrix  # noqa: E402
+
+
+def test_missing_pairs_raise_like_dict():
+    distance = np.array([[1.0, np.nan], [2.0, 3.0]])
+    matrix = DistanceMatrix(['s1', 's2'], ['a', 'b'], distance, np.zeros((2, 2)), np.zeros((2, 2)))
+    assert matrix['s2', 'b'] == 3.0
+    for key in [('s1', 'b'), ('s3', 'a'), ('s1', 'c')]:
+        with pytest.raises(KeyError):
+            matrix[key]
+    with pytest.raises(KeyError):
+        matrix.take(['s1'], ['a', 'b'])
+    assert np.isnan(matrix.take(['s1'], ['a', 'b'], strict=False)[0, 1])
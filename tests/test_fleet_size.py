@@ -0,0 +1,45 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src import utils  # noqa: E402
+from src.classes import Cluster, Vehicle  # noqa: E402
+
+PERIODS = 2
+
+
+def make_cluster(id_c: str, speed: float) -> Cluster:
+    return Cluster(id_c, -70.6, -33.4, 1.5, [10.0, 0.0], [40.0, 0.0], [4.0, 0.0], {'small': speed}, [12.0, 0.0])
+
+
+@pytest.fixture
+def vehicle():
+    return Vehicle('small', 'small', 115, 2, 0.05, 0.05, 0.625, 0.0072, 40, 12, 1.3)
+
+
+def test_tensor_matches_scalar(vehicle):
+    config = utils.ConfigDeterministic()
+    clusters = [make_cluster('c1', 20.0), make_cluster('c2', 35.0)]
+    distances = {'c1': 5.0, 'c2': 12.0}
+    tensors = config.calculate_fleet_size_tensor_from_dc(clusters, vehicle, PERIODS, distances)
+    for i, cluster in enumerate(clusters):
+        for t in range(PERIODS):
+            expected = config.avg_fleet_size(cluster, vehicle, t, distances[cluster.id])
+            assert tensors['fleet_size'][i, t] == pytest.approx(expected['fleet_size'])
+            assert tensors['fully_loaded_tours'][i, t] == pytest.approx(expected['fully_loaded_tours'])
+
+
+def test_zero_intra_speed_raises_like_scalar(vehicle):
+    config = utils.ConfigDeterministic()
+    cluster = make_cluster('c1', 0.0)
+    with pytest.raises(ZeroDivisionError):
+        config.avg_fleet_size(cluster, vehicle, 0, 5.0)
+    with pytest.raises(ZeroDivisionError):
+        config.calculate_fleet_size_tensor_from_dc([cluster], vehicle, PERIODS, {'c1': 5.0})
+    assert not np.isinf(config.calculate_fleet_size_tensor_from_dc(
+        [make_cluster('c1', 20.0)], vehicle, PERIODS, {'c1': 5.0})['fleet_size']).any()
@@ -0,0 +1,27 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.sweep import SweepRunner  # noqa: E402
+
+
+def crashing_task(shared, scenario, env):
+    if scenario.get('crash'):
+        # kills the worker, as a segfault in the solver would
+        os._exit(1)
+    return {'value': scenario['value']}
+
+
+def test_crash_does_not_consume_queued_scenarios(tmp_path):
+    output = str(tmp_path / 'sweep.jsonl')
+    scenarios = [{'value': 0}, {'value': 1, 'crash': True}, {'value': 2}, {'value': 3}, {'value': 4}]
+    runner = SweepRunner(task=crashing_task, workers=1, threads=1, output=output, max_attempts=2)
+    records = runner.run(scenarios)
+    status = dict([(record['id'], record['status']) for record in records])
+    assert status == {0: 'ok', 1: 'crashed', 2: 'ok', 3: 'ok', 4: 'ok'}
+    assert [record['result']['value'] for record in sorted(records, key=lambda r: r['id'])
+            if record['status'] == 'ok'] == [0, 2, 3, 4]
+    assert runner.finished() == {0, 1, 2, 3, 4}
+    assert runner.run(scenarios) == []